@@ -0,0 +1,199 @@
+"""
+请求体压缩基准测试
+
+启动限制上行带宽的本地模拟服务，分别以不压缩 / auto / gzip / zstd 发送长提示词 LLM 请求、
+大批量 Embedding 请求和图生图 base64 图片请求，对比请求体字节数、实际发送字节数和端到端耗时。
+提示词和 Embedding 文本取自仓库中的源码和文档，图片为 Pillow 生成的 JPEG
+
+用法:
+    python benchmarks/compression.py --upload-mbps 20 --prompt-kb 512 --requests 5
+"""
+
+import argparse
+import glob
+import io
+import os
+import statistics
+import sys
+import time
+import uuid
+from typing import Callable
+
+import dify_plugin  # noqa: F401  # 与插件运行时一致，先完成 gevent patch
+from mock_server import build_parser, serve
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config  # noqa: E402
+from dify_plugin.entities.model.message import SystemPromptMessage, UserPromptMessage  # noqa: E402
+from models.embedding.embedding import AipingTextEmbeddingModel  # noqa: E402
+from models.llm.llm import AipingLargeLanguageModel  # noqa: E402
+from utils import transport  # noqa: E402
+from utils.image import build_image_json_body  # noqa: E402
+
+from harness import Harness  # noqa: E402
+
+
+def corpus(size: int) -> str:
+    """从仓库源码和文档中截取指定长度的文本"""
+    parts = []
+    total = 0
+    for path in sorted(glob.glob(os.path.join(ROOT, "**", "*.py"), recursive=True)) + [
+        os.path.join(ROOT, "README.md")
+    ]:
+        if not os.path.isfile(path):
+            continue
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            text = f.read()
+        parts.append(text)
+        total += len(text)
+        if total >= size:
+            break
+    text = "\n".join(parts)
+    while len(text) < size:
+        text += text
+    return text[:size]
+
+
+def sample_jpeg(side: int) -> bytes:
+    """生成带渐变和噪声的 JPEG，压缩特性接近照片"""
+    from PIL import Image, ImageFilter
+
+    noise = Image.effect_noise((side, side), 48).convert("RGB")
+    gradient = Image.linear_gradient("L").resize((side, side)).convert("RGB")
+    image = Image.blend(gradient, noise, 0.35).filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+class Scenarios:
+    def __init__(self, base_url: str, args: argparse.Namespace):
+        self.base_url = base_url
+        self.args = args
+        harness = Harness(base_url, argparse.Namespace(**vars(args), embedding_batch=1, rerank_docs=1))
+        self.llm: AipingLargeLanguageModel = harness.llm
+        self.embedding: AipingTextEmbeddingModel = harness.embedding
+        self.prompt = corpus(args.prompt_kb * 1024)
+        self.texts = [
+            corpus(args.embedding_chars * (i + 2))[args.embedding_chars * (i + 1):]
+            for i in range(args.embedding_inputs)
+        ]
+        self.image = sample_jpeg(args.image_side)
+
+    def credentials(self) -> dict:
+        return {"api_key": "bench", "endpoint_url": self.base_url}
+
+    def llm_long_prompt(self) -> None:
+        self.llm._invoke(
+            model=self.args.llm_model,
+            credentials=self.credentials(),
+            prompt_messages=[
+                SystemPromptMessage(content="Answer questions about the code below."),
+                UserPromptMessage(content=self.prompt),
+            ],
+            model_parameters={},
+            tools=None,
+            stop=None,
+            stream=False,
+            user=None,
+        )
+
+    def embedding_batch(self) -> None:
+        self.embedding._request_embeddings(
+            self.args.embedding_model, self.credentials(), self.texts, None
+        )
+
+    def image_upload(self) -> None:
+        placeholder = f"__image_{uuid.uuid4().hex}__"
+        body = build_image_json_body(
+            {"model": self.args.edit_model, "input": {"prompt": "edit", "image": placeholder}},
+            placeholder,
+            "image/jpeg",
+            self.image,
+        )
+        transport.request(
+            "POST",
+            self.base_url + "/images/generations",
+            headers={"Authorization": "Bearer bench", "Content-Type": "application/json"},
+            data=body,
+            timeout=60,
+        ).raise_for_status()
+
+
+SCENARIOS = {
+    "llm_long_prompt": "/chat/completions",
+    "embedding_batch": "/embeddings",
+    "image_upload": "/images/generations",
+}
+
+
+def measure(call: Callable[[], None], requests: int, received: dict, path: str) -> dict:
+    """顺序执行 requests 次调用，返回端到端耗时和平均每次实际发送的字节数"""
+    before = received[path]
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        "wire_bytes": (received[path] - before) / requests,
+        "p50_ms": statistics.median(latencies),
+        "mean_ms": statistics.mean(latencies),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0], parents=[build_parser()]
+    )
+    parser.set_defaults(latency=0.05, upload_mbps=20.0, request_encodings="gzip,zstd")
+    parser.add_argument("--requests", type=int, default=5, help="每个场景每种模式的请求数")
+    parser.add_argument("--prompt-kb", type=int, default=512, help="LLM 提示词大小（KB）")
+    parser.add_argument("--embedding-inputs", type=int, default=64)
+    parser.add_argument("--embedding-chars", type=int, default=2048)
+    parser.add_argument("--image-side", type=int, default=1536, help="图生图输入图片边长（像素）")
+    parser.add_argument("--llm-model", default="Qwen3-8B")
+    parser.add_argument("--embedding-model", default="Qwen3-Embedding-0.6B")
+    parser.add_argument("--edit-model", default="Qwen-Image-Edit")
+    args = parser.parse_args()
+
+    try:
+        import zstandard  # noqa: F401
+
+        modes = ["off", "auto", "gzip", "zstd"]
+    except ImportError:
+        # 未安装 zstandard 时模拟服务也无法解压 zstd，只声明 gzip
+        modes = ["off", "auto", "gzip"]
+        args.request_encodings = "gzip"
+
+    server = serve(args)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    received = server.RequestHandlerClass.received_bytes
+    scenarios = Scenarios(base_url, args)
+    print(
+        f"upload={args.upload_mbps}Mbit/s latency={args.latency}s requests={args.requests} "
+        f"server accepts {args.request_encodings}"
+    )
+    print(f"{'scenario':<18}{'mode':<6}{'body KB':>10}{'wire KB':>10}{'ratio':>8}{'p50 ms':>10}{'mean ms':>10}")
+    for name, path in SCENARIOS.items():
+        call = getattr(scenarios, name)
+        # 预热一次，让 auto 模式从响应中学到服务端支持的编码
+        config.HTTP_REQUEST_COMPRESSION = "off"
+        call()
+        body_bytes = received[path]
+        call()
+        body_bytes = received[path] - body_bytes
+        for mode in modes:
+            config.HTTP_REQUEST_COMPRESSION = mode
+            r = measure(call, args.requests, received, path)
+            print(
+                f"{name:<18}{mode:<6}{body_bytes / 1024:>10.0f}{r['wire_bytes'] / 1024:>10.0f}"
+                f"{r['wire_bytes'] / body_bytes:>8.2f}{r['p50_ms']:>10.0f}{r['mean_ms']:>10.0f}"
+            )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
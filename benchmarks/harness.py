@@ -0,0 +1,321 @@
+"""
+插件基准测试
+
+通过插件自身的 LLM、Embedding、Rerank 模型类和文生图、图生图工具
+对模拟服务（或 --base-url 指定的服务）发起并发调用，
+统计每个场景的 p50/p95/p99 延迟、吞吐和进程内存
+
+用法:
+    python benchmarks/harness.py --requests 200 --concurrency 16
+    python benchmarks/harness.py --scenarios llm_stream,embedding --error-rate 0.05
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+from mock_server import build_parser, serve
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import dify_plugin  # noqa: E402,F401  # 先完成 SDK 的 gevent patch
+from dify_plugin.entities.model.message import (  # noqa: E402
+    PromptMessageTool,
+    SystemPromptMessage,
+    UserPromptMessage,
+)
+from dify_plugin.entities.tool import ToolRuntime  # noqa: E402
+from dify_plugin.file.entities import FileType  # noqa: E402
+from dify_plugin.file.file import File  # noqa: E402
+
+from models.embedding.embedding import AipingTextEmbeddingModel  # noqa: E402
+from models.llm.llm import AipingLargeLanguageModel  # noqa: E402
+from models.reranker.reranker import AipingRerankModel  # noqa: E402
+from tools.image2image import Image2ImageTool  # noqa: E402
+from tools.text2image import Text2ImageTool  # noqa: E402
+
+SCENARIOS = (
+    "llm",
+    "llm_stream",
+    "llm_thinking",
+    "llm_tools",
+    "embedding",
+    "rerank",
+    "text2image",
+    "image2image",
+)
+
+_WEATHER_TOOL = PromptMessageTool(
+    name="search",
+    description="Search the knowledge base",
+    parameters={
+        "type": "object",
+        "properties": {"query": {"type": "string"}},
+        "required": ["query"],
+    },
+)
+
+
+class Harness:
+    """按场景构造一次调用，返回 (是否成功, 首个输出的耗时)"""
+
+    def __init__(self, base_url: str, args: argparse.Namespace):
+        self.base_url = base_url
+        self.args = args
+        self.llm = AipingLargeLanguageModel(model_schemas=[])
+        self.embedding = AipingTextEmbeddingModel(model_schemas=[])
+        self.rerank = AipingRerankModel(model_schemas=[])
+        for model in (self.llm, self.embedding):
+            self._ensure_tokenizer(model)
+
+    def credentials(self) -> dict:
+        return {"api_key": "bench", "endpoint_url": self.base_url}
+
+    def call(self, scenario: str, i: int) -> tuple[bool, Optional[float]]:
+        return getattr(self, f"_{scenario}")(i)
+
+    def _llm(self, i: int, stream: bool = False, **kwargs: Any) -> tuple[bool, Optional[float]]:
+        started = time.perf_counter()
+        result = self.llm._invoke(
+            model=self.args.llm_model,
+            credentials=self.credentials(),
+            prompt_messages=[
+                SystemPromptMessage(content="You are a helpful assistant."),
+                UserPromptMessage(content=f"Request {i}: summarize the benchmark."),
+            ],
+            model_parameters=kwargs.get("model_parameters", {}),
+            tools=kwargs.get("tools"),
+            stop=None,
+            stream=stream,
+            user=None,
+        )
+        if not stream:
+            return bool(result.message.content or result.message.tool_calls), None
+
+        first = None
+        chunks = 0
+        for _ in result:
+            if first is None:
+                first = time.perf_counter() - started
+            chunks += 1
+        return chunks > 0, first
+
+    def _llm_stream(self, i: int) -> tuple[bool, Optional[float]]:
+        return self._llm(i, stream=True)
+
+    def _llm_thinking(self, i: int) -> tuple[bool, Optional[float]]:
+        return self._llm(i, stream=True, model_parameters={"enable_thinking": True})
+
+    def _llm_tools(self, i: int) -> tuple[bool, Optional[float]]:
+        return self._llm(i, stream=True, tools=[_WEATHER_TOOL])
+
+    def _embedding(self, i: int) -> tuple[bool, Optional[float]]:
+        result = self.embedding._invoke(
+            model=self.args.embedding_model,
+            credentials=self.credentials(),
+            texts=[f"document {i} chunk {j}" for j in range(self.args.embedding_batch)],
+        )
+        return len(result.embeddings) == self.args.embedding_batch, None
+
+    def _rerank(self, i: int) -> tuple[bool, Optional[float]]:
+        result = self.rerank._invoke(
+            model=self.args.rerank_model,
+            credentials=self.credentials(),
+            query=f"alpha beta {i}",
+            docs=[f"alpha gamma {j}" for j in range(self.args.rerank_docs)],
+            top_n=5,
+        )
+        return bool(result.docs), None
+
+    def _tool(self, tool_cls: type, parameters: dict) -> tuple[bool, Optional[float]]:
+        tool = tool_cls(
+            runtime=ToolRuntime(credentials=self.credentials(), user_id=None, session_id=None),
+            session=None,
+        )
+        started = time.perf_counter()
+        first_blob = None
+        ok = True
+        for message in tool._invoke(parameters):
+            text = getattr(message.message, "text", "")
+            if "出错" in text or "失败" in text:
+                ok = False
+            elif first_blob is None and message.type in (
+                message.MessageType.BLOB,
+                message.MessageType.BLOB_CHUNK,
+            ):
+                first_blob = time.perf_counter() - started
+        return ok and first_blob is not None, first_blob
+
+    def _text2image(self, i: int) -> tuple[bool, Optional[float]]:
+        return self._tool(
+            Text2ImageTool,
+            {"prompt": f"a cat {i}", "model": self.args.image_model, "extra_body": "{}"},
+        )
+
+    def _image2image(self, i: int) -> tuple[bool, Optional[float]]:
+        image = File(
+            url=f"{self.base_url}/images/input-{i}.png",
+            mime_type="image/png",
+            type=FileType.IMAGE,
+        )
+        return self._tool(
+            Image2ImageTool,
+            {"prompt": f"make it blue {i}", "image": image, "model": self.args.edit_model, "extra_body": "{}"},
+        )
+
+    @staticmethod
+    def _ensure_tokenizer(model: Any) -> None:
+        """离线环境无法加载 GPT-2 分词器时，按字符数估算 token 数"""
+        try:
+            model._get_num_tokens_by_gpt2("ping")
+        except Exception as e:
+            print(f"GPT-2 tokenizer unavailable ({type(e).__name__}), estimating tokens from text length")
+            model._get_num_tokens_by_gpt2 = lambda text: max(len(text) // 4, 1)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """最近秩百分位数"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def current_rss_mib() -> float:
+    """当前常驻内存（MiB），不支持 /proc 时返回峰值"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_scenario(
+    call: Callable[[str, int], tuple[bool, Optional[float]]],
+    scenario: str,
+    requests: int,
+    concurrency: int,
+    upstream_counts: Optional[Counter] = None,
+) -> dict:
+    """
+    并发执行一个场景并汇总结果
+
+    upstream_counts 为内置模拟服务的请求计数，用于统计该场景实际发出的上游请求数
+    """
+    upstream_before = sum(upstream_counts.values()) if upstream_counts is not None else 0
+    latencies: list[float] = []
+    first_outputs: list[float] = []
+    errors: dict[str, int] = {}
+    lock = threading.Lock()
+
+    def one(i: int) -> None:
+        started = time.perf_counter()
+        try:
+            ok, first = call(scenario, i)
+            error = None if ok else "failed"
+        except Exception as e:
+            ok, first, error = False, None, type(e).__name__
+        elapsed = time.perf_counter() - started
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+                if first is not None:
+                    first_outputs.append(first)
+            else:
+                errors[error] = errors.get(error, 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - started
+
+    return {
+        "scenario": scenario,
+        "ok": len(latencies),
+        "errors": errors,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "first_p50_ms": percentile(first_outputs, 50) * 1000,
+        "rps": len(latencies) / wall if wall else 0.0,
+        "upstream": (
+            sum(upstream_counts.values()) - upstream_before
+            if upstream_counts is not None
+            else None
+        ),
+        "rss_mib": current_rss_mib(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0], parents=[build_parser()]
+    )
+    parser.add_argument("--base-url", help="使用已有服务而不是启动模拟服务")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=100, help="每个场景的请求数")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--embedding-batch", type=int, default=8)
+    parser.add_argument("--rerank-docs", type=int, default=20)
+    parser.add_argument("--llm-model", default="Qwen3-8B")
+    parser.add_argument("--embedding-model", default="Qwen3-Embedding-0.6B")
+    parser.add_argument("--rerank-model", default="Qwen3-Reranker-0.6B")
+    parser.add_argument("--image-model", default="Qwen-Image")
+    parser.add_argument("--edit-model", default="Qwen-Image-Edit")
+    parser.add_argument("--json", help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    server = None
+    upstream_counts = None
+    base_url = args.base_url
+    if not base_url:
+        server = serve(args)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        upstream_counts = server.RequestHandlerClass.counts
+
+    harness = Harness(base_url, args)
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    print(f"target={base_url} requests={args.requests} concurrency={args.concurrency}")
+    print(
+        f"{'scenario':<14}{'ok':>6}{'err':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        f"{'first ms':>10}{'req/s':>9}{'upstream':>10}{'rss MiB':>9}"
+    )
+    results = []
+    for scenario in scenarios:
+        r = run_scenario(
+            harness.call, scenario, args.requests, args.concurrency, upstream_counts
+        )
+        results.append(r)
+        print(
+            f"{r['scenario']:<14}{r['ok']:>6}{sum(r['errors'].values()):>6}"
+            f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+            f"{r['first_p50_ms']:>10.1f}{r['rps']:>9.1f}"
+            f"{r['upstream'] if r['upstream'] is not None else '-':>10}{r['rss_mib']:>9.1f}"
+        )
+        if r["errors"]:
+            print(f"  errors: {r['errors']}")
+    print(f"peak rss: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+图像工具传输层基准测试
+
+启动本地模拟服务（mock_server.py），通过批量生图工具的线程池并发执行 N 次生成
+（提交 + 下载结果图片），输出耗时、吞吐、峰值内存和线程数
+
+用法:
+    python benchmarks/image_transport.py --concurrency 100 --latency 0.5 --image-kb 512
+"""
+
+import argparse
+import os
+import resource
+import sys
+import threading
+import time
+
+from mock_server import build_parser, serve
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import dify_plugin  # noqa: E402,F401  # 先完成 SDK 的 gevent patch
+
+import config  # noqa: E402
+from tools.batch_text2image import BatchText2ImageTool  # noqa: E402
+
+
+def run(base_url: str, concurrency: int) -> dict:
+    """执行一轮并发生成"""
+    config.IMAGE_BATCH_CONCURRENCY = concurrency
+    config.HTTP_MAX_CONNECTIONS = concurrency
+
+    payloads = [
+        {"model": "bench", "input": {"prompt": f"p{i}"}, "extra_body": {}}
+        for i in range(concurrency)
+    ]
+    headers = {"Authorization": "Bearer bench", "Content-Type": "application/json"}
+
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_threads = threading.active_count()
+    started = time.perf_counter()
+    completed = failed = 0
+    for _, result, error in BatchText2ImageTool._run_threaded(base_url, headers, payloads):
+        peak_threads = max(peak_threads, threading.active_count())
+        if error is None and result[0] and not result[1]:
+            completed += 1
+        else:
+            failed += 1
+        for _, image_file in result[0] if error is None else []:
+            image_file.close()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "completed": completed,
+        "failed": failed,
+        "seconds": round(elapsed, 3),
+        "throughput": round(completed / elapsed, 1),
+        "peak_rss_delta_mib": round(
+            (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss) / 1024, 1
+        ),
+        "peak_threads": peak_threads,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0], parents=[build_parser()]
+    )
+    parser.set_defaults(latency=0.5, image_kb=512)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    server = serve(args)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(
+        f"concurrency={args.concurrency} latency={args.latency}s image={args.image_kb}KB"
+    )
+    print(f"{'ok':>5}{'fail':>6}{'seconds':>10}{'gen/s':>8}{'rss MiB':>10}{'threads':>9}")
+    r = run(base_url, args.concurrency)
+    print(
+        f"{r['completed']:>5}{r['failed']:>6}{r['seconds']:>10}"
+        f"{r['throughput']:>8}{r['peak_rss_delta_mib']:>10}{r['peak_threads']:>9}"
+    )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+内存预算负载测试
+
+启动本地模拟服务，在独立进程中以高并发执行图生图（大尺寸输入图片的 base64 请求体 + 结果图片下载）
+和大批量 Embedding 请求，采样进程 RSS。分别以不限制内存（MEMORY_BUDGET_BYTES=0）和默认预算运行，
+峰值 RSS 超过 manifest 限制（256 MiB）即视为会被 OOM 终止
+
+用法:
+    python benchmarks/memory.py --concurrency 64 --input-mb 6 --image-kb 2048
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+from mock_server import build_parser, serve
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MANIFEST_LIMIT = 256 * 1024 * 1024
+
+
+def current_rss() -> int:
+    """当前进程 RSS（字节）"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def run_load(base_url: str, args: argparse.Namespace) -> dict:
+    """在当前进程中并发执行图生图和 Embedding，返回完成数和峰值 RSS"""
+    import dify_plugin  # noqa: F401  # 与插件运行时一致，先完成 gevent patch
+
+    sys.path.insert(0, ROOT)
+    from concurrent.futures import ThreadPoolExecutor
+
+    import config
+    from models.embedding.embedding import AipingTextEmbeddingModel
+    from tools.image2image import Image2ImageTool
+    from utils import memory
+
+    config.HTTP_MAX_CONNECTIONS = args.concurrency
+    # 随机内容的 JPEG：base64 请求体无法压缩，压缩尝试的副本也计入峰值
+    image = b"\xff\xd8\xff\xe0" + os.urandom(args.input_mb * 1024 * 1024)
+    credentials = {"api_key": "bench", "endpoint_url": base_url}
+    embedding = AipingTextEmbeddingModel(model_schemas=[])
+    embedding._get_num_tokens_by_gpt2 = lambda text: max(len(text) // 4, 1)
+    embedding._get_context_size = lambda model, credentials: 8192
+    texts = [f"document {i} " * 200 for i in range(args.embedding_inputs)]
+
+    def image_job(i: int) -> bool:
+        tool = Image2ImageTool.from_credentials(credentials)
+        messages = list(
+            tool._invoke(
+                {
+                    "model": "bench",
+                    "prompt": f"edit {i}",
+                    "image": SimpleNamespace(url=None, blob=image, mime_type="image/jpeg"),
+                }
+            )
+        )
+        return any(m.type.value in ("blob", "blob_chunk") for m in messages)
+
+    def embedding_job(i: int) -> bool:
+        result = embedding._invoke("bench-embedding", dict(credentials), texts)
+        return len(result.embeddings) == len(texts)
+
+    peak = current_rss()
+    stop = threading.Event()
+
+    def sample() -> None:
+        nonlocal peak
+        while not stop.wait(0.02):
+            peak = max(peak, current_rss())
+
+    threading.Thread(target=sample, daemon=True).start()
+    started = time.perf_counter()
+    jobs = [(image_job, i) for i in range(args.concurrency)]
+    jobs += [(embedding_job, i) for i in range(args.concurrency // 4)]
+    with ThreadPoolExecutor(len(jobs)) as executor:
+        futures = [executor.submit(job, i) for job, i in jobs]
+        completed = sum(1 for f in futures if f.exception() is None and f.result())
+    stop.set()
+    return {
+        "budget_mib": config.MEMORY_BUDGET_BYTES / 1024 / 1024,
+        "jobs": len(jobs),
+        "completed": completed,
+        "seconds": round(time.perf_counter() - started, 2),
+        "peak_rss_mib": round(peak / 1024 / 1024, 1),
+        "budget_peak_mib": round(memory.snapshot()["peak"] / 1024 / 1024, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0], parents=[build_parser()]
+    )
+    parser.set_defaults(latency=0.2, image_kb=2048, upload_mbps=400.0)
+    parser.add_argument("--concurrency", type=int, default=64, help="并发图生图任务数")
+    parser.add_argument("--input-mb", type=int, default=6, help="图生图输入图片大小（MiB）")
+    parser.add_argument("--embedding-inputs", type=int, default=64)
+    parser.add_argument("--budgets", default="0,default", help="逗号分隔的预算（字节），default 为插件默认值")
+    parser.add_argument("--run-load", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_load:
+        print(json.dumps(run_load(args.base_url, args)))
+        return
+
+    server = serve(args)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(
+        f"concurrency={args.concurrency} input={args.input_mb}MiB result={args.image_kb}KB "
+        f"limit={MANIFEST_LIMIT // 1024 // 1024}MiB"
+    )
+    print(f"{'budget MiB':>10}{'jobs':>6}{'ok':>6}{'seconds':>9}{'peak RSS':>10}{'reserved':>10}  result")
+    failed = False
+    for budget in args.budgets.split(","):
+        env = dict(os.environ)
+        if budget != "default":
+            env["MEMORY_BUDGET_BYTES"] = budget
+        # 每种预算在独立进程中运行，互不影响峰值 RSS
+        output = subprocess.run(
+            [sys.executable, __file__, "--run-load", "1", "--base-url", base_url,
+             "--concurrency", str(args.concurrency), "--input-mb", str(args.input_mb),
+             "--embedding-inputs", str(args.embedding_inputs)],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        oom = r["peak_rss_mib"] * 1024 * 1024 > MANIFEST_LIMIT
+        failed = failed or (oom and budget == "default")
+        print(
+            f"{r['budget_mib']:>10.0f}{r['jobs']:>6}{r['completed']:>6}{r['seconds']:>9}"
+            f"{r['peak_rss_mib']:>10}{r['budget_peak_mib']:>10}  {'OOM' if oom else 'ok'}"
+        )
+    server.shutdown()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+"""
+本地 AIPing 模拟服务
+
+实现 /models、/chat/completions（流式与非流式，含工具调用和思考内容）、
+/embeddings、/rerank、/images/generations 及结果图片下载，
+可配置首字节延迟（可按模型设置）、流式吞吐、上行带宽、请求体压缩、错误注入和 429 注入，用于基准测试
+
+用法:
+    python benchmarks/mock_server.py --port 8900 --latency 0.2 --tokens-per-second 200
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+
+# 模拟的模型目录，覆盖插件支持的所有模型类型
+CATALOG = [
+    ("Qwen3-8B", "llm"),
+    ("Qwen2.5-VL-7B-Instruct", ["llm", "vlm"]),
+    ("Qwen3-Embedding-0.6B", "embedding"),
+    ("Qwen3-Reranker-0.6B", "reranker"),
+    ("Qwen-Image", "text2image"),
+    ("Qwen-Image-Edit", "image2image"),
+]
+
+_WORDS = ("alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """模拟服务的命令行参数，基准测试脚本复用同一组参数"""
+    parser = argparse.ArgumentParser(add_help=False)
+    group = parser.add_argument_group("mock server")
+    group.add_argument("--latency", type=float, default=0.05, help="首字节延迟（秒）")
+    group.add_argument("--embedding-latency", type=float, default=None, help="Embedding 耗时（秒），默认同 --latency")
+    group.add_argument("--image-latency", type=float, default=None, help="图像生成耗时（秒），默认同 --latency")
+    group.add_argument("--tokens-per-second", type=float, default=500.0, help="流式输出速度")
+    group.add_argument("--completion-tokens", type=int, default=64, help="每次回答的 token 数")
+    group.add_argument("--reasoning-tokens", type=int, default=32, help="开启思考时的思考 token 数")
+    group.add_argument("--embedding-dim", type=int, default=1024)
+    group.add_argument("--image-kb", type=int, default=256, help="结果图片大小（KB）")
+    group.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的比例")
+    group.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的比例")
+    group.add_argument("--upload-mbps", type=float, default=0.0, help="模拟的上行带宽（Mbit/s，0 表示不限制）")
+    group.add_argument(
+        "--model-latency",
+        default="",
+        help="按模型设置首字节延迟（秒），如 Qwen3-8B=0.05,Qwen3-14B=0.3，未列出的模型使用 --latency",
+    )
+    group.add_argument("--provider", default="mock", help="响应中返回的供应商名称")
+    group.add_argument(
+        "--request-encodings",
+        default="",
+        help="接受的请求体编码（如 gzip,zstd），在响应的 Accept-Encoding 中声明，其它编码返回 415",
+    )
+    return parser
+
+
+def _model_latency(options: argparse.Namespace) -> dict[str, float]:
+    """解析 --model-latency"""
+    latencies = {}
+    for item in (options.model_latency or "").split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value:
+            latencies[name.strip()] = float(value)
+    return latencies
+
+
+def _embed(text: str, dim: int) -> list[float]:
+    """
+    词袋特征哈希向量：每个词按哈希映射到 4 个维度并累加 ±1，
+    相同文本得到相同向量，措辞相近的文本得到相近的向量
+    """
+    vector = [0.0] * dim
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.blake2b(word.encode(), digest_size=16).digest()
+        for i in range(0, 16, 4):
+            value = int.from_bytes(digest[i : i + 4], "big")
+            vector[value % dim] += 1.0 if value >> 31 else -1.0
+    return vector
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    options: argparse.Namespace
+    image: bytes
+    # 按路径统计收到的请求数
+    counts: Counter
+    # 按路径统计收到的请求体字节数（压缩后）
+    received_bytes: Counter
+    counts_lock: threading.Lock
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def end_headers(self) -> None:
+        if self.options.request_encodings:
+            # RFC 7694：在响应中声明接受的请求体编码
+            self.send_header("Accept-Encoding", self.options.request_encodings)
+        super().end_headers()
+
+    # ---------------------------------------------------------------- routing
+
+    def do_GET(self) -> None:
+        path = self.path.split("?")[0].rstrip("/")
+        self._count("GET /images" if path.startswith("/images/") else f"GET {path}")
+        if path.startswith("/images/"):
+            self._send_bytes(200, self.image, "image/png")
+        elif path.endswith("/models"):
+            if not self._inject_failure():
+                self._send_json(200, self._models())
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {path}"}})
+
+    def do_POST(self) -> None:
+        path = self.path.split("?")[0].rstrip("/")
+        self._count(f"POST {path}")
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        with self.counts_lock:
+            self.received_bytes[path] += len(body)
+        if self.options.upload_mbps:
+            time.sleep(len(body) * 8 / (self.options.upload_mbps * 1e6))
+        body = self._decode_body(body)
+        if body is None or self._inject_failure():
+            return
+        try:
+            payload = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Invalid JSON"}})
+            return
+
+        if path.endswith("/chat/completions"):
+            self._chat(payload)
+        elif path.endswith("/embeddings"):
+            self._embeddings(payload)
+        elif path.endswith("/rerank"):
+            self._rerank(payload)
+        elif path.endswith("/images/generations"):
+            self._images(payload)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {path}"}})
+
+    # -------------------------------------------------------------- endpoints
+
+    @staticmethod
+    def _models() -> dict:
+        return {
+            "data": [
+                {
+                    "id": name,
+                    "model_type": model_type,
+                    "status": True,
+                    "is_foreign": False,
+                    "context_length_range": [32768, 131072],
+                }
+                for name, model_type in CATALOG
+            ]
+        }
+
+    def _chat(self, payload: dict) -> None:
+        options = self.options
+        model = payload.get("model", "mock")
+        thinking = bool((payload.get("extra_body") or {}).get("enable_thinking"))
+        reasoning_tokens = options.reasoning_tokens if thinking else 0
+        tool = (payload.get("tools") or [None])[0]
+        # 请求设置了 max_tokens 时回答不超过该长度，负载重放以此复现录制的输出长度
+        completion_tokens = min(
+            options.completion_tokens, payload.get("max_tokens") or options.completion_tokens
+        )
+        prompt_tokens = sum(
+            len(str(m.get("content", ""))) // 4 + 1 for m in payload.get("messages", [])
+        )
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens + reasoning_tokens,
+            "total_tokens": prompt_tokens + completion_tokens + reasoning_tokens,
+            "completion_tokens_details": {"reasoning_tokens": reasoning_tokens},
+        }
+        time.sleep(_model_latency(options).get(model, options.latency))
+
+        words = [_WORDS[i % len(_WORDS)] for i in range(completion_tokens)]
+        tool_call = None
+        if tool:
+            arguments = json.dumps({"query": " ".join(words[:8])})
+            tool_call = {
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {
+                    "name": tool.get("function", {}).get("name", "tool"),
+                    "arguments": arguments,
+                },
+            }
+
+        if not payload.get("stream"):
+            message = {"role": "assistant", "content": "" if tool_call else " ".join(words)}
+            if reasoning_tokens:
+                message["reasoning_content"] = " ".join(_WORDS[:1] * reasoning_tokens)
+            if tool_call:
+                message["tool_calls"] = [tool_call]
+            self._send_json(
+                200,
+                {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "provider": options.provider,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": message,
+                            "finish_reason": "tool_calls" if tool_call else "stop",
+                        }
+                    ],
+                    "usage": usage,
+                },
+            )
+            return
+
+        # 流式输出：逐个 token 按设定速度发送
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        interval = 1.0 / options.tokens_per_second if options.tokens_per_second > 0 else 0
+
+        def send(delta: dict, finish_reason: Optional[str] = None, **extra: Any) -> None:
+            chunk = {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "provider": options.provider,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                **extra,
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            if interval:
+                time.sleep(interval)
+
+        try:
+            send({"role": "assistant", "content": ""})
+            for _ in range(reasoning_tokens):
+                send({"reasoning_content": _WORDS[0] + " "})
+            if tool_call:
+                arguments = tool_call["function"]["arguments"]
+                send(
+                    {
+                        "tool_calls": [
+                            {
+                                "index": 0,
+                                "id": tool_call["id"],
+                                "type": "function",
+                                "function": {"name": tool_call["function"]["name"], "arguments": ""},
+                            }
+                        ]
+                    }
+                )
+                # 参数按小片段发送，模拟增量拼接
+                for i in range(0, len(arguments), 8):
+                    send({"tool_calls": [{"index": 0, "function": {"arguments": arguments[i : i + 8]}}]})
+            else:
+                for word in words:
+                    send({"content": word + " "})
+            send({}, "tool_calls" if tool_call else "stop", usage=usage)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前结束流式读取
+            pass
+
+    def _embeddings(self, payload: dict) -> None:
+        inputs = payload.get("input") or []
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        latency = self.options.embedding_latency
+        time.sleep(self.options.latency if latency is None else latency)
+        data = []
+        for index, text in enumerate(inputs):
+            data.append(
+                {
+                    "object": "embedding",
+                    "index": index,
+                    "embedding": _embed(str(text), self.options.embedding_dim),
+                }
+            )
+        tokens = sum(len(str(text)) // 4 + 1 for text in inputs)
+        self._send_json(
+            200,
+            {
+                "object": "list",
+                "model": payload.get("model"),
+                "data": data,
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            },
+        )
+
+    def _rerank(self, payload: dict) -> None:
+        query_words = set(str(payload.get("query", "")).lower().split())
+        documents = payload.get("documents") or []
+        time.sleep(self.options.latency)
+        results = []
+        for index, document in enumerate(documents):
+            words = set(str(document).lower().split())
+            score = len(query_words & words) / (len(query_words | words) or 1)
+            results.append({"index": index, "relevance_score": score, "document": {"text": document}})
+        results.sort(key=lambda r: r["relevance_score"], reverse=True)
+        top_n = payload.get("top_n")
+        self._send_json(200, {"model": payload.get("model"), "results": results[:top_n] if top_n else results})
+
+    def _images(self, payload: dict) -> None:
+        latency = self.options.image_latency
+        time.sleep(self.options.latency if latency is None else latency)
+        count = int((payload.get("extra_body") or {}).get("n", 1))
+        host = self.headers.get("Host")
+        self._send_json(
+            200,
+            {
+                "created": int(time.time()),
+                "data": [
+                    {"url": f"http://{host}/images/{uuid.uuid4().hex}.png"} for _ in range(count)
+                ],
+            },
+        )
+
+    # ---------------------------------------------------------------- helpers
+
+    def _count(self, route: str) -> None:
+        with self.counts_lock:
+            self.counts[route] += 1
+
+    def _decode_body(self, body: bytes) -> Optional[bytes]:
+        """按 Content-Encoding 解压请求体，不支持的编码返回 415"""
+        encoding = (self.headers.get("Content-Encoding") or "identity").lower()
+        if encoding == "identity":
+            return body
+        accepted = [e.strip() for e in self.options.request_encodings.split(",")]
+        if encoding not in accepted:
+            self._send_json(415, {"error": {"message": f"Unsupported Content-Encoding {encoding}"}})
+            return None
+        if encoding == "zstd":
+            import zstandard
+
+            return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+        return gzip.decompress(body)
+
+    def _inject_failure(self) -> bool:
+        """按配置的比例返回 429 或 500"""
+        roll = random.random()
+        if roll < self.options.rate_limit_rate:
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            body = json.dumps({"error": {"message": "Rate limit exceeded", "type": "rate_limit"}}).encode()
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return True
+        if roll < self.options.rate_limit_rate + self.options.error_rate:
+            self._send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+            return True
+        return False
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        self._send_bytes(status, json.dumps(payload).encode(), "application/json")
+
+    def _send_bytes(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(options: argparse.Namespace, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """
+    在后台线程启动模拟服务
+
+    Args:
+        options: build_parser() 解析得到的参数
+        host: 监听地址
+        port: 监听端口，0 表示随机端口
+
+    Returns:
+        服务实例，基础地址为 http://host:server.server_address[1]，
+        server.RequestHandlerClass.counts 为按路径统计的请求数，received_bytes 为收到的请求体字节数
+    """
+    handler = type(
+        "ConfiguredMockHandler",
+        (MockHandler,),
+        {
+            "options": options,
+            "image": b"\x89PNG\r\n\x1a\n" + os.urandom(options.image_kb * 1024),
+            "counts": Counter(),
+            "received_bytes": Counter(),
+            "counts_lock": threading.Lock(),
+        },
+    )
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0], parents=[build_parser()]
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    options = parser.parse_args()
+    server = serve(options, options.host, options.port)
+    print(f"Mock AIPing server listening on http://{options.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+负载重放
+
+读取插件以 WORKLOAD_CAPTURE_FILE 录制的调用，按录制时的调用间隔（除以 --speedup）和请求形态，
+通过插件自身的模型类和工具对本地模拟服务（或 --base-url 指定的服务）重放，
+输出各调用类型的延迟分布。提示词、文档等内容按录制的长度生成；LLM 回答长度通过 max_tokens
+复现录制的输出 token 数；消息中的图片不重放。指定 --baseline 时与之前保存的报告比较，
+任一调用类型的 p95 变慢超过 --max-regression 时以非零状态退出
+
+用法:
+    # 插件运行环境中设置 WORKLOAD_CAPTURE_FILE=/tmp/workload.jsonl 录制
+    python benchmarks/replay.py /tmp/workload.jsonl --speedup 10 --output baseline.json
+    python benchmarks/replay.py /tmp/workload.jsonl --speedup 10 --baseline baseline.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Optional
+
+from mock_server import build_parser, serve
+
+from harness import ROOT, Harness, percentile
+
+sys.path.insert(0, ROOT)
+
+from dify_plugin.entities.model import EmbeddingInputType  # noqa: E402
+from dify_plugin.entities.model.message import (  # noqa: E402
+    AssistantPromptMessage,
+    PromptMessageTool,
+    SystemPromptMessage,
+    ToolPromptMessage,
+    UserPromptMessage,
+)
+from tools.batch_text2image import BatchText2ImageTool  # noqa: E402
+from tools.image2image import Image2ImageTool  # noqa: E402
+from tools.text2image import Text2ImageTool  # noqa: E402
+from utils.workload import REDACTED  # noqa: E402
+
+_FILLER = "the quick brown fox jumps over the lazy dog "
+# 录制中没有输出 token 数（如调用失败）且未设置 max_tokens 时的回答长度
+_DEFAULT_COMPLETION_TOKENS = 64
+
+
+def text(chars: int, index: int) -> str:
+    """生成指定长度的文本，以序号开头避免不同调用内容相同"""
+    return (f"{index} " + _FILLER * (chars // len(_FILLER) + 1))[: max(chars, 1)]
+
+
+def load(path: str) -> list[dict]:
+    """读取录制文件，按调用开始时间排序"""
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return sorted(records, key=lambda r: r["ts"])
+
+
+def recorded_params(params: dict) -> dict:
+    """录制时只记录了已设置的参数无法重放，其余原样使用"""
+    return {k: v for k, v in params.items() if v != REDACTED}
+
+
+class Replayer:
+    def __init__(self, base_url: str, args: argparse.Namespace):
+        self.harness = Harness(base_url, args)
+
+    def call(self, record: dict, index: int) -> bool:
+        return getattr(self, f"_{record['kind']}")(record, record["shape"], index)
+
+    def _llm(self, record: dict, shape: dict, index: int) -> bool:
+        message_types = {
+            "system": SystemPromptMessage,
+            "user": UserPromptMessage,
+            "assistant": AssistantPromptMessage,
+        }
+        messages = []
+        for i, message in enumerate(shape.get("messages", [])):
+            content = text(message.get("chars", 0), index * 1000 + i)
+            if message.get("role") == "tool":
+                messages.append(ToolPromptMessage(content=content, tool_call_id=f"call_{i}"))
+            else:
+                message_type = message_types.get(message.get("role"), UserPromptMessage)
+                messages.append(message_type(content=content))
+        params = recorded_params(shape.get("params", {}))
+        params["max_tokens"] = (
+            record.get("completion_tokens") or params.get("max_tokens") or _DEFAULT_COMPLETION_TOKENS
+        )
+        tools = [
+            PromptMessageTool(
+                name=f"tool_{i}",
+                description="Replayed tool",
+                parameters={"type": "object", "properties": {"query": {"type": "string"}}},
+            )
+            for i in range(shape.get("tools", 0))
+        ]
+        result = self.harness.llm._invoke(
+            model=record["model"],
+            credentials=self.harness.credentials(),
+            prompt_messages=messages,
+            model_parameters=params,
+            tools=tools or None,
+            stop=[f"<stop-{i}>" for i in range(shape.get("stop", 0))] or None,
+            stream=shape.get("stream", False),
+            user=None,
+        )
+        if shape.get("stream", False):
+            return any(True for _ in result)
+        return result is not None
+
+    def _embedding(self, record: dict, shape: dict, index: int) -> bool:
+        count = max(shape.get("count", 1), 1)
+        result = self.harness.embedding._invoke(
+            model=record["model"],
+            credentials=self.harness.credentials(),
+            texts=[text(shape.get("chars", 0) // count, index * 1000 + i) for i in range(count)],
+            input_type=EmbeddingInputType(shape.get("input_type", "document")),
+        )
+        return len(result.embeddings) == count
+
+    def _rerank(self, record: dict, shape: dict, index: int) -> bool:
+        docs = shape.get("docs", {})
+        count = max(docs.get("count", 1), 1)
+        result = self.harness.rerank._invoke(
+            model=record["model"],
+            credentials=self.harness.credentials(),
+            query=text(shape.get("query_chars", 0), index),
+            docs=[text(docs.get("chars", 0) // count, index * 1000 + i) for i in range(count)],
+            score_threshold=shape.get("score_threshold"),
+            top_n=shape.get("top_n"),
+        )
+        return result is not None
+
+    def _tool_parameters(self, record: dict, shape: dict, index: int) -> dict:
+        parameters = {
+            "model": record["model"],
+            "prompt": text(shape.get("prompt_chars", 0), index),
+            "extra_body": json.dumps(recorded_params(shape.get("extra_body", {}))),
+        }
+        if shape.get("negative_prompt_chars"):
+            parameters["negative_prompt"] = text(shape["negative_prompt_chars"], index)
+        return parameters
+
+    def _text2image(self, record: dict, shape: dict, index: int) -> bool:
+        return self.harness._tool(Text2ImageTool, self._tool_parameters(record, shape, index))[0]
+
+    def _image2image(self, record: dict, shape: dict, index: int) -> bool:
+        parameters = self._tool_parameters(record, shape, index)
+        size = record.get("image_bytes") or 256 * 1024
+        parameters["image"] = SimpleNamespace(
+            url=None, blob=b"\xff\xd8\xff\xe0" + os.urandom(size), mime_type="image/jpeg"
+        )
+        return self.harness._tool(Image2ImageTool, parameters)[0]
+
+    def _batch_text2image(self, record: dict, shape: dict, index: int) -> bool:
+        parameters = self._tool_parameters(record, shape, index)
+        count = max(record.get("prompts", 1), 1)
+        parameters["prompts"] = "\n".join(
+            text(shape.get("prompts_chars", 0) // count, index * 1000 + i) for i in range(count)
+        )
+        parameters["count"] = shape.get("count", 1)
+        return self.harness._tool(BatchText2ImageTool, parameters)[0]
+
+
+def replay(replayer: Replayer, records: list[dict], speedup: float) -> dict:
+    """按录制的调用间隔并发重放，返回 {调用类型: [(是否成功, 耗时 ms)]}"""
+    results: dict[str, list[tuple[bool, float]]] = defaultdict(list)
+    lock = threading.Lock()
+
+    def run(record: dict, index: int) -> None:
+        started = time.perf_counter()
+        try:
+            ok = replayer.call(record, index)
+        except Exception:
+            ok = False
+        with lock:
+            results[record["kind"]].append((ok, (time.perf_counter() - started) * 1000))
+
+    threads = []
+    origin = records[0]["ts"] if records else 0
+    started = time.perf_counter()
+    for index, record in enumerate(records):
+        delay = (record["ts"] - origin) / speedup - (time.perf_counter() - started)
+        if delay > 0:
+            time.sleep(delay)
+        thread = threading.Thread(target=run, args=(record, index), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summarize(records: list[dict], results: dict) -> dict:
+    """各调用类型重放的延迟分布，以及录制时的 p50 供参考"""
+    recorded = defaultdict(list)
+    for record in records:
+        recorded[record["kind"]].append(record["duration_ms"])
+    report = {}
+    for kind, samples in sorted(results.items()):
+        latencies = [ms for _, ms in samples]
+        report[kind] = {
+            "requests": len(samples),
+            "errors": sum(1 for ok, _ in samples if not ok),
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+            "mean_ms": round(statistics.mean(latencies), 1),
+            "recorded_p50_ms": round(percentile(recorded[kind], 50), 1),
+        }
+    return report
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> list[str]:
+    """返回 p95 变慢超过阈值或出现新错误的调用类型说明"""
+    regressions = []
+    for kind, current in report.items():
+        previous = baseline.get(kind)
+        if previous is None:
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + max_regression):
+            regressions.append(
+                f"{kind}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms "
+                f"(+{current['p95_ms'] / previous['p95_ms'] - 1:.0%})"
+            )
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{kind}: errors {previous['errors']} -> {current['errors']}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0], parents=[build_parser()]
+    )
+    # 回答长度由请求的 max_tokens 决定
+    parser.set_defaults(completion_tokens=4096)
+    parser.add_argument("capture", help="录制文件（JSONL）")
+    parser.add_argument("--speedup", type=float, default=1.0, help="重放加速倍数")
+    parser.add_argument("--base-url", default=None, help="重放目标，默认启动本地模拟服务")
+    parser.add_argument("--output", help="保存报告（JSON）")
+    parser.add_argument("--baseline", help="与之前保存的报告比较")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="允许的 p95 变慢比例")
+    args = parser.parse_args()
+
+    records = load(args.capture)
+    server: Optional[object] = None
+    base_url = args.base_url
+    if base_url is None:
+        server = serve(args)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    span = (records[-1]["ts"] - records[0]["ts"]) if records else 0
+    print(f"replaying {len(records)} calls recorded over {span:.0f}s at {args.speedup}x against {base_url}")
+
+    started = time.perf_counter()
+    results = replay(Replayer(base_url, args), records, args.speedup)
+    report = summarize(records, results)
+    print(f"finished in {time.perf_counter() - started:.1f}s")
+    print(
+        f"{'kind':<18}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}"
+        f"{'p99 ms':>9}{'mean ms':>9}{'rec p50':>9}"
+    )
+    for kind, r in report.items():
+        print(
+            f"{kind:<18}{r['requests']:>9}{r['errors']:>8}{r['p50_ms']:>9}{r['p95_ms']:>9}"
+            f"{r['p99_ms']:>9}{r['mean_ms']:>9}{r['recorded_p50_ms']:>9}"
+        )
+    if server is not None:
+        server.shutdown()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
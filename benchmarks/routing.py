@@ -0,0 +1,82 @@
+"""
+客户端模型路由基准测试
+
+启动按模型设置首字节延迟的本地模拟服务，先固定调用一个模型，再设置等价模型让插件
+按记录的统计自动选择最快的模型，对比端到端耗时并输出各模型的选择次数和统计
+
+用法:
+    python benchmarks/routing.py --requests 60 --model-latency Qwen3-8B=0.4,Qwen3-14B=0.1,Qwen3-32B=0.25
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from collections import Counter
+
+from mock_server import build_parser, serve
+
+from harness import ROOT, Harness
+
+sys.path.insert(0, ROOT)
+
+from dify_plugin.entities.model.message import UserPromptMessage  # noqa: E402
+from utils import routing  # noqa: E402
+
+
+def run(harness: Harness, model: str, equivalent_models: str, requests: int) -> tuple[list, Counter]:
+    """顺序执行流式调用，返回每次的耗时（毫秒）和实际调用的模型"""
+    latencies = []
+    selected: Counter = Counter()
+    for i in range(requests):
+        started = time.perf_counter()
+        chunks = list(
+            harness.llm._invoke(
+                model=model,
+                credentials=harness.credentials(),
+                prompt_messages=[UserPromptMessage(content=f"Request {i}: summarize the benchmark.")],
+                model_parameters={"equivalent_models": equivalent_models} if equivalent_models else {},
+                tools=None,
+                stop=None,
+                stream=True,
+                user=None,
+            )
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+        selected[chunks[-1].model] += 1
+    return latencies, selected
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0], parents=[build_parser()]
+    )
+    parser.set_defaults(
+        latency=0.2,
+        tokens_per_second=400.0,
+        model_latency="Qwen3-8B=0.4,Qwen3-14B=0.1,Qwen3-32B=0.25",
+    )
+    parser.add_argument("--requests", type=int, default=60, help="每种模式的请求数")
+    parser.add_argument("--model", default="Qwen3-8B", help="调用方选择的模型")
+    parser.add_argument("--equivalent-models", default="Qwen3-14B,Qwen3-32B")
+    args = parser.parse_args()
+
+    server = serve(args)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    harness = Harness(base_url, argparse.Namespace(**vars(args), llm_model=args.model))
+    print(f"model latency: {args.model_latency} requests={args.requests}")
+    print(f"{'mode':<14}{'p50 ms':>10}{'mean ms':>10}  selected")
+    for mode, equivalent_models in (("fixed", ""), ("auto-fastest", args.equivalent_models)):
+        latencies, selected = run(harness, args.model, equivalent_models, args.requests)
+        print(
+            f"{mode:<14}{statistics.median(latencies):>10.0f}{statistics.mean(latencies):>10.0f}  "
+            + ", ".join(f"{model}={count}" for model, count in selected.most_common())
+        )
+    print("stats:")
+    for key, value in sorted(routing.stats().items()):
+        print(f"  {key:<28}{value}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+LLM 语义缓存基准测试
+
+启动本地模拟服务（Embedding 为词袋特征哈希向量，措辞相近的问题向量相近），
+以客服场景的问题及其改写随机组成请求序列，分别在关闭和开启语义缓存时顺序调用，
+对比端到端耗时、命中率和发往上游的对话请求数
+
+用法:
+    python benchmarks/semantic_cache.py --requests 200 --threshold 0.85
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+
+from mock_server import build_parser, serve
+
+from harness import ROOT, Harness
+
+sys.path.insert(0, ROOT)
+
+import config  # noqa: E402
+from dify_plugin.entities.model.message import SystemPromptMessage, UserPromptMessage  # noqa: E402
+from models.llm import llm as llm_module  # noqa: E402
+from utils.semantic_cache import SemanticCache  # noqa: E402
+
+# 每个问题的几种改写，{a|b} 表示可互换的措辞
+QUESTIONS = [
+    "How {do|can} I reset my account password",
+    "Where can I {find|download} my invoice for last month",
+    "Why was my {payment|card} declined at checkout",
+    "How {do|can} I change the email address on my account",
+    "What is your refund policy for {annual|yearly} plans",
+    "How long does {shipping|delivery} to Europe take",
+    "Can I {upgrade|switch} my plan in the middle of a billing cycle",
+    "How {do|can} I enable two factor authentication",
+    "Is there an API rate limit for the {free|basic} tier",
+    "How {do|can} I cancel my subscription",
+]
+
+
+def paraphrase(template: str, rng: random.Random) -> str:
+    """随机选择措辞并附加常见的口语前后缀"""
+    words = []
+    for word in template.split():
+        if word.startswith("{"):
+            word = rng.choice(word.strip("{}").split("|"))
+        words.append(word)
+    prefix = rng.choice(["", "Hi, ", "Hello! "])
+    suffix = rng.choice(["?", "?", " please?"])
+    return prefix + " ".join(words) + suffix
+
+
+def run(harness: Harness, prompts: list[str], model: str) -> list[float]:
+    """顺序执行流式调用，返回每次的耗时（毫秒）"""
+    latencies = []
+    for prompt in prompts:
+        started = time.perf_counter()
+        for _ in harness.llm._invoke(
+            model=model,
+            credentials=harness.credentials(),
+            prompt_messages=[
+                SystemPromptMessage(content="You are the support assistant for an online store."),
+                UserPromptMessage(content=prompt),
+            ],
+            model_parameters={},
+            tools=None,
+            stop=None,
+            stream=True,
+            user=None,
+        ):
+            pass
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0], parents=[build_parser()]
+    )
+    parser.set_defaults(
+        latency=0.3, embedding_latency=0.02, tokens_per_second=200.0, embedding_dim=256
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--threshold", type=float, default=0.85, help="命中所需的最低余弦相似度")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--llm-model", default="Qwen3-8B")
+    parser.add_argument("--embedding-model", default="Qwen3-Embedding-0.6B")
+    args = parser.parse_args()
+
+    server = serve(args)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    counts = server.RequestHandlerClass.counts
+    harness = Harness(base_url, args)
+    rng = random.Random(args.seed)
+    prompts = [paraphrase(rng.choice(QUESTIONS), rng) for _ in range(args.requests)]
+
+    print(
+        f"requests={args.requests} questions={len(QUESTIONS)} threshold={args.threshold} "
+        f"chat latency={args.latency}s embedding latency={args.embedding_latency}s"
+    )
+    print(f"{'cache':<6}{'p50 ms':>10}{'mean ms':>10}{'hit rate':>10}{'chat calls':>12}")
+    for enabled in (False, True):
+        config.LLM_SEMANTIC_CACHE_MODEL = args.embedding_model if enabled else ""
+        cache = llm_module._semantic_cache = SemanticCache(
+            config.LLM_SEMANTIC_CACHE_MAX_ENTRIES, config.LLM_SEMANTIC_CACHE_TTL, args.threshold
+        )
+        before = counts["POST /chat/completions"]
+        latencies = run(harness, prompts, args.llm_model)
+        print(
+            f"{'on' if enabled else 'off':<6}{statistics.median(latencies):>10.0f}"
+            f"{statistics.mean(latencies):>10.0f}{cache.stats()['hit_rate']:>10.2f}"
+            f"{counts['POST /chat/completions'] - before:>12}"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+插件冷启动基准测试
+
+在临时目录中复制插件代码，以独立进程多次执行 `import main`（构造 Plugin 但不进入服务循环），
+统计启动到就绪的耗时，并解析 `python -X importtime` 输出给出导入耗时最多的模块
+
+模式:
+    baseline    同步刷新模型目录，纯 Python 解析 YAML（优化前的行为）
+    sync        同步刷新模型目录，libyaml 解析 YAML
+    background  使用已有 YAML 启动，模型目录在后台刷新（默认配置）
+
+用法:
+    python benchmarks/startup.py --runs 5 --latency 0.3
+    python benchmarks/startup.py --modes background --max-ready-ms 1500
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import mock_server
+from mock_server import build_parser, serve
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    "baseline": ("sync", False),
+    "sync": ("sync", True),
+    "background": ("background", True),
+}
+
+_CHILD = """
+import sys
+if not {libyaml}:
+    import yaml
+    yaml.__with_libyaml__ = False
+import main
+print("__READY__", flush=True)
+"""
+
+# 单独统计的顶层包
+_GROUPS = ("dify_plugin", "models", "tools", "utils", "provider", "config", "yaml", "requests")
+
+
+def parse_importtime(stderr: str) -> tuple[dict[str, int], dict[str, int]]:
+    """
+    解析 -X importtime 输出
+
+    Returns:
+        ({模块: 自身耗时us}, {顶层包: 包内所有模块自身耗时之和us})
+    """
+    self_us: dict[str, int] = {}
+    groups: dict[str, int] = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, _, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        self_us[name] = int(self_time)
+        top = name.split(".")[0]
+        if top in _GROUPS:
+            groups[top] += int(self_time)
+    return self_us, dict(groups)
+
+
+def run_once(plugin_dir: str, base_url: str, mode: str) -> dict:
+    """启动一次插件，返回就绪耗时和导入统计"""
+    refresh, libyaml = MODES[mode]
+    env = {
+        **os.environ,
+        "AIPING_BASE_URL": base_url,
+        "CATALOG_REFRESH": refresh,
+        "PYTHONDONTWRITEBYTECODE": "1",
+    }
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-X", "importtime", "-c", _CHILD.format(libyaml=libyaml)],
+        cwd=plugin_dir,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    ready_ms = None
+    for line in process.stdout:
+        if line.startswith("__READY__"):
+            ready_ms = (time.perf_counter() - started) * 1000
+    _, stderr = process.communicate()
+    if ready_ms is None:
+        raise RuntimeError(f"Plugin failed to start in {mode} mode:\n{stderr[-2000:]}")
+    self_us, groups = parse_importtime(stderr)
+    return {"ready_ms": ready_ms, "self_us": self_us, "groups": groups}
+
+
+def repo_catalog() -> list:
+    """按工作区中的模型 YAML 构造模拟目录，使刷新后的模型数量与实际一致"""
+    catalog = []
+    for model_type in ("llm", "embedding", "reranker"):
+        for path in sorted(glob.glob(os.path.join(ROOT, "models", model_type, "*.yaml"))):
+            with open(path, encoding="utf-8") as f:
+                name = next((line[7:].strip() for line in f if line.startswith("model: ")), None)
+            if name:
+                catalog.append((name, model_type))
+    image_models = [m for m in mock_server.CATALOG if m[1] in ("text2image", "image2image")]
+    return catalog + image_models
+
+
+def copy_plugin(target: str) -> str:
+    """复制插件代码，刷新模型目录时不修改工作区中的 YAML"""
+    plugin_dir = os.path.join(target, "plugin")
+    shutil.copytree(
+        ROOT,
+        plugin_dir,
+        ignore=shutil.ignore_patterns(".git", "benchmarks", "__pycache__", "*.pyc"),
+    )
+    return plugin_dir
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0], parents=[build_parser()]
+    )
+    parser.set_defaults(latency=0.3)
+    parser.add_argument("--base-url", help="模型目录地址，默认使用内置模拟服务")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="列出自身导入耗时最多的模块数")
+    parser.add_argument("--max-ready-ms", type=float, help="最后一种模式的就绪耗时中位数超过该值时返回非零")
+    parser.add_argument("--json", help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        mock_server.CATALOG[:] = repo_catalog()
+        server = serve(args)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        plugin_dir = copy_plugin(tmp)
+        print(f"catalog={base_url} runs={args.runs}")
+        print(f"{'mode':<12}{'ready p50 ms':>14}{'min ms':>10}{'max ms':>10}  import ms by package")
+        for mode in modes:
+            runs = [run_once(plugin_dir, base_url, mode) for _ in range(args.runs)]
+            ready = [r["ready_ms"] for r in runs]
+            groups = {
+                name: statistics.median(r["groups"].get(name, 0) for r in runs) / 1000
+                for name in _GROUPS
+            }
+            results[mode] = {"ready_ms": ready, "import_ms": groups, "self_us": runs[-1]["self_us"]}
+            package_summary = " ".join(f"{k}={v:.0f}" for k, v in groups.items() if v >= 1)
+            print(
+                f"{mode:<12}{statistics.median(ready):>14.0f}{min(ready):>10.0f}"
+                f"{max(ready):>10.0f}  {package_summary}"
+            )
+
+    last = modes[-1]
+    print(f"\nslowest imports by self time ({last}):")
+    slowest = sorted(results[last]["self_us"].items(), key=lambda item: item[1], reverse=True)
+    for name, us in slowest[: args.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if server:
+        server.shutdown()
+
+    median_ready = statistics.median(results[last]["ready_ms"])
+    if args.max_ready_ms is not None and median_ready > args.max_ready_ms:
+        print(f"\n{last} startup {median_ready:.0f} ms exceeds {args.max_ready_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
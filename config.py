@@ -2,4 +2,130 @@ import os
 
 MAX_REQUEST_TIMEOUT = int(os.getenv("MAX_REQUEST_TIMEOUT", "600"))
 
+# API 地址，可以用逗号分隔多个地址，请求发往其中最快的可用地址
 AIPING_BASE_URL = os.getenv("AIPING_BASE_URL", "https://aiping.cn/api/v1")
+
+# 自动思考模式下，提示词超过该字符数时启用思考
+AUTO_THINKING_PROMPT_CHARS = int(os.getenv("AUTO_THINKING_PROMPT_CHARS", "2000"))
+
+# 视觉模型输入图片预处理：长边最大像素（0 表示不处理）、编码格式和质量
+VISION_IMAGE_MAX_SIDE = int(os.getenv("VISION_IMAGE_MAX_SIDE", "2048"))
+VISION_IMAGE_FORMAT = os.getenv("VISION_IMAGE_FORMAT", "jpeg")
+VISION_IMAGE_QUALITY = int(os.getenv("VISION_IMAGE_QUALITY", "85"))
+# 预处理结果缓存容量（字节），相同图片在多轮对话中只处理一次
+VISION_IMAGE_CACHE_BYTES = int(os.getenv("VISION_IMAGE_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+# 凭证校验通过后的缓存时间（秒）
+CREDENTIALS_CACHE_TTL = int(os.getenv("CREDENTIALS_CACHE_TTL", "600"))
+# 凭证校验使用的低价模型（逗号分隔，按顺序取模型目录中第一个可用的），都不可用或留空时只校验 /models
+CREDENTIALS_PROBE_MODEL = os.getenv("CREDENTIALS_PROBE_MODEL", "Qwen3-8B,Qwen2.5-7B-Instruct")
+
+# 单张结果图片的大小上限（字节），超过时中止下载
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(64 * 1024 * 1024)))
+# 图片数据超过该大小（字节）时缓冲到临时文件而不是内存
+IMAGE_SPOOL_BYTES = int(os.getenv("IMAGE_SPOOL_BYTES", str(8 * 1024 * 1024)))
+
+# 多张结果图片的并发下载数、单张下载耗时上限（秒）以及是否按原顺序返回
+IMAGE_FETCH_CONCURRENCY = int(os.getenv("IMAGE_FETCH_CONCURRENCY", "4"))
+IMAGE_FETCH_TIMEOUT = int(os.getenv("IMAGE_FETCH_TIMEOUT", str(MAX_REQUEST_TIMEOUT)))
+IMAGE_FETCH_ORDERED = os.getenv("IMAGE_FETCH_ORDERED", "false").lower() == "true"
+
+# 图生图输入图片长边最大像素，超过时缩小后再上传（0 表示不处理）
+IMAGE_INPUT_MAX_SIDE = int(os.getenv("IMAGE_INPUT_MAX_SIDE", "0"))
+# 图生图输入图片预处理结果缓存容量（字节），按内容哈希或 URL + ETag 复用
+IMAGE_INPUT_CACHE_BYTES = int(os.getenv("IMAGE_INPUT_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+# 文生图结果磁盘缓存目录（留空表示不启用），仅缓存 extra_body 中带 seed 的请求
+IMAGE_RESULT_CACHE_DIR = os.getenv("IMAGE_RESULT_CACHE_DIR", "")
+# 文生图结果磁盘缓存容量（字节）
+IMAGE_RESULT_CACHE_BYTES = int(os.getenv("IMAGE_RESULT_CACHE_BYTES", str(256 * 1024 * 1024)))
+
+# 批量文生图的并发请求数和单次最多生成的组数
+IMAGE_BATCH_CONCURRENCY = int(os.getenv("IMAGE_BATCH_CONCURRENCY", "4"))
+IMAGE_BATCH_MAX_ITEMS = int(os.getenv("IMAGE_BATCH_MAX_ITEMS", "50"))
+
+# 图像生成是否以异步任务方式提交；接口返回任务 ID 时总会轮询结果
+IMAGE_ASYNC_SUBMIT = os.getenv("IMAGE_ASYNC_SUBMIT", "false").lower() == "true"
+# 异步任务查询地址模板
+IMAGE_TASK_URL_TEMPLATE = os.getenv(
+    "IMAGE_TASK_URL_TEMPLATE", "{base_url}/images/generations/{task_id}"
+)
+# 异步任务轮询的初始间隔、最大间隔和总等待时间（秒）
+IMAGE_POLL_INITIAL_INTERVAL = float(os.getenv("IMAGE_POLL_INITIAL_INTERVAL", "1"))
+IMAGE_POLL_MAX_INTERVAL = float(os.getenv("IMAGE_POLL_MAX_INTERVAL", "15"))
+IMAGE_POLL_TIMEOUT = int(os.getenv("IMAGE_POLL_TIMEOUT", str(MAX_REQUEST_TIMEOUT)))
+
+# 共享连接池的最大连接数
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+
+# 是否开启调用链追踪及根 span 的采样率（0~1）
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "false").lower() == "true"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+# span 导出目标：JSON Lines 文件路径和 OTLP/HTTP 收集器地址（如 http://127.0.0.1:4318/v1/traces），均可留空
+TRACE_JSON_FILE = os.getenv("TRACE_JSON_FILE", "")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")
+
+# 采样分析器的采样间隔（毫秒，0 表示不开启）和 folded stack 输出文件
+PROFILE_INTERVAL_MS = int(os.getenv("PROFILE_INTERVAL_MS", "0"))
+PROFILE_OUTPUT = os.getenv("PROFILE_OUTPUT", "/tmp/aiping-profile.folded")
+
+# 定期把指标计数、内存预算和地址选择统计写入日志的间隔（秒，0 表示不输出）
+TELEMETRY_LOG_INTERVAL = float(os.getenv("TELEMETRY_LOG_INTERVAL", "300"))
+
+# Embedding 跨请求合并窗口（毫秒，0 表示不合并）及单批的最大条数和估算 token 数
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "0"))
+EMBEDDING_BATCH_MAX_ITEMS = int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", "64"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "8192"))
+
+# 启动时刷新模型目录的方式：background 先用已有 YAML 启动并在后台刷新（下次启动生效），
+# sync 刷新完成后再启动，off 不刷新；没有任何模型 YAML 时 background 按 sync 处理
+CATALOG_REFRESH = os.getenv("CATALOG_REFRESH", "background").lower()
+# 获取模型目录的超时时间（秒）
+CATALOG_FETCH_TIMEOUT = int(os.getenv("CATALOG_FETCH_TIMEOUT", "10"))
+
+# 启动时和空闲后预热的 keep-alive 连接数（0 表示不预热）及判定空闲的时间（秒）
+HTTP_WARMUP_CONNECTIONS = int(os.getenv("HTTP_WARMUP_CONNECTIONS", "0"))
+HTTP_WARMUP_IDLE_SECONDS = int(os.getenv("HTTP_WARMUP_IDLE_SECONDS", "60"))
+# 共享会话新建连接时 DNS 解析结果的缓存时间（秒，0 表示不缓存）
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "60"))
+
+# 配置多个 API 地址时的健康探测间隔和超时（秒）
+ENDPOINT_PROBE_INTERVAL = float(os.getenv("ENDPOINT_PROBE_INTERVAL", "10"))
+ENDPOINT_PROBE_TIMEOUT = float(os.getenv("ENDPOINT_PROBE_TIMEOUT", "3"))
+# 探测耗时 EWMA 的平滑系数，越大越偏重最近的探测结果
+ENDPOINT_EWMA_ALPHA = float(os.getenv("ENDPOINT_EWMA_ALPHA", "0.3"))
+
+# 请求体压缩：off 不压缩；auto 只对在响应 Accept-Encoding 中声明支持请求压缩的服务压缩；
+# gzip / zstd 直接使用该编码（zstd 需要安装 zstandard），服务端返回 415 时回退为不压缩
+HTTP_REQUEST_COMPRESSION = os.getenv("HTTP_REQUEST_COMPRESSION", "auto").lower()
+# JSON 请求体超过该大小（字节）时才压缩
+HTTP_COMPRESSION_MIN_BYTES = int(os.getenv("HTTP_COMPRESSION_MIN_BYTES", "16384"))
+
+# 进程级内存预算（字节，0 表示不限制）。manifest 限制插件使用 256 MiB，
+# 扣除运行时基础占用（约 75 MiB）和两个图片缓存后留给并发操作的额度
+MEMORY_BUDGET_BYTES = int(os.getenv("MEMORY_BUDGET_BYTES", str(96 * 1024 * 1024)))
+# 等待内存额度的最长时间（秒），超时后操作失败
+MEMORY_WAIT_TIMEOUT = int(os.getenv("MEMORY_WAIT_TIMEOUT", "120"))
+
+# 客户端模型路由统计写入插件存储的最短间隔（秒，0 表示只保存在内存中）
+LLM_ROUTING_FLUSH_SECONDS = float(os.getenv("LLM_ROUTING_FLUSH_SECONDS", "60"))
+# 路由统计 EWMA 的平滑系数，越大越偏重最近的调用
+LLM_ROUTING_EWMA_ALPHA = float(os.getenv("LLM_ROUTING_EWMA_ALPHA", "0.2"))
+# 自动选择最快模型时，每个等价模型在同一提示词区间内至少需要的样本数，
+# 以及样本充足后仍随机选择其它模型的比例
+LLM_ROUTING_MIN_SAMPLES = int(os.getenv("LLM_ROUTING_MIN_SAMPLES", "3"))
+LLM_ROUTING_EXPLORE_RATE = float(os.getenv("LLM_ROUTING_EXPLORE_RATE", "0.05"))
+
+# LLM 语义缓存使用的 Embedding 模型（为空表示不启用），如 Qwen3-Embedding-0.6B
+LLM_SEMANTIC_CACHE_MODEL = os.getenv("LLM_SEMANTIC_CACHE_MODEL", "")
+# 命中所需的最低余弦相似度
+LLM_SEMANTIC_CACHE_THRESHOLD = float(os.getenv("LLM_SEMANTIC_CACHE_THRESHOLD", "0.95"))
+# 缓存回答的有效期（秒）和最多缓存的回答数；向量按 float32 存放，1024 维时每条约 4 KiB
+LLM_SEMANTIC_CACHE_TTL = float(os.getenv("LLM_SEMANTIC_CACHE_TTL", "3600"))
+LLM_SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("LLM_SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+# 计算向量时最后一条用户消息最多使用的字符数
+LLM_SEMANTIC_CACHE_MAX_CHARS = int(os.getenv("LLM_SEMANTIC_CACHE_MAX_CHARS", "2000"))
+
+# 负载录制文件（JSONL，为空表示不录制）和采样比例，录制结果可用 benchmarks/replay.py 重放
+WORKLOAD_CAPTURE_FILE = os.getenv("WORKLOAD_CAPTURE_FILE", "")
+WORKLOAD_CAPTURE_SAMPLE_RATE = float(os.getenv("WORKLOAD_CAPTURE_SAMPLE_RATE", "1.0"))
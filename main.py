@@ -1,20 +1,110 @@
+import inspect
 import os
 import sys
+import threading
+from contextlib import contextmanager
+
+import yaml
 from dify_plugin import Plugin, DifyPluginEnv
+from dify_plugin.core.utils import yaml_loader
 import config
 
-# 确保工具 YAML 文件存在
+# PROFILE_INTERVAL_MS 大于 0 时开启采样分析
+if config.PROFILE_INTERVAL_MS > 0:
+    from utils import profiler
+
+    profiler.start()
+
 plugin_dir = os.path.dirname(__file__)
 
-# 每次都重新生成 YAML 文件
-try:
-    from models.aiping_models import generate_all_yaml_files
-    generate_all_yaml_files(config.AIPING_BASE_URL, plugin_dir)
-    print("Model YAML files generated successfully")
-except Exception as e:
-    print(f"Warning: Failed to generate model YAML files: {e}", file=sys.stderr)
 
-plugin = Plugin(DifyPluginEnv(MAX_REQUEST_TIMEOUT=config.MAX_REQUEST_TIMEOUT))
+def refresh_catalog() -> None:
+    """从 /models 重新生成模型和工具 YAML 文件"""
+    try:
+        from models.aiping_models import generate_all_yaml_files
+        from utils import endpoints
+
+        # 配置了多个地址时使用主地址，请求由传输层在该地址组内选择实际地址
+        with endpoints.scope(config.AIPING_BASE_URL) as base_url:
+            generate_all_yaml_files(base_url, plugin_dir)
+        print("Model YAML files generated successfully")
+    except Exception as e:
+        print(f"Warning: Failed to generate model YAML files: {e}", file=sys.stderr)
+
+
+def catalog_present() -> bool:
+    """是否已有模型 YAML（随插件包发布或上次启动时生成）"""
+    llm_dir = os.path.join(plugin_dir, "models", "llm")
+    return os.path.isdir(llm_dir) and any(f.endswith(".yaml") for f in os.listdir(llm_dir))
+
+
+def _read_yaml_file_fast(file_path: str) -> dict:
+    """与 SDK 的 _read_yaml_file 行为一致，改用 libyaml 解析"""
+    if not file_path or not os.path.exists(file_path):
+        raise FileNotFoundError(f"Failed to load YAML file {file_path}: file not found")
+    with open(file_path, encoding="utf-8") as file:
+        try:
+            return yaml.load(file, Loader=yaml.CSafeLoader)
+        except Exception as e:
+            raise yaml.YAMLError(f"Failed to load YAML file {file_path}: {e}") from e
+
+
+def _replaceable(read_yaml_file) -> bool:
+    """SDK 的 _read_yaml_file 是否仍是只接收文件路径、用 yaml.safe_load 解析的实现"""
+    try:
+        parameters = list(inspect.signature(read_yaml_file).parameters)
+        source = inspect.getsource(read_yaml_file)
+    except (TypeError, ValueError, OSError):
+        return False
+    return parameters == ["file_path"] and "yaml.safe_load(" in source
+
+
+@contextmanager
+def fast_yaml_loading():
+    """
+    加载插件声明时使用 libyaml 解析上百个模型 YAML
+
+    只替换 SDK 读取 YAML 文件的函数，不修改 yaml 模块本身；未编译 libyaml、
+    SDK 没有该函数或其实现与预期不一致时保持不变
+    """
+    read_yaml_file = getattr(yaml_loader, "_read_yaml_file", None)
+    if read_yaml_file is None or not getattr(yaml, "__with_libyaml__", False):
+        yield
+        return
+    if not _replaceable(read_yaml_file):
+        print("Warning: dify_plugin YAML loader changed, using it without libyaml", file=sys.stderr)
+        yield
+        return
+    yaml_loader._read_yaml_file = _read_yaml_file_fast
+    try:
+        yield
+    finally:
+        yaml_loader._read_yaml_file = read_yaml_file
+
+
+# 已有模型 YAML 时直接启动，模型目录在后台刷新
+refresh_in_background = config.CATALOG_REFRESH == "background" and catalog_present()
+if config.CATALOG_REFRESH in ("sync", "background") and not refresh_in_background:
+    refresh_catalog()
+
+with fast_yaml_loading():
+    plugin = Plugin(DifyPluginEnv(MAX_REQUEST_TIMEOUT=config.MAX_REQUEST_TIMEOUT))
+
+# HTTP_WARMUP_CONNECTIONS 大于 0 时在后台预热到 AIPing 的连接
+if config.HTTP_WARMUP_CONNECTIONS > 0:
+    from utils import endpoints, transport
+
+    for url in endpoints.parse(config.AIPING_BASE_URL):
+        transport.start_warm_up(url)
+
+# TELEMETRY_LOG_INTERVAL 大于 0 时定期把运行统计写入日志
+if config.TELEMETRY_LOG_INTERVAL > 0:
+    from utils import telemetry
+
+    telemetry.start_reporting()
+
+if refresh_in_background:
+    threading.Thread(target=refresh_catalog, name="aiping-catalog", daemon=True).start()
 
 if __name__ == "__main__":
     plugin.run()
@@ -7,13 +7,17 @@ import logging
 import os
 from typing import Any, Dict, List
 from yarl import URL
-import requests
 
-from config import MAX_REQUEST_TIMEOUT
+from config import CATALOG_FETCH_TIMEOUT
+from utils import memory, tracing, transport
 
 logger = logging.getLogger(__name__)
 
+# 模型目录响应及解析结果的内存占用估算（上百个模型约数百 KB 的 JSON）
+_CATALOG_RESERVE_BYTES = 4 * 1024 * 1024
 
+
+@tracing.traced("catalog.fetch")
 def fetch_models_from_api(endpoint_url: str) -> List[Dict[str, Any]]:
     """
     从 v1/models API 端点获取模型列表
@@ -27,10 +31,10 @@ def fetch_models_from_api(endpoint_url: str) -> List[Dict[str, Any]]:
     try:
         url = str(URL(endpoint_url) / "models")
 
-        response = requests.get(url, timeout=MAX_REQUEST_TIMEOUT)
-        response.raise_for_status()
-
-        data = response.json()
+        with memory.reserve("catalog", _CATALOG_RESERVE_BYTES):
+            response = transport.request("GET", url, timeout=CATALOG_FETCH_TIMEOUT)
+            response.raise_for_status()
+            data = response.json()
         if not data or not isinstance(data, dict):
             return []
 
@@ -88,6 +92,7 @@ def _model_type_contains(model_type: Any, target: str) -> bool:
     return False
 
 
+@tracing.traced("catalog.generate")
 def generate_all_yaml_files(endpoint_url: str, base_path: str = None) -> None:
     """
     从 API 获取模型并生成所有 YAML 配置文件
@@ -113,12 +118,7 @@ def generate_all_yaml_files(endpoint_url: str, base_path: str = None) -> None:
     i2i_count = 0
 
     # 生成 LLM YAML 文件
-    llm_path = os.path.join(base_path, "models", "llm")
-    os.makedirs(llm_path, exist_ok=True)
-    for f in os.listdir(llm_path):
-        if f.endswith(".yaml"):
-            os.remove(os.path.join(llm_path, f))
-
+    llm_files = {}
     for model in models:
         model_type = model.get("model_type")
         if _model_type_contains(model_type, "llm") or _model_type_contains(
@@ -127,53 +127,40 @@ def generate_all_yaml_files(endpoint_url: str, base_path: str = None) -> None:
             model_name = model.get("model_name")
             context_size = model.get("context_size", 131072)
             safe_name = _make_safe_filename(model_name)
-            content = _generate_llm_yaml(model_name, model_type, context_size)
-            with open(
-                os.path.join(llm_path, f"{safe_name}.yaml"), "w", encoding="utf-8"
-            ) as f:
-                f.write(content)
+            llm_files[f"{safe_name}.yaml"] = _generate_llm_yaml(
+                model_name, model_type, context_size
+            )
             if _model_type_contains(model_type, "llm"):
                 llm_count += 1
             if _model_type_contains(model_type, "vlm"):
                 vlm_count += 1
+    _write_yaml_files(os.path.join(base_path, "models", "llm"), llm_files)
 
     # 生成 Embedding YAML 文件
-    embedding_path = os.path.join(base_path, "models", "embedding")
-    os.makedirs(embedding_path, exist_ok=True)
-    for f in os.listdir(embedding_path):
-        if f.endswith(".yaml"):
-            os.remove(os.path.join(embedding_path, f))
-
+    embedding_files = {}
     for model in models:
         if _model_type_contains(model.get("model_type"), "embedding"):
             model_name = model.get("model_name")
             context_size = model.get("context_size", 32768)
             safe_name = _make_safe_filename(model_name)
-            content = _generate_embedding_yaml(model_name, context_size)
-            with open(
-                os.path.join(embedding_path, f"{safe_name}.yaml"), "w", encoding="utf-8"
-            ) as f:
-                f.write(content)
+            embedding_files[f"{safe_name}.yaml"] = _generate_embedding_yaml(
+                model_name, context_size
+            )
             embedding_count += 1
+    _write_yaml_files(os.path.join(base_path, "models", "embedding"), embedding_files)
 
     # 生成 Reranker YAML 文件
-    reranker_path = os.path.join(base_path, "models", "reranker")
-    os.makedirs(reranker_path, exist_ok=True)
-    for f in os.listdir(reranker_path):
-        if f.endswith(".yaml"):
-            os.remove(os.path.join(reranker_path, f))
-
+    reranker_files = {}
     for model in models:
         if _model_type_contains(model.get("model_type"), "reranker"):
             model_name = model.get("model_name")
             context_size = model.get("context_size", 30720)
             safe_name = _make_safe_filename(model_name)
-            content = _generate_reranker_yaml(model_name, context_size)
-            with open(
-                os.path.join(reranker_path, f"{safe_name}.yaml"), "w", encoding="utf-8"
-            ) as f:
-                f.write(content)
+            reranker_files[f"{safe_name}.yaml"] = _generate_reranker_yaml(
+                model_name, context_size
+            )
             reranker_count += 1
+    _write_yaml_files(os.path.join(base_path, "models", "reranker"), reranker_files)
 
     # 生成文生图和图生图 Tool YAML
     _generate_tool_yaml_files(base_path, models)
@@ -215,7 +202,7 @@ def generate_all_yaml_files(endpoint_url: str, base_path: str = None) -> None:
 
 
 def _generate_tool_yaml_files(base_path: str, models: List[Dict[str, Any]]) -> None:
-    """生成文生图和图生图 Tool YAML"""
+    """生成文生图、批量文生图和图生图 Tool YAML"""
     t2i_models = []
     i2i_models = []
 
@@ -231,15 +218,51 @@ def _generate_tool_yaml_files(base_path: str, models: List[Dict[str, Any]]) -> N
         if _model_type_contains(model_type, "text2image"):
             t2i_models.append(model_name)
 
-    t2i_yaml = _build_tool_yaml("text2image", t2i_models, "Qwen-Image")
-    t2i_path = os.path.join(base_path, "tools", "text2image.yaml")
-    with open(t2i_path, "w", encoding="utf-8") as f:
-        f.write(t2i_yaml)
+    tools_path = os.path.join(base_path, "tools")
+    _write_yaml_file(
+        os.path.join(tools_path, "text2image.yaml"),
+        _build_tool_yaml("text2image", t2i_models, "Qwen-Image"),
+    )
+    _write_yaml_file(
+        os.path.join(tools_path, "image2image.yaml"),
+        _build_tool_yaml("image2image", i2i_models, "Qwen-Image-Edit"),
+    )
+    _write_yaml_file(
+        os.path.join(tools_path, "batch_text2image.yaml"),
+        _build_tool_yaml("batch_text2image", t2i_models, "Qwen-Image"),
+    )
+
+
+def _write_yaml_files(path: str, files: Dict[str, str]) -> None:
+    """
+    写入目录下的全部 YAML 文件，并删除不在 files 中的旧文件
+
+    先写新文件再删除旧文件，中途退出时目录中仍是完整的模型配置
+
+    Args:
+        path: 目录
+        files: 文件名 -> 内容
+    """
+    os.makedirs(path, exist_ok=True)
+    for name, content in files.items():
+        _write_yaml_file(os.path.join(path, name), content)
+    for name in os.listdir(path):
+        if name.endswith(".yaml") and name not in files:
+            os.remove(os.path.join(path, name))
 
-    i2i_yaml = _build_tool_yaml("image2image", i2i_models, "Qwen-Image-Edit")
-    i2i_path = os.path.join(base_path, "tools", "image2image.yaml")
-    with open(i2i_path, "w", encoding="utf-8") as f:
-        f.write(i2i_yaml)
+
+def _write_yaml_file(file_path: str, content: str) -> None:
+    """内容有变化时通过临时文件原子替换写入"""
+    try:
+        with open(file_path, encoding="utf-8") as f:
+            if f.read() == content:
+                return
+    except OSError:
+        pass
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, file_path)
 
 
 def _build_tool_yaml(tool_type: str, models: List[str], default_model: str) -> str:
@@ -317,6 +340,83 @@ parameters:
   required: false
   type: string
   default: "{{}}"
+"""
+    elif tool_type == "batch_text2image":
+        return f"""description:
+  human:
+    en_US: Generate images for multiple prompts concurrently with AIPing AI.
+    zh_CN: 使用AIPing AI 并发生成多条提示词的图像。
+  llm: This tool is used to generate images for a list of text prompts, or several variations of one prompt, concurrently using AIPing AI.
+extra:
+  python:
+    source: tools/batch_text2image.py
+identity:
+  author: AIping Writer
+  icon: icon.svg
+  label:
+    en_US: Batch Text to Image
+    zh_CN: 批量文生图
+  name: batch_text2image
+parameters:
+- form: llm
+  human_description:
+    en_US: The text prompts used to generate images, one per line or a JSON array of strings.
+    zh_CN: 用于生成图像的文本提示，每行一条或 JSON 字符串数组。
+  label:
+    en_US: Prompts
+    zh_CN: 提示词列表
+  llm_description: The prompts to generate images for, one per line or a JSON array of strings.
+  name: prompts
+  required: true
+  type: string
+- form: llm
+  human_description:
+    en_US: Number of variations to generate for each prompt. When extra_body contains an integer seed, each variation uses seed + index.
+    zh_CN: 每条提示词生成的变体数量。extra_body 中带整数 seed 时，每个变体使用 seed + 序号。
+  label:
+    en_US: Variations
+    zh_CN: 变体数量
+  llm_description: Number of variations to generate for each prompt.
+  name: count
+  required: false
+  type: number
+  default: 1
+  min: 1
+- form: llm
+  human_description:
+    en_US: The text negative prompt used to generate the images.
+    zh_CN: 用于生成图像的负向文本提示。
+  label:
+    en_US: Negative Prompt
+    zh_CN: 负向提示词
+  llm_description: This prompt text will be used to generate images.
+  name: negative_prompt
+  required: false
+  type: string
+- form: form
+  human_description:
+    en_US: Model to use for image generation (for details, please go to： https://aiping.cn/docs/product).
+    zh_CN: 用于图像生成的模型 (详情请前往：https://aiping.cn/docs/product)。
+  label:
+    en_US: Model
+    zh_CN: 模型
+  name: model
+  options:
+{options_str}
+  required: true
+  type: select
+  default: "{default_model}"
+- form: form
+  human_description:
+    en_US: Advanced parameters for image generation (for details, please go to： https://aiping.cn/docs/product).
+    zh_CN: 高级参数，用于图像生成 (详情请前往：https://aiping.cn/docs/product)。
+  label:
+    en_US: Extra Body
+    zh_CN: Extra Body
+  name: extra_body
+  required: false
+  type: string
+  default: "{{}}"
 """
     else:
         return f"""description:
@@ -482,6 +582,49 @@ parameter_rules:
   help:
     en_US: Whether to enable thinking mode for models that support it
     zh_Hans: 是否为支持思考模式的模型启用思考功能（部分模型可能不支持思考）
+- name: thinking_mode
+  label:
+    en_US: Thinking Mode
+    zh_Hans: 思考模式选择
+  type: string
+  default: manual
+  required: false
+  options:
+  - manual
+  - auto
+  help:
+    en_US: 'manual: follow Enable Thinking; auto: enable thinking for /think hints, tool calls or long prompts, and disable it for /no_think hints and short prompts'
+    zh_Hans: manual：按“启用思考模式”设置；auto：用户消息含 /think、带工具调用或提示词较长时启用思考，含 /no_think 或提示词较短时关闭思考
+- name: thinking_budget
+  label:
+    en_US: Thinking Budget
+    zh_Hans: 思考预算
+  type: int
+  min: 1
+  required: false
+  help:
+    en_US: Maximum number of reasoning tokens the upstream model may spend before answering (only sent when thinking is enabled)
+    zh_Hans: 上游模型在回答前最多使用的思考 token 数（仅在启用思考时发送）
+- name: max_reasoning_tokens
+  label:
+    en_US: Max Reasoning Tokens
+    zh_Hans: 最大思考 token 数
+  type: int
+  min: 1
+  required: false
+  help:
+    en_US: End the stream on the client side once the reasoning output reaches this many tokens
+    zh_Hans: 流式输出时思考内容达到该 token 数后，在客户端直接结束本次调用
+- name: max_duration
+  label:
+    en_US: Max Duration (s)
+    zh_Hans: 最长耗时（秒）
+  type: float
+  min: 1.0
+  required: false
+  help:
+    en_US: End the stream on the client side once the call has run for this many seconds
+    zh_Hans: 流式输出时调用耗时达到该秒数后，在客户端直接结束本次调用
 - name: sort
   label:
     en_US: Sort By
@@ -499,6 +642,15 @@ parameter_rules:
   help:
     en_US: 'Sort providers by: input_price, output_price, throughput, latency, or context_length'
     zh_Hans: 按以下方式排序供应商：input_price（输入价格）、output_price（输出价格）、throughput（吞吐量）、latency（延迟）或 context_length（上下文长度）
+- name: equivalent_models
+  label:
+    en_US: Equivalent Models (Auto-Fastest)
+    zh_Hans: 等价模型（自动选择最快）
+  type: string
+  required: false
+  help:
+    en_US: 'Comma-separated models that can stand in for this one, e.g. Qwen3-8B,Qwen3-14B. When set, each call goes to whichever of them (or this model) has been fastest for prompts of a similar length, based on latency, throughput and error statistics the plugin keeps in its storage'
+    zh_Hans: 以逗号分隔的、可以替代当前模型的模型，例如 Qwen3-8B,Qwen3-14B。设置后每次调用根据插件存储中记录的耗时、输出速度和错误率，选择其中（含当前模型）在相近长度提示词上最快的模型
 """
     return yaml_content
 
@@ -1,9 +1,31 @@
+import json
+
 from yarl import URL
 from dify_plugin.entities.model import EmbeddingInputType
+from dify_plugin.entities.model.text_embedding import TextEmbeddingResult
+from dify_plugin.interfaces.model.openai_compatible import text_embedding
 from dify_plugin.interfaces.model.openai_compatible.text_embedding import (
     OAICompatEmbeddingModel,
 )
 
+import config
+from utils import endpoints, memory, telemetry, tracing, transport, workload
+from utils.batching import MicroBatcher
+
+# 每条输入的响应内存占用，按 1024 维估算：JSON 文本约 20 字节/维，
+# 解析后的 float 对象和列表槽位约 32 字节/维
+_RESPONSE_BYTES_PER_INPUT = 1024 * 52
+
+# SDK 基类的请求也使用共享连接池
+transport.use_shared_session(text_embedding)
+
+# 并发的小批量 Embedding 请求按 endpoint、Key、模型、输入类型和用户合并
+_batcher = MicroBatcher(
+    window=config.EMBEDDING_BATCH_WINDOW_MS / 1000,
+    max_items=config.EMBEDDING_BATCH_MAX_ITEMS,
+    max_tokens=config.EMBEDDING_BATCH_MAX_TOKENS,
+)
+
 
 class AipingTextEmbeddingModel(OAICompatEmbeddingModel):
     """
@@ -19,9 +41,10 @@ class AipingTextEmbeddingModel(OAICompatEmbeddingModel):
             credentials: 认证信息字典
         """
         credentials["endpoint_url"] = str(
-            URL(credentials.get("endpoint_url", "https://aiping.cn/api/v1"))
+            URL(endpoints.register(credentials.get("endpoint_url", "https://aiping.cn/api/v1")))
         )
 
+    @endpoints.scoped
     def _invoke(
         self,
         model: str,
@@ -43,8 +66,121 @@ class AipingTextEmbeddingModel(OAICompatEmbeddingModel):
         Returns:
             TextEmbeddingResult
         """
-        self._add_custom_parameters(credentials)
-        return super()._invoke(model, credentials, texts, user, input_type)
+        capture = workload.start(
+            "embedding", model, input_type=input_type.value, **workload.text_sizes(texts)
+        )
+        # 请求体（及其压缩副本）和解析后的向量
+        footprint = sum(len(text) for text in texts) * 2 + len(texts) * _RESPONSE_BYTES_PER_INPUT
+        try:
+            with tracing.span("embedding.invoke", model=model, texts=len(texts)), memory.reserve(
+                "embedding", footprint
+            ):
+                self._add_custom_parameters(credentials)
+                if config.EMBEDDING_BATCH_WINDOW_MS > 0:
+                    result = self._invoke_batched(model, credentials, texts, user, input_type)
+                else:
+                    result = super()._invoke(model, credentials, texts, user, input_type)
+        except Exception as e:
+            if capture:
+                capture.finish(e)
+            raise
+        if capture:
+            capture.note(tokens=result.usage.tokens)
+            capture.finish()
+        return result
+
+    def _invoke_batched(
+        self,
+        model: str,
+        credentials: dict,
+        texts: list[str],
+        user: str | None,
+        input_type: EmbeddingInputType,
+    ) -> TextEmbeddingResult:
+        """
+        与其它并发请求合并后调用 Embedding 模型
+
+        上游接口接受文本列表，合并后的批次大小由 EMBEDDING_BATCH_MAX_ITEMS 控制，
+        不受模型配置中 max_chunks 的限制；输入本身超过批次上限时不合并，按原方式发送
+
+        Args:
+            model: 模型名称
+            credentials: 认证信息
+            texts: 文本列表
+            user: 用户标识（可选）
+            input_type: 输入类型
+
+        Returns:
+            TextEmbeddingResult
+        """
+        # 与 SDK 一致：超过上下文长度的文本按比例截断
+        context_size = self._get_context_size(model, credentials)
+        inputs = []
+        tokens = 0
+        for text in texts:
+            num_tokens = self._get_num_tokens_by_gpt2(text)
+            if num_tokens >= context_size:
+                text = text[: int(len(text) * context_size // num_tokens)]
+                num_tokens = context_size
+            inputs.append(text)
+            tokens += num_tokens
+
+        if not _batcher.fits(inputs, tokens):
+            return super()._invoke(model, credentials, texts, user, input_type)
+
+        def send(batch_inputs: list[str]) -> tuple[list[list[float]], int]:
+            telemetry.incr("embedding.batch_requests", model=model)
+            telemetry.incr("embedding.batch_inputs", len(batch_inputs), model=model)
+            return self._request_embeddings(model, credentials, batch_inputs, user)
+
+        key = (
+            credentials.get("endpoint_url"),
+            credentials.get("api_key"),
+            credentials.get("endpoint_model_name", model),
+            input_type,
+            user,
+        )
+        embeddings, used_tokens, callers = _batcher.submit(key, inputs, tokens, send)
+        tracing.current().set(batch_callers=callers)
+        telemetry.incr("embedding.batch_callers", model=model)
+
+        usage = self._calc_response_usage(
+            model=model, credentials=credentials, tokens=round(used_tokens)
+        )
+        return TextEmbeddingResult(embeddings=embeddings, usage=usage, model=model)
+
+    def _request_embeddings(
+        self, model: str, credentials: dict, inputs: list[str], user: str | None
+    ) -> tuple[list[list[float]], int]:
+        """
+        发送一次 /embeddings 请求
+
+        Returns:
+            (向量列表, 用量 token 数)
+        """
+        headers = {"Content-Type": "application/json"}
+        if credentials.get("api_key"):
+            headers["Authorization"] = f"Bearer {credentials['api_key']}"
+        payload = {
+            "input": inputs,
+            "model": credentials.get("endpoint_model_name", model),
+            "encoding_format": "float",
+        }
+        if user:
+            payload["user"] = user
+
+        response = transport.session().post(
+            self._join_endpoint_url(credentials.get("endpoint_url", ""), "embeddings"),
+            headers=headers,
+            data=json.dumps(payload),
+            timeout=(10, 300),
+        )
+        response.raise_for_status()
+        response_data = response.json()
+        return (
+            [data["embedding"] for data in response_data["data"]],
+            response_data["usage"]["total_tokens"],
+        )
 
     def get_num_tokens(self, model: str, credentials: dict, texts: list[str]) -> int:
         """
@@ -58,6 +194,7 @@ class AipingTextEmbeddingModel(OAICompatEmbeddingModel):
         self._add_custom_parameters(credentials)
         return super().get_num_tokens(model, credentials, texts)
 
+    @endpoints.scoped
     def validate_credentials(self, model: str, credentials: dict) -> None:
         """
         验证认证信息
@@ -1,13 +1,457 @@
+import base64
+import codecs
+import contextvars
+import hashlib
 import json
+import logging
+import re
+import threading
+import time
+import uuid
 from collections.abc import Generator
-from typing import Optional, Union
-from dify_plugin.entities.model.llm import LLMMode, LLMResult
-from dify_plugin.entities.model.message import PromptMessage, PromptMessageTool
+from contextlib import suppress
+from typing import Any, Optional, Union
+import requests
+from pydantic import TypeAdapter, ValidationError
+from dify_plugin.entities.model.llm import (
+    LLMMode,
+    LLMResult,
+    LLMResultChunk,
+    LLMResultChunkDelta,
+    LLMUsage,
+)
+from dify_plugin.entities.model import ModelFeature
+from dify_plugin.entities.model.message import (
+    AssistantPromptMessage,
+    ImagePromptMessageContent,
+    PromptMessage,
+    PromptMessageTool,
+    TextPromptMessageContent,
+    UserPromptMessage,
+)
 from yarl import URL
 from dify_plugin import OAICompatLargeLanguageModel
+from dify_plugin.interfaces.model.openai_compatible import llm as oai_llm
+import config
+from utils import endpoints, memory, routing, telemetry, tracing, transport, workload
+from utils.cache import LRUCache
+from utils.image import downscale_image
+from utils.semantic_cache import SemanticCache, scope_key
+
+logger = logging.getLogger(__name__)
+
+# SDK 基类的请求也使用共享连接池
+transport.use_shared_session(oai_llm)
+
+# 各视觉模型单张图片的像素上限，超过后上游也会缩放，提前缩小可以减少传输
+_VISION_MAX_PIXELS = {
+    "qwen2.5-vl": 1280 * 28 * 28,
+    "qwen3-vl": 1280 * 32 * 32,
+}
+
+# 相同图片在多轮对话中会重复发送，按内容哈希缓存预处理结果
+_vision_image_cache = LRUCache(config.VISION_IMAGE_CACHE_BYTES)
+
+# 语义缓存：相似的问题直接返回之前的回答，未配置 LLM_SEMANTIC_CACHE_MODEL 时不启用
+_semantic_cache = SemanticCache(
+    config.LLM_SEMANTIC_CACHE_MAX_ENTRIES,
+    config.LLM_SEMANTIC_CACHE_TTL,
+    config.LLM_SEMANTIC_CACHE_THRESHOLD,
+)
+_cache_embedding_model = None
+# 回答中的思考内容（<think> 标签包裹，未闭合时到结尾），语义缓存只保存回答
+_THINK_BLOCK = re.compile(r"<think>.*?(?:</think>|$)\s*", re.S)
+
+# 字符串内需要特殊处理的字符：引号、反斜杠和控制字符
+_JSON_STRING_SPECIAL = re.compile(r'["\\\x00-\x1f]')
+_JSON_LITERAL = re.compile(r"-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?|true|false|null")
+_JSON_LITERAL_CHARS = frozenset("0123456789+-.eEtrufalsn")
+_JSON_ESCAPE_CHARS = frozenset('"\\/bfnrtu')
+_JSON_HEX_CHARS = frozenset("0123456789abcdefABCDEF")
+
+
+def _strip_thinking(content: str) -> str:
+    """去掉回答中的思考内容"""
+    return _THINK_BLOCK.sub("", content).strip()
+
+
+def _estimate_tokens(text: str) -> float:
+    """按字符估算 token 数：ASCII 字符约 4 个一个 token，其它字符（如中文）约一个一个 token"""
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return ascii_chars / 4 + (len(text) - ascii_chars)
+
+
+class _StopSequenceScanner:
+    """
+    跨 chunk 边界检测停止词
+
+    可能是停止词前缀的尾部文本会暂存，直到下一个 chunk 确认是否命中
+    """
+
+    def __init__(self, stop: list[str]):
+        self._stop = [s for s in stop if s]
+        self._pending = ""
+
+    def feed(self, text: str) -> tuple[str, bool]:
+        """
+        输入新文本
+
+        Returns:
+            (可以安全输出的文本, 是否命中停止词)
+        """
+        buffer = self._pending + text
+        hit = -1
+        for s in self._stop:
+            index = buffer.find(s)
+            if index != -1 and (hit == -1 or index < hit):
+                hit = index
+        if hit != -1:
+            self._pending = ""
+            return buffer[:hit], True
+
+        # 保留可能是停止词前缀的最长尾部
+        keep = 0
+        for s in self._stop:
+            for n in range(min(len(s) - 1, len(buffer)), keep, -1):
+                if buffer.endswith(s[:n]):
+                    keep = n
+                    break
+        self._pending = buffer[len(buffer) - keep :]
+        return buffer[: len(buffer) - keep], False
+
+    def flush(self) -> str:
+        """流结束时取出暂存的尾部"""
+        pending, self._pending = self._pending, ""
+        return pending
+
+
+class _JsonTerminator:
+    """
+    检测结构化输出中顶层 JSON 值的结束位置
+
+    JSON 位于 ``` 代码块中时，结束位置延后到闭合的 ``` 之后，避免留下未闭合的代码块
+    """
+
+    def __init__(self):
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._fenced = False
+        self._closing_fence = False
+        # 最近 3 个 JSON 以外的字符，用于识别 ```
+        self._tail = ""
+
+    def feed(self, text: str) -> int:
+        """
+        输入新文本
+
+        Returns:
+            顶层 JSON（在代码块中时为闭合的 ```）结束后的下一个字符下标，未结束返回 -1
+        """
+        for i, ch in enumerate(text):
+            if self._closing_fence or (not self._started and ch not in "{["):
+                self._tail = (self._tail + ch)[-3:]
+                if self._tail == "```":
+                    if self._closing_fence:
+                        return i + 1
+                    self._fenced = True
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._started = True
+                self._depth += 1
+            elif ch in "}]" and self._started:
+                self._depth -= 1
+                if self._depth == 0:
+                    if not self._fenced:
+                        return i + 1
+                    self._closing_fence = True
+                    self._tail = ""
+        return -1
+
+
+class _IncrementalJsonValidator:
+    """
+    增量校验 JSON 文本
+
+    每个片段只扫描一次，发现非法字符立即抛出 ValueError；顶层值闭合后 complete 为 True
+    """
+
+    def __init__(self):
+        self._stack: list[str] = []
+        # 期望的下一个语法单元：value / value_or_end / key / key_or_end / colon / comma / done
+        self._expect = "value"
+        self._in_string = False
+        self._string_is_key = False
+        self._escape = False
+        self._unicode_left = 0
+        self._literal: list[str] = []
+        self._pos = 0
+        self.complete = False
+
+    def feed(self, text: str) -> bool:
+        """
+        输入新片段
+
+        Returns:
+            顶层 JSON 值是否已闭合
+        """
+        i = 0
+        n = len(text)
+        while i < n:
+            if self._in_string:
+                i = self._scan_string(text, i)
+                continue
+            ch = text[i]
+            if self._literal:
+                if ch in _JSON_LITERAL_CHARS:
+                    self._literal.append(ch)
+                    i += 1
+                    continue
+                self._finish_literal()
+            self._feed_char(ch)
+            i += 1
+        self._pos += n
+        return self.complete
+
+    def _scan_string(self, text: str, i: int) -> int:
+        """扫描字符串内部，普通字符整段跳过"""
+        if self._unicode_left:
+            if text[i] not in _JSON_HEX_CHARS:
+                self._fail(text[i])
+            self._unicode_left -= 1
+            return i + 1
+        if self._escape:
+            if text[i] not in _JSON_ESCAPE_CHARS:
+                self._fail(text[i])
+            self._escape = False
+            if text[i] == "u":
+                self._unicode_left = 4
+            return i + 1
+        match = _JSON_STRING_SPECIAL.search(text, i)
+        if match is None:
+            return len(text)
+        j = match.start()
+        ch = text[j]
+        if ch == "\\":
+            self._escape = True
+        elif ch == '"':
+            self._in_string = False
+            if self._string_is_key:
+                self._expect = "colon"
+            else:
+                self._after_value()
+        else:
+            self._fail(ch)
+        return j + 1
+
+    def _feed_char(self, ch: str) -> None:
+        if ch in " \t\r\n":
+            return
+        expect = self._expect
+        if expect in ("value", "value_or_end"):
+            if expect == "value_or_end" and ch == "]":
+                self._close(ch)
+            elif ch in "{[":
+                self._stack.append(ch)
+                self._expect = "key_or_end" if ch == "{" else "value_or_end"
+            elif ch == '"':
+                self._in_string = True
+                self._string_is_key = False
+            elif ch in _JSON_LITERAL_CHARS:
+                self._literal.append(ch)
+            else:
+                self._fail(ch)
+        elif expect in ("key", "key_or_end"):
+            if expect == "key_or_end" and ch == "}":
+                self._close(ch)
+            elif ch == '"':
+                self._in_string = True
+                self._string_is_key = True
+            else:
+                self._fail(ch)
+        elif expect == "colon" and ch == ":":
+            self._expect = "value"
+        elif expect == "comma" and ch == ",":
+            self._expect = "key" if self._stack[-1] == "{" else "value"
+        elif expect == "comma" and ch in "}]":
+            self._close(ch)
+        else:
+            self._fail(ch)
+
+    def _finish_literal(self) -> None:
+        literal = "".join(self._literal)
+        self._literal = []
+        if not _JSON_LITERAL.fullmatch(literal):
+            raise ValueError(f"非法 JSON 字面量 {literal!r}")
+        self._after_value()
+
+    def _close(self, ch: str) -> None:
+        if self._stack.pop() != ("{" if ch == "}" else "["):
+            self._fail(ch)
+        self._after_value()
+
+    def _after_value(self) -> None:
+        if self._stack:
+            self._expect = "comma"
+        else:
+            self._expect = "done"
+            self.complete = True
+
+    def _fail(self, ch: str) -> None:
+        raise ValueError(f"非法 JSON 字符 {ch!r}（此前已接收 {self._pos} 个字符）")
+
+
+class _PendingToolCall:
+    """组装中的单个工具调用，参数片段追加到列表，闭合时只拼接一次"""
+
+    def __init__(self, tool_call_id: str, tool_type: str, name: str):
+        self.id = tool_call_id
+        self.type = tool_type or "function"
+        self.name = name
+        self.fragments: list[str] = []
+        self.validator: Optional[_IncrementalJsonValidator] = (
+            _IncrementalJsonValidator()
+        )
+        self.emitted = False
+
+    def to_tool_call(self) -> AssistantPromptMessage.ToolCall:
+        return AssistantPromptMessage.ToolCall(
+            id=self.id,
+            type=self.type,
+            function=AssistantPromptMessage.ToolCall.ToolCallFunction(
+                name=self.name,
+                arguments="".join(self.fragments),
+            ),
+        )
+
+
+class _ToolCallAssembler:
+    """
+    增量组装流式工具调用
+
+    每个工具调用的参数在流式过程中逐片段校验，参数 JSON 闭合后立即返回该工具调用，
+    调用方无需等待整个响应结束
+    """
+
+    def __init__(self):
+        self._calls: list[_PendingToolCall] = []
+        self._by_key: dict[Any, _PendingToolCall] = {}
+
+    def feed(self, delta_tool_calls: list[dict]) -> list[AssistantPromptMessage.ToolCall]:
+        """
+        输入 delta 中的工具调用片段
+
+        Returns:
+            本次新完成的工具调用
+        """
+        completed = []
+        for delta_tool_call in delta_tool_calls:
+            function = delta_tool_call.get("function") or {}
+            call = self._get_call(delta_tool_call, function)
+            if call is None:
+                continue
+            if function.get("name"):
+                call.name = function["name"]
+            arguments = function.get("arguments")
+            if not arguments:
+                continue
+            call.fragments.append(arguments)
+            if call.emitted or call.validator is None:
+                continue
+            try:
+                if call.validator.feed(arguments):
+                    call.emitted = True
+                    completed.append(call.to_tool_call())
+            except ValueError as e:
+                # 参数已确定非法，后续片段只拼接不再校验，流结束时原样返回
+                call.validator = None
+                telemetry.incr("llm.tool_call_invalid", tool=call.name)
+                logger.warning(f"Malformed arguments for tool call {call.name}: {e}")
+        return completed
+
+    def drain(self) -> list[AssistantPromptMessage.ToolCall]:
+        """流结束时返回尚未输出的工具调用"""
+        remaining = [call.to_tool_call() for call in self._calls if not call.emitted]
+        for call in self._calls:
+            call.emitted = True
+        return remaining
+
+    def _get_call(self, delta_tool_call: dict, function: dict) -> Optional[_PendingToolCall]:
+        tool_call_id = delta_tool_call.get("id")
+        key = delta_tool_call.get("index")
+        if key is None:
+            key = tool_call_id
+        if key is None:
+            # 既没有 index 也没有 id 的片段属于最近一个工具调用
+            if not function.get("name"):
+                return self._calls[-1] if self._calls else None
+            key = len(self._calls)
+
+        call = self._by_key.get(key)
+        if call is None:
+            call = _PendingToolCall(
+                tool_call_id or f"chatcmpl-tool-{uuid.uuid4().hex}",
+                delta_tool_call.get("type", ""),
+                function.get("name", ""),
+            )
+            self._by_key[key] = call
+            self._calls.append(call)
+        elif tool_call_id and not call.emitted:
+            call.id = tool_call_id
+        return call
+
+
+class _StreamLimits:
+    """单次流式调用的客户端终止条件"""
+
+    def __init__(
+        self,
+        stop: Optional[list[str]] = None,
+        max_reasoning_tokens: Optional[int] = None,
+        max_duration: Optional[float] = None,
+        json_output: bool = False,
+    ):
+        self.stop = stop or []
+        self.max_reasoning_tokens = max_reasoning_tokens or None
+        self.deadline = time.monotonic() + max_duration if max_duration else None
+        self.json_output = json_output
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+
+class _CallState:
+    """单次调用在插件内使用的状态，不随 credentials 传递，也不发送给上游"""
+
+    __slots__ = ("limits", "observation")
+
+    def __init__(
+        self,
+        limits: Optional[_StreamLimits] = None,
+        observation: Optional[routing.Observation] = None,
+    ):
+        self.limits = limits or _StreamLimits()
+        self.observation = observation
+
+
+# 调用 SDK 期间的当前调用状态，SDK 同步调用响应处理方法时从这里读取
+_call_state: contextvars.ContextVar[Optional[_CallState]] = contextvars.ContextVar(
+    "llm_call_state", default=None
+)
 
 
 class AipingLargeLanguageModel(OAICompatLargeLanguageModel):
+    @endpoints.scoped
     def _invoke(
         self,
         model: str,
@@ -34,48 +478,952 @@ class AipingLargeLanguageModel(OAICompatLargeLanguageModel):
         Returns:
             LLMResult 或 Generator
         """
+        # 开启负载录制时记录请求形态、耗时和 token 数
+        capture = workload.start(
+            "llm",
+            model,
+            messages=[self._message_shape(m) for m in prompt_messages],
+            tools=len(tools or []),
+            stop=len(stop or []),
+            stream=stream,
+            params=workload.model_params(model_parameters),
+        )
+        if capture is None:
+            return self._invoke_model(
+                model, credentials, prompt_messages, model_parameters, tools, stop, stream, user
+            )
+        try:
+            with capture:
+                result = self._invoke_model(
+                    model, credentials, prompt_messages, model_parameters, tools, stop, stream, user
+                )
+        except Exception as e:
+            capture.finish(e)
+            raise
+        if stream:
+            return capture.wrap(result)
+        capture.note(
+            prompt_tokens=result.usage.prompt_tokens,
+            completion_tokens=result.usage.completion_tokens,
+        )
+        capture.finish()
+        return result
 
-        # 构建 extra_body，整合 enable_thinking 和 sort 字段
-        extra_body = {}
-        
-        # 处理 enable_thinking 字段
-        if "enable_thinking" in model_parameters:
-            extra_body["enable_thinking"] = model_parameters.pop("enable_thinking")
-        
-        # 处理 sort 字段
-        if "sort" in model_parameters:
-            sort_value = model_parameters.pop("sort")
-            if sort_value and sort_value != "none":
-                extra_body["provider"] = {
-                    "only": [],
-                    "order": [],
-                    "sort": sort_value,
-                    "input_price_range": [],
-                    "output_price_range": [],
-                    "throughput_range": [],
-                    "latency_range": [],
-                    "input_length_range": [],
-                    "allow_filter_prompt_length": True,
-                    "ignore": [],
-                    "allow_fallbacks": True
-                }
-        
-        # 如果 extra_body 不为空，添加到 model_parameters
-        if extra_body:
-            model_parameters["extra_body"] = extra_body
+    def _invoke_model(
+        self,
+        model: str,
+        credentials: dict,
+        prompt_messages: list[PromptMessage],
+        model_parameters: dict,
+        tools: Optional[list[PromptMessageTool]],
+        stop: Optional[list[str]],
+        stream: bool,
+        user: Optional[str],
+    ) -> Union[LLMResult, Generator]:
+        """调用 LLM，参数见 _invoke"""
+        with tracing.span("llm.invoke", model=model, stream=stream) as span:
+            # 语义缓存命中时不调用上游，按调用方选择的模型和原始参数划分范围
+            cache_key = self._semantic_cache_key(
+                model, credentials, prompt_messages, model_parameters, tools
+            )
+            if cache_key is not None:
+                cached = _semantic_cache.get(*cache_key)
+                if cached is not None:
+                    span.set(semantic_cache="hit")
+                    workload.note(semantic_cache="hit")
+                    return self._cached_result(model, prompt_messages, cached[0], stream)
 
-        self._add_custom_parameters(credentials)
-        return super()._invoke(
+            # 参数整理、凭证补全和图片预处理
+            with tracing.span("llm.prepare"):
+                # 按插件记录的统计在等价模型中选择最快的模型，统计按提示词的估算 token 数分档
+                prompt_tokens = self._estimate_prompt_tokens(prompt_messages, tools)
+                equivalent_models = model_parameters.pop("equivalent_models", None)
+                if equivalent_models:
+                    candidates = [model] + [
+                        m.strip() for m in equivalent_models.split(",") if m.strip()
+                    ]
+                    model = routing.choose(model, list(dict.fromkeys(candidates)), prompt_tokens)
+                    workload.note(routed_model=model)
+
+                # 构建 extra_body，整合 enable_thinking 和 sort 字段
+                extra_body = {}
+
+                # 处理 enable_thinking 字段
+                if "enable_thinking" in model_parameters:
+                    extra_body["enable_thinking"] = model_parameters.pop("enable_thinking")
+
+                # 自动思考模式：根据显式提示、工具和提示词长度决定是否启用思考
+                if model_parameters.pop("thinking_mode", "manual") == "auto":
+                    extra_body["enable_thinking"] = self._auto_enable_thinking(
+                        prompt_messages, tools
+                    )
+                    telemetry.incr(
+                        "llm.thinking_auto", model=model, enabled=extra_body["enable_thinking"]
+                    )
+
+                # 处理 thinking_budget 字段，关闭思考时不发送
+                thinking_budget = model_parameters.pop("thinking_budget", None)
+                if thinking_budget and extra_body.get("enable_thinking", True):
+                    extra_body["thinking_budget"] = thinking_budget
+
+                # 处理 sort 字段
+                if "sort" in model_parameters:
+                    sort_value = model_parameters.pop("sort")
+                    if sort_value and sort_value != "none":
+                        extra_body["provider"] = {
+                            "only": [],
+                            "order": [],
+                            "sort": sort_value,
+                            "input_price_range": [],
+                            "output_price_range": [],
+                            "throughput_range": [],
+                            "latency_range": [],
+                            "input_length_range": [],
+                            "allow_filter_prompt_length": True,
+                            "ignore": [],
+                            "allow_fallbacks": True
+                        }
+
+                # 如果 extra_body 不为空，添加到 model_parameters
+                if extra_body:
+                    model_parameters["extra_body"] = extra_body
+
+                # 客户端终止条件仅在插件内使用，不发送给上游
+                limits = _StreamLimits(
+                    stop=stop,
+                    max_reasoning_tokens=model_parameters.pop("max_reasoning_tokens", None),
+                    max_duration=model_parameters.pop("max_duration", None),
+                    json_output=model_parameters.get("response_format")
+                    in ("json_object", "json_schema"),
+                )
+
+                self._add_custom_parameters(credentials)
+                if config.VISION_IMAGE_MAX_SIDE > 0 and self._supports_vision(
+                    model, credentials
+                ):
+                    prompt_messages = self._prepare_vision_images(model, prompt_messages)
+
+            # 记录耗时、输出速度和错误，响应处理中补充上游返回的供应商
+            observation = routing.Observation(model, prompt_tokens)
+
+            # 发送请求直到收到响应头，流式响应的读取和解析计入 llm.invoke；
+            # 请求体序列化和压缩期间按提示词大小预留内存
+            state_token = _call_state.set(_CallState(limits, observation))
+            try:
+                with tracing.span("llm.request"), memory.reserve(
+                    "llm.request", self._estimate_request_bytes(prompt_messages, tools)
+                ):
+                    result = super()._invoke(
+                        model,
+                        credentials,
+                        prompt_messages,
+                        model_parameters,
+                        tools,
+                        stop,
+                        stream,
+                        user,
+                    )
+            except Exception:
+                observation.finish(False)
+                raise
+            finally:
+                _call_state.reset(state_token)
+            if stream:
+                if cache_key is not None:
+                    result = self._cache_stream_answer(cache_key, result)
+                return span.wrap(observation.wrap(result))
+            observation.finish(True, result.usage.completion_tokens)
+            if (
+                cache_key is not None
+                and isinstance(result.message.content, str)
+                and not result.message.tool_calls
+            ):
+                answer = _strip_thinking(result.message.content)
+                if answer:
+                    _semantic_cache.put(*cache_key, answer)
+            return result
+
+    @staticmethod
+    def _message_shape(message: PromptMessage) -> dict:
+        """消息的角色、文本长度和图片数，用于负载录制"""
+        images = (
+            sum(isinstance(c, ImagePromptMessageContent) for c in message.content)
+            if isinstance(message.content, list)
+            else 0
+        )
+        shape = {"role": message.role.value, "chars": len(message.get_text_content())}
+        if images:
+            shape["images"] = images
+        return shape
+
+    def _semantic_cache_key(
+        self,
+        model: str,
+        credentials: dict,
+        prompt_messages: list[PromptMessage],
+        model_parameters: dict,
+        tools: Optional[list[PromptMessageTool]],
+    ) -> Optional[tuple[str, list[float]]]:
+        """
+        计算语义缓存的范围和最后一条用户消息的向量
+
+        只缓存不带工具、最后一条为纯文本用户消息的调用。范围包含模型、API Key、
+        之前的全部消息（含系统提示词）和模型参数，多轮对话中相同的追问不会命中其它对话的回答
+
+        Args:
+            model: 模型名称
+            credentials: 认证信息
+            prompt_messages: 提示消息列表
+            model_parameters: 模型参数
+            tools: 工具列表
+
+        Returns:
+            (范围, 向量)，不使用语义缓存或 Embedding 调用失败时返回 None
+        """
+        if not config.LLM_SEMANTIC_CACHE_MODEL or tools or not prompt_messages:
+            return None
+        last = prompt_messages[-1]
+        if not isinstance(last, UserPromptMessage) or (
+            isinstance(last.content, list)
+            and not all(isinstance(c, TextPromptMessageContent) for c in last.content)
+        ):
+            return None
+        text = last.get_text_content().strip()
+        if not text:
+            return None
+
+        scope = scope_key(
             model,
-            credentials,
-            prompt_messages,
+            credentials.get("endpoint_url"),
+            hashlib.sha256((credentials.get("api_key") or "").encode()).hexdigest(),
+            [m.model_dump(mode="json") for m in prompt_messages[:-1]],
             model_parameters,
-            tools,
-            stop,
-            stream,
-            user,
+            config.LLM_SEMANTIC_CACHE_MODEL,
+        )
+        try:
+            with tracing.span("llm.semantic_cache_embed"):
+                vector = self._embed_for_cache(credentials, text)
+        except Exception as e:
+            telemetry.incr("llm.semantic_cache", result="error")
+            logger.warning(f"Semantic cache embedding failed, calling {model} directly: {e}")
+            return None
+        return scope, vector
+
+    @staticmethod
+    def _embed_for_cache(credentials: dict, text: str) -> list[float]:
+        """
+        使用 LLM_SEMANTIC_CACHE_MODEL 计算问题的向量，与 LLM 使用相同的 API 地址和 Key
+
+        Args:
+            credentials: LLM 的认证信息
+            text: 最后一条用户消息
+
+        Returns:
+            向量
+        """
+        global _cache_embedding_model
+        if _cache_embedding_model is None:
+            # 延迟导入，避免模型类之间在加载时相互依赖
+            from models.embedding.embedding import AipingTextEmbeddingModel
+
+            _cache_embedding_model = AipingTextEmbeddingModel(model_schemas=[])
+        embedding_credentials = {
+            "api_key": credentials.get("api_key"),
+            "endpoint_url": credentials.get("endpoint_url", "https://aiping.cn/api/v1"),
+        }
+        _cache_embedding_model._add_custom_parameters(embedding_credentials)
+        embeddings, _ = _cache_embedding_model._request_embeddings(
+            config.LLM_SEMANTIC_CACHE_MODEL,
+            embedding_credentials,
+            [text[: config.LLM_SEMANTIC_CACHE_MAX_CHARS]],
+            None,
+        )
+        return embeddings[0]
+
+    @staticmethod
+    def _cached_result(
+        model: str, prompt_messages: list[PromptMessage], answer: str, stream: bool
+    ) -> Union[LLMResult, Generator]:
+        """
+        把缓存的回答包装为调用结果，未调用上游，用量为 0
+
+        Args:
+            model: 模型名称
+            prompt_messages: 提示消息列表
+            answer: 缓存的回答
+            stream: 是否流式返回
+
+        Returns:
+            LLMResult 或只有一个分块的生成器
+        """
+        message = AssistantPromptMessage(content=answer)
+        if not stream:
+            return LLMResult(
+                model=model,
+                prompt_messages=prompt_messages,
+                message=message,
+                usage=LLMUsage.empty_usage(),
+            )
+        return iter(
+            [
+                LLMResultChunk(
+                    model=model,
+                    prompt_messages=prompt_messages,
+                    delta=LLMResultChunkDelta(
+                        index=0,
+                        message=message,
+                        usage=LLMUsage.empty_usage(),
+                        finish_reason="stop",
+                    ),
+                )
+            ]
+        )
+
+    @staticmethod
+    def _cache_stream_answer(
+        cache_key: tuple[str, list[float]], chunks: Generator
+    ) -> Generator:
+        """
+        透传流式结果，正常结束（finish_reason 为 stop）且没有工具调用时缓存完整回答，
+        思考内容不缓存
+
+        Args:
+            cache_key: 语义缓存的范围和向量
+            chunks: 流式结果
+
+        Returns:
+            透传分块的生成器
+        """
+        parts = []
+        cacheable = True
+        finish_reason = None
+        for chunk in chunks:
+            message = chunk.delta.message
+            if message.tool_calls or not isinstance(message.content, (str, type(None))):
+                cacheable = False
+            elif message.content:
+                parts.append(message.content)
+            finish_reason = chunk.delta.finish_reason or finish_reason
+            yield chunk
+        answer = _strip_thinking("".join(parts)) if cacheable and finish_reason == "stop" else ""
+        if answer:
+            _semantic_cache.put(*cache_key, answer)
+
+    @staticmethod
+    def _estimate_prompt_tokens(
+        prompt_messages: list[PromptMessage], tools: Optional[list[PromptMessageTool]]
+    ) -> int:
+        """
+        按消息和工具定义的文本估算提示词 token 数，不计入图片
+
+        Args:
+            prompt_messages: 提示消息列表
+            tools: 工具列表
+
+        Returns:
+            估算的 token 数
+        """
+        tokens = sum(_estimate_tokens(message.get_text_content()) for message in prompt_messages)
+        tokens += sum(
+            _estimate_tokens(tool.name + tool.description + json.dumps(tool.parameters))
+            for tool in tools or []
+        )
+        return round(tokens)
+
+    @staticmethod
+    def _estimate_request_bytes(
+        prompt_messages: list[PromptMessage], tools: Optional[list[PromptMessageTool]]
+    ) -> int:
+        """
+        估算发送请求时的内存占用：序列化后的请求体和压缩副本，约为消息内容的两倍
+
+        Args:
+            prompt_messages: 提示消息列表
+            tools: 工具列表
+
+        Returns:
+            字节数
+        """
+        size = sum(len(json.dumps(tool.parameters)) for tool in tools or [])
+        for message in prompt_messages:
+            if isinstance(message.content, str):
+                size += len(message.content)
+            elif isinstance(message.content, list):
+                size += sum(len(getattr(content, "data", "") or "") for content in message.content)
+        return size * 2
+
+    def _supports_vision(self, model: str, credentials: dict) -> bool:
+        """
+        判断模型是否支持视觉输入
+
+        Args:
+            model: 模型名称
+            credentials: 认证信息
+
+        Returns:
+            是否支持视觉输入
+        """
+        if credentials.get("vision_support") == "support":
+            return True
+        model_schema = self.get_model_schema(model, credentials)
+        return bool(
+            model_schema
+            and model_schema.features
+            and ModelFeature.VISION in model_schema.features
+        )
+
+    def _prepare_vision_images(
+        self, model: str, prompt_messages: list[PromptMessage]
+    ) -> list[PromptMessage]:
+        """
+        缩小并重新编码消息中内联的 base64 图片
+
+        远程 URL 图片由上游直接拉取，不在插件内处理
+
+        Args:
+            model: 模型名称
+            prompt_messages: 提示消息列表
+
+        Returns:
+            处理后的提示消息列表
+        """
+        max_pixels = next(
+            (
+                pixels
+                for prefix, pixels in _VISION_MAX_PIXELS.items()
+                if model.lower().startswith(prefix)
+            ),
+            None,
+        )
+        saved_bytes = 0
+        prepared_messages = []
+        for message in prompt_messages:
+            if not isinstance(message.content, list):
+                prepared_messages.append(message)
+                continue
+            contents = []
+            for content in message.content:
+                if isinstance(content, ImagePromptMessageContent):
+                    content, saved = self._downscale_image_content(content, max_pixels)
+                    saved_bytes += saved
+                contents.append(content)
+            prepared_messages.append(message.model_copy(update={"content": contents}))
+
+        if saved_bytes:
+            telemetry.incr("llm.vision_bytes_saved", saved_bytes, model=model)
+            logger.info(f"Recompressed vision images for {model}, saved {saved_bytes} bytes")
+        return prepared_messages
+
+    @staticmethod
+    def _downscale_image_content(
+        content: ImagePromptMessageContent, max_pixels: Optional[int]
+    ) -> tuple[ImagePromptMessageContent, int]:
+        """
+        缩小单张图片，结果按原图内容哈希缓存
+
+        Args:
+            content: 图片内容
+            max_pixels: 模型的像素上限（可选）
+
+        Returns:
+            (处理后的图片内容, 节省的字节数)
+        """
+        if content.base64_data:
+            b64_data = content.base64_data
+        elif content.url.startswith("data:"):
+            b64_data = content.url.partition(",")[2]
+        else:
+            return content, 0
+
+        key = (hashlib.sha256(b64_data.encode()).hexdigest(), max_pixels)
+        cached = _vision_image_cache.get(key)
+        if cached is None:
+            result = None
+            with suppress(Exception):
+                result = downscale_image(
+                    base64.b64decode(b64_data),
+                    config.VISION_IMAGE_MAX_SIDE,
+                    max_pixels,
+                    config.VISION_IMAGE_FORMAT,
+                    config.VISION_IMAGE_QUALITY,
+                )
+            # 无法缩小的图片也缓存结果，避免每轮对话重复解码
+            cached = (result[0], base64.b64encode(result[1]).decode()) if result else ("", "")
+            _vision_image_cache.put(key, cached, len(cached[1]) + len(key[0]))
+
+        mime_type, new_b64_data = cached
+        if not new_b64_data:
+            return content, 0
+        return (
+            content.model_copy(
+                update={
+                    "base64_data": new_b64_data,
+                    "url": "",
+                    "mime_type": mime_type,
+                    "format": mime_type.split("/")[-1],
+                }
+            ),
+            len(b64_data) - len(new_b64_data),
         )
 
+    def _handle_generate_stream_response(
+        self,
+        model: str,
+        credentials: dict,
+        response: requests.Response,
+        prompt_messages: list[PromptMessage],
+    ) -> Generator:
+        """
+        处理流式响应
+
+        SDK 在发出请求后同步调用本方法，此时读取当前调用的状态，由生成器显式持有
+
+        Args:
+            model: 模型名称
+            credentials: 认证信息
+            response: 流式响应
+            prompt_messages: 提示消息列表
+
+        Returns:
+            LLMResultChunk 生成器
+        """
+        state = _call_state.get() or _CallState()
+        return self._stream_response(
+            model, credentials, response, prompt_messages, state.limits, state.observation
+        )
+
+    def _stream_response(
+        self,
+        model: str,
+        credentials: dict,
+        response: requests.Response,
+        prompt_messages: list[PromptMessage],
+        limits: _StreamLimits,
+        observation: Optional[routing.Observation],
+    ) -> Generator:
+        """
+        读取流式响应
+
+        在命中停止词、结构化输出结束、思考 token 预算或时间预算耗尽时立即关闭上游连接，
+        不再等待上游自然结束；max_tokens 由上游执行，客户端不按估算值截断回答
+
+        Args:
+            model: 模型名称
+            credentials: 认证信息
+            response: 流式响应
+            prompt_messages: 提示消息列表
+            limits: 客户端终止条件
+            observation: 路由统计，响应中带有供应商时补充
+
+        Returns:
+            LLMResultChunk 生成器
+        """
+        scanner = _StopSequenceScanner(limits.stop) if limits.stop else None
+        terminator = _JsonTerminator() if limits.json_output else None
+
+        # 等待上游数据时也要遵守时间预算，到期后由定时器关闭连接以打断阻塞读取
+        timer = None
+        if limits.deadline is not None:
+            timer = threading.Timer(
+                max(limits.deadline - time.monotonic(), 0), response.close
+            )
+            timer.daemon = True
+            timer.start()
+
+        chunk_index = 0
+        full_assistant_content = ""
+        tool_call_assembler = _ToolCallAssembler()
+        finish_reason = None
+        usage = None
+        is_reasoning_started = False
+        # 按增量文本估算的思考和回答 token 数，上游返回 usage 时以其为准
+        reasoning_tokens_estimate = 0.0
+        answer_tokens_estimate = 0.0
+        stopped_early = False
+        # 命中停止词或结构化输出结束时，停止词扫描器暂存的尾部不再输出
+        stop_matched = False
+        function_calling_type = credentials.get("function_calling_type", "no_call")
+        delimiter = credentials.get("stream_mode_delimiter", "\n\n")
+        delimiter = codecs.decode(delimiter, "unicode_escape")
+
+        try:
+            lines = response.iter_lines(decode_unicode=True, delimiter=delimiter)
+            while True:
+                try:
+                    raw_chunk = next(lines, None)
+                except Exception:
+                    if not limits.expired():
+                        raise
+                    raw_chunk = None
+                if raw_chunk is None:
+                    if limits.expired():
+                        finish_reason = "timeout"
+                        stopped_early = True
+                    break
+
+                chunk = raw_chunk.strip()
+                if not chunk or chunk.startswith(":"):
+                    continue
+                decoded_chunk = chunk.removeprefix("data:").lstrip()
+                if decoded_chunk == "[DONE]":
+                    continue
+
+                try:
+                    chunk_json: dict = TypeAdapter(dict[str, Any]).validate_json(
+                        decoded_chunk
+                    )
+                except ValidationError:
+                    finish_reason = "Non-JSON encountered."
+                    break
+                if chunk_json.get("error") and chunk_json.get("choices") is None:
+                    raise ValueError(chunk_json.get("error"))
+
+                chunk_usage = chunk_json.get("usage")
+                if chunk_usage:
+                    usage = chunk_usage
+                if observation and chunk_json.get("provider"):
+                    observation.provider = chunk_json["provider"]
+                if not chunk_json.get("choices"):
+                    if chunk_usage:
+                        reasoning_tokens_estimate, answer_tokens_estimate = self._usage_tokens(
+                            chunk_usage, reasoning_tokens_estimate, answer_tokens_estimate
+                        )
+                    continue
+
+                choice = chunk_json["choices"][0]
+                finish_reason = choice.get("finish_reason")
+                chunk_index += 1
+
+                completed_tool_calls = []
+                if "delta" in choice:
+                    delta = choice["delta"]
+                    reasoning_parts = (
+                        delta.get("reasoning_content"),
+                        delta.get("reasoning"),
+                    )
+                    has_tool_call = any(
+                        delta.get(key) for key in ("tool_calls", "function_call")
+                    )
+                    if (
+                        is_reasoning_started
+                        and "" in reasoning_parts
+                        and not any(reasoning_parts)
+                        and not delta.get("content")
+                        and not has_tool_call
+                    ):
+                        thinking, content = "", ""
+                    else:
+                        thinking, content, is_reasoning_started = (
+                            self._split_thinking(delta, is_reasoning_started)
+                        )
+                    reasoning_text = next((p for p in reasoning_parts if p), None)
+                    if isinstance(reasoning_text, str):
+                        reasoning_tokens_estimate += _estimate_tokens(reasoning_text)
+
+                    assistant_message_tool_calls = None
+                    if "tool_calls" in delta and function_calling_type == "tool_call":
+                        assistant_message_tool_calls = delta.get("tool_calls", None)
+                    elif (
+                        "function_call" in delta
+                        and function_calling_type == "function_call"
+                    ):
+                        assistant_message_tool_calls = [
+                            {
+                                "id": "tool_call_id",
+                                "type": "function",
+                                "function": delta.get("function_call", {}),
+                            }
+                        ]
+                    if assistant_message_tool_calls:
+                        completed_tool_calls = tool_call_assembler.feed(
+                            assistant_message_tool_calls
+                        )
+                elif "text" in choice:
+                    thinking, content = "", choice.get("text") or ""
+                else:
+                    continue
+
+                if content:
+                    answer_tokens_estimate += _estimate_tokens(content)
+                    if scanner:
+                        content, hit = scanner.feed(content)
+                        if hit:
+                            finish_reason = "stop"
+                            stopped_early = stop_matched = True
+                    if terminator and content:
+                        end = terminator.feed(content)
+                        if end != -1:
+                            content = content[:end]
+                            finish_reason = "stop"
+                            stopped_early = stop_matched = True
+
+                if chunk_usage:
+                    reasoning_tokens_estimate, answer_tokens_estimate = self._usage_tokens(
+                        chunk_usage, reasoning_tokens_estimate, answer_tokens_estimate
+                    )
+
+                if not stopped_early:
+                    if (
+                        limits.max_reasoning_tokens
+                        and reasoning_tokens_estimate >= limits.max_reasoning_tokens
+                        and is_reasoning_started
+                    ):
+                        finish_reason = "length"
+                        stopped_early = True
+                    elif limits.expired():
+                        finish_reason = "timeout"
+                        stopped_early = True
+
+                delta_content = thinking + content
+                if delta_content:
+                    full_assistant_content += delta_content
+                    yield LLMResultChunk(
+                        model=model,
+                        delta=LLMResultChunkDelta(
+                            index=chunk_index,
+                            message=AssistantPromptMessage(content=delta_content),
+                        ),
+                    )
+
+                # 参数已闭合的工具调用立即输出，调用方可以提前开始执行
+                if completed_tool_calls:
+                    yield LLMResultChunk(
+                        model=model,
+                        delta=LLMResultChunkDelta(
+                            index=chunk_index,
+                            message=AssistantPromptMessage(
+                                tool_calls=completed_tool_calls, content=""
+                            ),
+                        ),
+                    )
+
+                if stopped_early:
+                    break
+        finally:
+            if timer:
+                timer.cancel()
+            # 提前结束时立即关闭上游连接，避免继续消耗 token
+            with suppress(Exception):
+                response.close()
+
+        chunk_index += 1
+        closing_content = ""
+        if scanner and not stop_matched:
+            # 正常结束或因思考预算、超时提前结束时，输出扫描器暂存的尾部
+            tail = scanner.flush()
+            end = terminator.feed(tail) if terminator and tail else -1
+            closing_content += tail if end == -1 else tail[:end]
+        if is_reasoning_started:
+            closing_content += "\n</think>"
+        if closing_content:
+            full_assistant_content += closing_content
+            yield LLMResultChunk(
+                model=model,
+                delta=LLMResultChunkDelta(
+                    index=chunk_index,
+                    message=AssistantPromptMessage(content=closing_content),
+                ),
+            )
+            chunk_index += 1
+
+        remaining_tool_calls = tool_call_assembler.drain()
+        if remaining_tool_calls:
+            yield LLMResultChunk(
+                model=model,
+                delta=LLMResultChunkDelta(
+                    index=chunk_index,
+                    message=AssistantPromptMessage(
+                        tool_calls=remaining_tool_calls, content=""
+                    ),
+                ),
+            )
+
+        self._record_token_usage(
+            model, usage, round(reasoning_tokens_estimate), round(answer_tokens_estimate)
+        )
+
+        # 提前结束时上游不会返回 usage，按已输出内容估算
+        if stopped_early and not usage:
+            usage = {
+                "prompt_tokens": self._num_tokens_from_messages(
+                    prompt_messages, credentials=credentials
+                ),
+                "completion_tokens": self._num_tokens_from_string(
+                    full_assistant_content
+                ),
+            }
+
+        yield self._create_final_llm_result_chunk(
+            index=chunk_index,
+            message=AssistantPromptMessage(content=""),
+            finish_reason=finish_reason,
+            usage=usage,
+            model=model,
+            credentials=credentials,
+            prompt_messages=prompt_messages,
+            full_content=full_assistant_content,
+        )
+
+    def _handle_generate_response(
+        self,
+        model: str,
+        credentials: dict,
+        response: requests.Response,
+        prompt_messages: list[PromptMessage],
+    ) -> LLMResult:
+        """
+        处理非流式响应，并记录思考和回答的 token 数
+
+        Args:
+            model: 模型名称
+            credentials: 认证信息
+            response: 响应
+            prompt_messages: 提示消息列表
+
+        Returns:
+            LLMResult
+        """
+        result = super()._handle_generate_response(
+            model, credentials, response, prompt_messages
+        )
+        with suppress(Exception):
+            response_json = response.json()
+            state = _call_state.get()
+            observation = state.observation if state else None
+            if observation and response_json.get("provider"):
+                observation.provider = response_json["provider"]
+            message = response_json["choices"][0].get("message", {})
+            reasoning_content = message.get("reasoning_content") or ""
+            reasoning_tokens = (
+                self._get_num_tokens_by_gpt2(reasoning_content)
+                if reasoning_content
+                else 0
+            )
+            self._record_token_usage(
+                model,
+                response_json.get("usage"),
+                reasoning_tokens,
+                max(result.usage.completion_tokens - reasoning_tokens, 0),
+            )
+        return result
+
+    @staticmethod
+    def _usage_tokens(
+        usage: dict, reasoning_tokens: float, answer_tokens: float
+    ) -> tuple[float, float]:
+        """
+        用上游流式返回的 usage 校正估算的思考和回答 token 数
+
+        Args:
+            usage: 分块中的 usage
+            reasoning_tokens: 估算的思考 token 数
+            answer_tokens: 估算的回答 token 数
+
+        Returns:
+            (思考 token 数, 回答 token 数)；usage 中没有 completion_tokens 时原样返回
+        """
+        completion_tokens = usage.get("completion_tokens")
+        if not isinstance(completion_tokens, (int, float)):
+            return reasoning_tokens, answer_tokens
+        details = usage.get("completion_tokens_details") or {}
+        if isinstance(details.get("reasoning_tokens"), (int, float)):
+            reasoning_tokens = details["reasoning_tokens"]
+        return reasoning_tokens, max(completion_tokens - reasoning_tokens, 0)
+
+    @staticmethod
+    def _record_token_usage(
+        model: str, usage: Optional[dict], reasoning_tokens: int, answer_tokens: int
+    ) -> None:
+        """
+        分别记录思考和回答的 token 数
+
+        优先使用上游 usage 中的 reasoning_tokens，没有时使用客户端按增量文本估算的数量
+
+        Args:
+            model: 模型名称
+            usage: 上游返回的 usage
+            reasoning_tokens: 客户端估算的思考 token 数
+            answer_tokens: 客户端估算的回答 token 数
+        """
+        details = (usage or {}).get("completion_tokens_details") or {}
+        if details.get("reasoning_tokens") is not None:
+            reasoning_tokens = details["reasoning_tokens"]
+            answer_tokens = max(
+                (usage.get("completion_tokens") or 0) - reasoning_tokens, 0
+            )
+        telemetry.incr("llm.reasoning_tokens", reasoning_tokens, model=model)
+        telemetry.incr("llm.answer_tokens", answer_tokens, model=model)
+        telemetry.record(
+            "llm.tokens",
+            model=model,
+            reasoning_tokens=reasoning_tokens,
+            answer_tokens=answer_tokens,
+        )
+
+    @staticmethod
+    def _auto_enable_thinking(
+        prompt_messages: list[PromptMessage],
+        tools: Optional[list[PromptMessageTool]] = None,
+    ) -> bool:
+        """
+        自动判断是否启用思考
+
+        最后一条用户消息中的 /think、/no_think 提示优先；其次有工具时启用；
+        否则提示词超过 AUTO_THINKING_PROMPT_CHARS 个字符时启用
+
+        Args:
+            prompt_messages: 提示消息列表
+            tools: 工具列表（可选）
+
+        Returns:
+            是否启用思考
+        """
+        last_user_text = next(
+            (
+                m.get_text_content()
+                for m in reversed(prompt_messages)
+                if isinstance(m, UserPromptMessage)
+            ),
+            "",
+        )
+        if "/no_think" in last_user_text:
+            return False
+        if "/think" in last_user_text:
+            return True
+        if tools:
+            return True
+        prompt_chars = sum(len(m.get_text_content()) for m in prompt_messages)
+        return prompt_chars >= config.AUTO_THINKING_PROMPT_CHARS
+
+    @staticmethod
+    def _split_thinking(delta: dict, is_reasoning: bool) -> tuple[str, str, bool]:
+        """
+        拆分增量中的思考内容和回答内容
+
+        思考内容使用 <think> 标签包裹，与 SDK 的输出格式保持一致
+
+        Args:
+            delta: 流式响应中的 delta
+            is_reasoning: 当前是否处于思考阶段
+
+        Returns:
+            (思考内容, 回答内容, 是否仍处于思考阶段)
+        """
+        content = delta.get("content") or ""
+        reasoning_content = delta.get("reasoning_content") or delta.get("reasoning")
+        thinking = ""
+        if reasoning_content:
+            thinking = reasoning_content if is_reasoning else "<think>\n" + reasoning_content
+            is_reasoning = True
+            if content or delta.get("tool_calls") or delta.get("function_call"):
+                is_reasoning = False
+                thinking += "\n</think>"
+        elif is_reasoning:
+            is_reasoning = False
+            thinking = "\n</think>"
+        return thinking, content, is_reasoning
+
+    @endpoints.scoped
     def validate_credentials(self, model: str, credentials: dict) -> None:
         """
         验证认证信息
@@ -96,6 +1444,8 @@ class AipingLargeLanguageModel(OAICompatLargeLanguageModel):
             credentials: 认证信息字典
         """
         credentials["endpoint_url"] = str(
-            URL(credentials.get("endpoint_url", "https://aiping.cn/api/v1"))
+            URL(endpoints.register(credentials.get("endpoint_url", "https://aiping.cn/api/v1")))
         )
         credentials["mode"] = LLMMode.CHAT.value
+        # 预置模型的 YAML 均声明了 tool-call 能力，默认按 tool_call 方式发送工具
+        credentials.setdefault("function_calling_type", "tool_call")
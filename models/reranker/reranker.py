@@ -1,6 +1,12 @@
 from yarl import URL
+from dify_plugin.interfaces.model.openai_compatible import rerank
 from dify_plugin.interfaces.model.openai_compatible.rerank import OAICompatRerankModel
 
+from utils import endpoints, tracing, transport, workload
+
+# SDK 基类的请求也使用共享连接池
+transport.use_shared_session(rerank)
+
 
 class AipingRerankModel(OAICompatRerankModel):
     """
@@ -16,9 +22,10 @@ class AipingRerankModel(OAICompatRerankModel):
             credentials: 认证信息字典
         """
         credentials["endpoint_url"] = str(
-            URL(credentials.get("endpoint_url", "https://aiping.cn/api/v1"))
+            URL(endpoints.register(credentials.get("endpoint_url", "https://aiping.cn/api/v1")))
         )
 
+    @endpoints.scoped
     def _invoke(
         self,
         model: str,
@@ -44,11 +51,30 @@ class AipingRerankModel(OAICompatRerankModel):
         Returns:
             RerankResult
         """
-        self._add_custom_parameters(credentials)
-        return super()._invoke(
-            model, credentials, query, docs, score_threshold, top_n, user
+        capture = workload.start(
+            "rerank",
+            model,
+            query_chars=len(query),
+            docs=workload.text_sizes(docs),
+            score_threshold=score_threshold,
+            top_n=top_n,
         )
+        try:
+            with tracing.span("rerank.invoke", model=model, docs=len(docs)):
+                self._add_custom_parameters(credentials)
+                result = super()._invoke(
+                    model, credentials, query, docs, score_threshold, top_n, user
+                )
+        except Exception as e:
+            if capture:
+                capture.finish(e)
+            raise
+        if capture:
+            capture.note(results=len(result.docs))
+            capture.finish()
+        return result
 
+    @endpoints.scoped
     def validate_credentials(self, model: str, credentials: dict) -> None:
         """
         验证认证信息
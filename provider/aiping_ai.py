@@ -1,7 +1,7 @@
 import logging
-from dify_plugin.entities.model import ModelType
 from dify_plugin.errors.model import CredentialsValidateFailedError
 from dify_plugin import ModelProvider
+from utils.credentials import validate_api_key
 
 logger = logging.getLogger(__name__)
 
@@ -16,13 +16,13 @@ class AipingProvider(ModelProvider):
         :param credentials: provider credentials, credentials form defined in `provider_credential_schema`.
         """
         try:
-            # 验证 LLM 模型（主要验证方式）
-            model_instance = self.get_model_instance(ModelType.LLM)
-            model_instance.validate_credentials(
-                model="DeepSeek-V3", credentials=credentials
+            # 使用最便宜的鉴权请求校验，结果按凭证缓存
+            validate_api_key(
+                credentials.get("endpoint_url") or "https://aiping.cn/api/v1",
+                credentials.get("api_key"),
             )
-        except CredentialsValidateFailedError as ex:
-            raise ex
+        except ValueError as ex:
+            raise CredentialsValidateFailedError(str(ex)) from ex
         except Exception as ex:
             logger.exception(
                 f"{self.get_provider_schema().provider} credentials validate failed"
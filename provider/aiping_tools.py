@@ -1,31 +1,19 @@
 from typing import Any
 from dify_plugin.errors.tool import ToolProviderCredentialValidationError
-from tools.text2image import Text2ImageTool
-# from tools.text2video import Text2VideoTool
-# from tools.image2video import Image2VideoTool
 from dify_plugin import ToolProvider
+from utils.credentials import validate_api_key
 
 
 class AipingProvider(ToolProvider):
     def _validate_credentials(self, credentials: dict[str, Any]) -> None:
         try:
-            # Create a simple test prompt for validation
-            test_params = {
-                "prompt": "测试图像",
-                "size": "512x512"
-            }
-            
-            # Try to invoke the tool with test parameters
-            for _ in Text2ImageTool.from_credentials(credentials).invoke(
-                tool_parameters=test_params
-            ):
-                pass
-
-                
-            # Validation is successful if no exception is raised
-            # Note: We only validate with Text2ImageTool to avoid unnecessary video generation
-            # All tools use the same API key and endpoint, so they should work if Text2ImageTool works
-            # This includes Text2VideoTool and Image2VideoTool
+            # All tools use the same API key and endpoint, so an authenticated
+            # catalog request plus a 1-token completion is enough to validate it
+            # without paying for an image generation. Results are cached per key.
+            validate_api_key(
+                credentials.get("endpoint_url") or "https://aiping.cn/api/v1",
+                credentials.get("api_key"),
+            )
         except Exception as e:
             # If any error occurs during validation, raise it as credential validation error
-            raise ToolProviderCredentialValidationError(f"Credential validation failed: {str(e)}")
\ No newline at end of file
+            raise ToolProviderCredentialValidationError(f"Credential validation failed: {str(e)}")
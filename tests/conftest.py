@@ -0,0 +1,11 @@
+"""
+单元测试公共配置
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import dify_plugin  # noqa: E402,F401  # 先完成 SDK 的 gevent patch
@@ -0,0 +1,86 @@
+"""
+utils/batching.py 的单元测试
+"""
+
+import threading
+
+import pytest
+
+from utils.batching import MicroBatcher
+
+
+def _submit_concurrently(batcher, requests, send):
+    """并发提交 [(items, tokens)]，返回每个调用方的结果或异常"""
+    outcomes = [None] * len(requests)
+    barrier = threading.Barrier(len(requests))
+
+    def run(i, items, tokens):
+        barrier.wait()
+        try:
+            outcomes[i] = batcher.submit("key", items, tokens, send)
+        except BaseException as e:
+            outcomes[i] = e
+
+    threads = [
+        threading.Thread(target=run, args=(i, items, tokens))
+        for i, (items, tokens) in enumerate(requests)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+def test_concurrent_calls_share_one_request():
+    sent = []
+
+    def send(items):
+        sent.append(list(items))
+        return [item.upper() for item in items], 30
+
+    batcher = MicroBatcher(window=0.2, max_items=10, max_tokens=1000)
+    outcomes = _submit_concurrently(batcher, [(["a", "b"], 10), (["c"], 20)], send)
+
+    assert len(sent) == 1 and sorted(sent[0]) == ["a", "b", "c"]
+    by_items = {tuple(results): (usage, callers) for results, usage, callers in outcomes}
+    assert by_items == {("A", "B"): (10, 2), ("C",): (20, 2)}
+
+
+def test_full_batch_is_sent_without_waiting_for_window():
+    batcher = MicroBatcher(window=30, max_items=2, max_tokens=1000)
+
+    results, usage, callers = batcher.submit("key", ["a", "b"], 4, lambda items: (items, 4))
+
+    assert (results, usage, callers) == (["a", "b"], 4, 1)
+
+
+def test_leader_error_is_raised_in_every_caller():
+    def send(items):
+        raise ConnectionError("upstream down")
+
+    batcher = MicroBatcher(window=0.2, max_items=10, max_tokens=1000)
+    outcomes = _submit_concurrently(batcher, [(["a"], 1), (["b"], 1), (["c"], 1)], send)
+
+    assert all(isinstance(outcome, ConnectionError) for outcome in outcomes)
+
+
+def test_result_count_mismatch_fails_every_caller():
+    batcher = MicroBatcher(window=0.2, max_items=10, max_tokens=1000)
+    outcomes = _submit_concurrently(
+        batcher, [(["a"], 1), (["b"], 1)], lambda items: (items[:1], 1)
+    )
+
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+
+
+def test_error_does_not_leak_into_next_batch():
+    def fail(items):
+        raise RuntimeError("upstream error")
+
+    batcher = MicroBatcher(window=0, max_items=10, max_tokens=1000)
+
+    with pytest.raises(RuntimeError):
+        batcher.submit("key", ["a"], 1, fail)
+
+    assert batcher.submit("key", ["b"], 1, lambda items: (items, 1))[0] == ["b"]
@@ -0,0 +1,69 @@
+"""
+utils/cache.py 的单元测试
+"""
+
+import os
+
+from utils.cache import DiskLRUCache, LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used_by_size():
+    cache = LRUCache(10)
+    cache.put("a", "A", 4)
+    cache.put("b", "B", 4)
+    assert cache.get("a") == "A"
+
+    cache.put("c", "C", 4)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+    assert cache.size == 8 and len(cache) == 2
+
+
+def test_lru_cache_replaces_existing_key_and_skips_oversized_values():
+    cache = LRUCache(10)
+    cache.put("a", "A", 4)
+    cache.put("a", "AA", 6)
+    cache.put("big", "X", 11)
+
+    assert cache.get("a") == "AA"
+    assert cache.get("big") is None
+    assert cache.size == 6
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_disk_lru_cache_evicts_files_in_lru_order(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), 10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"
+
+    cache.put("c", b"cccc")
+
+    assert cache.get("b") is None
+    assert not (tmp_path / "b").exists()
+    assert sorted(os.listdir(tmp_path)) == ["a", "c"]
+    assert cache.size == 8
+
+
+def test_disk_lru_cache_restores_entries_and_order_on_restart(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), 10)
+    cache.put("old", b"1111")
+    cache.put("new", b"2222")
+    os.utime(tmp_path / "old", (1, 1))
+    (tmp_path / "partial.tmp").write_bytes(b"x" * 100)
+
+    reopened = DiskLRUCache(str(tmp_path), 6)
+
+    assert len(reopened) == 1
+    assert reopened.get("new") == b"2222"
+    assert reopened.get("old") is None
+
+
+def test_disk_lru_cache_treats_deleted_file_as_miss(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), 10)
+    cache.put("a", b"aaaa")
+    os.remove(tmp_path / "a")
+
+    assert cache.get("a") is None
+    assert cache.size == 0 and len(cache) == 0
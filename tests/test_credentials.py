@@ -0,0 +1,55 @@
+"""
+utils/credentials.py 的单元测试
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+import config
+from utils import credentials
+
+CATALOG = {
+    "data": [
+        {"id": "DeepSeek-R1", "model_type": "llm", "status": 1},
+        {"id": "Qwen3-8B", "model_type": ["llm"], "status": 1},
+        {"id": "Qwen-Image", "model_type": "text2image", "status": 1},
+    ]
+}
+
+
+class Session:
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.calls = []
+
+    def get(self, url, **kwargs):
+        self.calls.append(("GET", url))
+        return SimpleNamespace(status_code=200, json=lambda: self.catalog, raise_for_status=lambda: None)
+
+    def post(self, url, json, **kwargs):
+        self.calls.append(("POST", json["model"]))
+        return SimpleNamespace(status_code=200, text="")
+
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setattr(credentials, "_validated", {})
+    session = Session(CATALOG)
+    monkeypatch.setattr(credentials.transport, "session", lambda: session)
+    return session
+
+
+def test_probes_configured_cheap_model(session):
+    credentials.validate_api_key("https://aiping.cn/api/v1", "sk-1")
+    assert session.calls == [("GET", "https://aiping.cn/api/v1/models"), ("POST", "Qwen3-8B")]
+
+    # 校验结果在 TTL 内缓存
+    credentials.validate_api_key("https://aiping.cn/api/v1", "sk-1")
+    assert len(session.calls) == 2
+
+
+def test_checks_only_models_without_known_cheap_model(session, monkeypatch):
+    monkeypatch.setattr(config, "CREDENTIALS_PROBE_MODEL", "Qwen2.5-7B-Instruct")
+    credentials.validate_api_key("https://aiping.cn/api/v1", "sk-2")
+    assert session.calls == [("GET", "https://aiping.cn/api/v1/models")]
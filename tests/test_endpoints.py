@@ -0,0 +1,90 @@
+"""
+utils/endpoints.py 的单元测试
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from utils import endpoints
+
+PRIMARY = "https://aiping.cn/api/v1"
+BACKUP = "https://backup.example/api/v1"
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+    monkeypatch.setattr(endpoints, "_groups", {})
+    monkeypatch.setattr(endpoints, "_endpoints", {})
+    monkeypatch.setattr(endpoints, "_hosts", set())
+    # 不启动后台探测
+    monkeypatch.setattr(endpoints, "_prober", object())
+
+
+def _rank_backup_first():
+    for endpoint in endpoints._endpoints.values():
+        endpoint.latency_ms = 1.0 if endpoint.url == BACKUP else 100.0
+
+
+def test_route_uses_only_the_current_group():
+    with endpoints.scope(f"{PRIMARY},{BACKUP}") as base_url:
+        _rank_backup_first()
+        routes = endpoints.route("POST", base_url + "/chat/completions")
+        assert [url for _, url in routes] == [
+            f"{BACKUP}/chat/completions",
+            f"{PRIMARY}/chat/completions",
+        ]
+    assert endpoints.route("POST", f"{PRIMARY}/chat/completions") is None
+
+
+def test_other_tenant_with_same_primary_is_not_rerouted():
+    # 租户 A 登记了包含其它地址的配置
+    with endpoints.scope(f"{PRIMARY},{BACKUP}"):
+        _rank_backup_first()
+    endpoints.register(f"{PRIMARY},{BACKUP}")
+
+    # 租户 B 只配置了主地址
+    with endpoints.scope(PRIMARY) as base_url:
+        assert endpoints.route("POST", base_url + "/chat/completions") is None
+
+
+def test_single_url_scope_clears_outer_group():
+    with endpoints.scope(f"{PRIMARY},{BACKUP}"):
+        with endpoints.scope(PRIMARY):
+            assert endpoints.route("GET", f"{PRIMARY}/models") is None
+        assert endpoints.route("GET", f"{PRIMARY}/models") is not None
+
+
+def test_scoped_tool_group_is_not_visible_between_yields():
+    class Tool:
+        runtime = SimpleNamespace(credentials={"endpoint_url": f"{PRIMARY},{BACKUP}"})
+
+        @endpoints.scoped_tool
+        def _invoke(self, parameters):
+            yield endpoints.route("GET", f"{PRIMARY}/models") is not None
+            yield endpoints.route("GET", f"{PRIMARY}/models") is not None
+
+    seen = []
+    for routed in Tool()._invoke({}):
+        seen.append(routed)
+        seen.append(endpoints.route("GET", f"{PRIMARY}/models") is not None)
+
+    assert seen == [True, False, True, False]
+
+
+def test_scoped_model_method_uses_credentials():
+    class Model:
+        @endpoints.scoped
+        def _invoke(self, model, credentials):
+            return endpoints.route("GET", f"{PRIMARY}/models")
+
+    assert Model()._invoke("m", {"endpoint_url": f"{PRIMARY},{BACKUP}"}) is not None
+    assert Model()._invoke("m", credentials={"endpoint_url": PRIMARY}) is None
+    assert endpoints.route("GET", f"{PRIMARY}/models") is None
+
+
+def test_host_label_buckets_unregistered_hosts():
+    with endpoints.scope(PRIMARY):
+        pass
+    assert endpoints.host_label(f"{PRIMARY}/images/generations") == "aiping.cn"
+    assert endpoints.host_label("https://cdn.user.example/cat.png") == "other"
@@ -0,0 +1,148 @@
+"""
+utils/image.py 的单元测试
+"""
+
+import base64
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import config
+from utils import image, memory
+
+
+@pytest.fixture
+def small_spool(monkeypatch):
+    monkeypatch.setattr(config, "IMAGE_SPOOL_BYTES", 256 * 1024)
+    monkeypatch.setattr(config, "IMAGE_MAX_BYTES", 64 * 1024 * 1024)
+
+
+def _png_payload(size: int) -> bytes:
+    header = b"\x89PNG\r\n\x1a\n"
+    return header + bytes(range(256)) * ((size - len(header)) // 256)
+
+
+def test_open_image_peak_memory_is_bounded(small_spool):
+    payload = _png_payload(16 * 1024 * 1024)
+    data_url = "data:image/png;base64," + base64.b64encode(payload).decode()
+
+    tracemalloc.start()
+    try:
+        mime_type, image_file = image.open_image(data_url)
+        with image_file:
+            messages = sum(1 for _ in image.blob_messages(image_file, {"mime_type": mime_type}))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert mime_type == "image/png"
+    assert messages == len(payload) // 8192 + 2
+    # 解码和输出都按块进行，峰值只与块大小和缓冲阈值有关
+    assert peak < 2 * 1024 * 1024
+
+
+def test_decode_image_strips_whitespace_across_chunks(small_spool):
+    payload = _png_payload(600 * 1024)
+    encoded = base64.b64encode(payload).decode()
+    wrapped = "\n".join(encoded[i : i + 76] for i in range(0, len(encoded), 76))
+
+    assert image.decode_image("data:image/png;base64," + wrapped) == ("image/png", payload)
+    assert image.decode_image(" " + wrapped + "\r\n") == ("image/png", payload)
+
+
+def test_decode_image_rejects_invalid_base64():
+    with pytest.raises(ValueError):
+        image.decode_image("not base64 at all!")
+    with pytest.raises(ValueError):
+        image.decode_image("data:image/png;base64,abc")
+
+
+def test_blob_messages_reassemble_to_original(small_spool):
+    payload = _png_payload(20000)
+    _, image_file = image.open_image(base64.b64encode(payload).decode())
+
+    messages = list(image.blob_messages(image_file, {"mime_type": "image/png"}))
+
+    assert image_file.closed
+    assert [m.message.sequence for m in messages] == list(range(len(messages)))
+    assert messages[-1].message.end and not messages[-1].message.blob
+    assert b"".join(m.message.blob for m in messages) == payload
+    assert all(m.message.total_length == len(payload) for m in messages)
+
+
+@pytest.fixture
+def image_server():
+    payloads = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            payload = payloads[self.path]
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", payloads
+    server.shutdown()
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    budget = memory.MemoryBudget(64 * 1024 * 1024)
+    monkeypatch.setattr(memory, "_budget", budget)
+    return budget
+
+
+def test_in_memory_download_holds_reservation_until_closed(small_spool, image_server, budget):
+    base_url, payloads = image_server
+    payloads["/small.png"] = _png_payload(100 * 1024)
+
+    _, image_file = image.open_image(base_url + "/small.png")
+    assert budget.snapshot()["reservations"] == {"image.download": len(payloads["/small.png"])}
+
+    with image_file:
+        assert image_file.read() == payloads["/small.png"]
+    assert budget.snapshot()["reserved"] == 0
+
+
+def test_download_spilled_to_disk_releases_reservation(small_spool, image_server, budget):
+    base_url, payloads = image_server
+    payloads["/large.png"] = _png_payload(1024 * 1024)
+
+    _, image_file = image.open_image(base_url + "/large.png")
+
+    with image_file:
+        assert budget.snapshot()["reserved"] == 0
+        assert image_file.read() == payloads["/large.png"]
+
+
+def test_fetch_images_closes_unclaimed_files_on_early_stop(small_spool, image_server, budget, monkeypatch):
+    base_url, payloads = image_server
+    for i in range(4):
+        payloads[f"/{i}.png"] = _png_payload(100 * 1024)
+    # 保留文件引用，确认文件是被显式关闭而不是随垃圾回收关闭
+    opened = []
+    open_image = image.open_image
+    monkeypatch.setattr(image, "open_image", lambda *args: opened.append(open_image(*args)) or opened[-1])
+
+    images = image.fetch_images([f"{base_url}/{i}.png" for i in range(4)], ordered=False)
+    _, _, image_file, error = next(images)
+    assert error is None
+    image_file.close()
+    # 等其它图片都下载完成再停止迭代
+    deadline = time.monotonic() + 5
+    while len(opened) < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    images.close()
+
+    assert all(file.closed for _, file in opened)
+    assert budget.snapshot()["reserved"] == 0
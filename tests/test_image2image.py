@@ -0,0 +1,138 @@
+"""
+tools/image2image.py 输入图片缓存的单元测试
+"""
+
+import base64
+import hashlib
+import io
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+import config
+from tools import image2image
+from tools.image2image import Image2ImageTool, _url_cache_key
+from utils.cache import LRUCache
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    cache = LRUCache(32 * 1024 * 1024)
+    monkeypatch.setattr(image2image, "_input_image_cache", cache)
+    return cache
+
+
+def _png(side: int) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (side, side), (200, 30, 30)).save(output, format="PNG")
+    return output.getvalue()
+
+
+def _prepare(content: bytes, url=None, etag=None):
+    tool = Image2ImageTool.__new__(Image2ImageTool)
+    digest = hashlib.sha256(content).hexdigest()
+    return digest, tool._prepare_image(SimpleNamespace(), content, digest, url, etag)
+
+
+def test_url_cache_key_ignores_signature():
+    first = "https://dify.example/files/abc/file-preview?timestamp=1&nonce=x&sign=s1"
+    second = "https://dify.example/files/abc/file-preview?timestamp=2&nonce=y&sign=s2"
+    other = "https://dify.example/files/def/file-preview?timestamp=1&nonce=x&sign=s1"
+
+    assert _url_cache_key(first) == _url_cache_key(second)
+    assert _url_cache_key(first) != _url_cache_key(other)
+    assert _url_cache_key("https://x.example/a.png?v=2&sign=s") == (
+        "url",
+        "https://x.example/a.png?v=2",
+    )
+
+
+def test_default_config_caches_image_and_url(monkeypatch, fresh_cache):
+    monkeypatch.setattr(config, "IMAGE_INPUT_MAX_SIDE", 0)
+    content = _png(64)
+
+    digest, prepared = _prepare(content, "https://x.example/a.png?sign=1", '"etag"')
+
+    assert prepared[1] == content
+    assert fresh_cache.get(("image", digest)) == prepared
+    assert fresh_cache.get(_url_cache_key("https://x.example/a.png?sign=2")) == ('"etag"', digest)
+
+
+def test_repeated_image_is_served_from_cache(monkeypatch):
+    monkeypatch.setattr(config, "IMAGE_INPUT_MAX_SIDE", 0)
+    hits = []
+    monkeypatch.setattr(
+        Image2ImageTool, "_record_cache_hit", staticmethod(lambda kind, *_: hits.append(kind))
+    )
+    content = _png(64)
+
+    _, first = _prepare(content)
+    _, second = _prepare(content)
+
+    assert second is first
+    assert hits == ["content"]
+
+
+def test_downscaled_image_is_cached_with_url(monkeypatch, fresh_cache):
+    monkeypatch.setattr(config, "IMAGE_INPUT_MAX_SIDE", 32)
+    content = _png(512)
+
+    digest, prepared = _prepare(content, "https://x.example/a.png?sign=1", '"etag"')
+
+    assert len(prepared[1]) < len(content)
+    assert fresh_cache.get(("image", digest)) == prepared
+    assert fresh_cache.get(_url_cache_key("https://x.example/a.png?sign=2")) == ('"etag"', digest)
+
+
+def test_repeated_edit_of_signed_url_skips_download(monkeypatch):
+    monkeypatch.setattr(config, "IMAGE_INPUT_MAX_SIDE", 0)
+    image = _png(64)
+    result = "data:image/png;base64," + base64.b64encode(_png(8)).decode()
+    downloads = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            downloads.append(self.path)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(image)))
+            self.send_header("ETag", '"v1"')
+            self.end_headers()
+            self.wfile.write(image)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            body = json.dumps({"data": [{"url": result}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        tool = Image2ImageTool.from_credentials({"api_key": "k", "endpoint_url": base_url + "/v1"})
+        texts = []
+        for sign in ("a", "b"):
+            url = f"{base_url}/files/1/file-preview?timestamp=1&nonce=2&sign={sign}"
+            parameters = {"model": "m", "prompt": "edit", "image": SimpleNamespace(url=url)}
+            for message in tool._invoke(parameters):
+                texts.append(getattr(message.message, "text", ""))
+    finally:
+        server.shutdown()
+
+    assert len(downloads) == 1
+    assert any(text.startswith("图片未变化，使用缓存") for text in texts)
@@ -0,0 +1,294 @@
+"""
+models/llm/llm.py 辅助逻辑的单元测试
+"""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from dify_plugin.entities.model.message import UserPromptMessage
+
+from models.llm import llm
+from models.llm.llm import (
+    AipingLargeLanguageModel,
+    _IncrementalJsonValidator,
+    _StopSequenceScanner,
+    _StreamLimits,
+    _ToolCallAssembler,
+)
+from utils.semantic_cache import SemanticCache
+
+
+class _FakeStreamResponse:
+    """按行返回 SSE 数据的流式响应"""
+
+    def __init__(self, deltas):
+        self.deltas = deltas
+        self.closed = False
+
+    def iter_lines(self, **kwargs):
+        for delta, finish_reason in self.deltas:
+            yield "data: " + json.dumps(
+                {"choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            )
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def model():
+    model = AipingLargeLanguageModel(model_schemas=[])
+    # 测试环境无法下载 GPT-2 分词器，按文本长度估算
+    model._get_num_tokens_by_gpt2 = lambda text: len(text) // 4
+    return model
+
+
+def _stream(model, deltas, **limits):
+    response = _FakeStreamResponse(deltas)
+    chunks = list(
+        model._stream_response(
+            "m", {}, response, [UserPromptMessage(content="hi")], _StreamLimits(**limits), None
+        )
+    )
+    text = "".join(
+        c.delta.message.content for c in chunks if isinstance(c.delta.message.content, str)
+    )
+    return text, chunks[-1].delta.finish_reason, response
+
+
+def _chunk(content="", finish_reason=None, tool_calls=None):
+    message = SimpleNamespace(content=content, tool_calls=tool_calls or [])
+    return SimpleNamespace(delta=SimpleNamespace(message=message, finish_reason=finish_reason))
+
+
+@pytest.fixture
+def semantic(monkeypatch):
+    cache = SemanticCache(8, 60.0, threshold=0.9)
+    monkeypatch.setattr(llm, "_semantic_cache", cache)
+    return cache
+
+
+def test_cache_stream_answer_skips_thinking(semantic):
+    chunks = [
+        _chunk("<think>\n先分析"),
+        _chunk("问题\n</think>"),
+        _chunk("答案是"),
+        _chunk(" 42", finish_reason="stop"),
+    ]
+
+    passed = list(AipingLargeLanguageModel._cache_stream_answer(("s", [1.0, 0.0]), iter(chunks)))
+
+    assert passed == chunks
+    assert semantic.get("s", [1.0, 0.0])[0] == "答案是 42"
+
+
+def test_cache_stream_answer_ignores_thinking_only_or_unfinished(semantic):
+    list(
+        AipingLargeLanguageModel._cache_stream_answer(
+            ("s", [1.0, 0.0]), iter([_chunk("<think>\n想", finish_reason="stop")])
+        )
+    )
+    list(
+        AipingLargeLanguageModel._cache_stream_answer(
+            ("s", [1.0, 0.0]), iter([_chunk("答案", finish_reason="length")])
+        )
+    )
+
+    assert semantic.stats()["entries"] == 0
+
+
+def _scan(stop, pieces):
+    scanner = _StopSequenceScanner(stop)
+    output = []
+    for piece in pieces:
+        text, hit = scanner.feed(piece)
+        output.append(text)
+        if hit:
+            return "".join(output), True
+    return "".join(output) + scanner.flush(), False
+
+
+@pytest.mark.parametrize(
+    "pieces",
+    [
+        ["hello STOP world"],
+        ["hello ST", "OP world"],
+        ["hello S", "T", "O", "P world"],
+        ["hello ", "STOP"],
+    ],
+)
+def test_stop_scanner_detects_stop_across_chunks(pieces):
+    assert _scan(["STOP"], pieces) == ("hello ", True)
+
+
+def test_stop_scanner_holds_back_only_possible_prefixes():
+    scanner = _StopSequenceScanner(["\n\nHuman:"])
+
+    assert scanner.feed("answer\n") == ("answer", False)
+    assert scanner.feed("\nHum") == ("", False)
+    # 前缀没有继续匹配时暂存的文本原样输出
+    assert scanner.feed("ble") == ("\n\nHumble", False)
+    assert scanner.flush() == ""
+
+
+def test_stop_scanner_earliest_stop_wins_and_flushes_tail():
+    assert _scan(["END", "ST"], ["abc", "ENDST"]) == ("abc", True)
+    assert _scan(["STOP"], ["abc", "STO"]) == ("abcSTO", False)
+
+
+def test_stream_does_not_cut_answer_by_estimated_tokens(model):
+    deltas = [({"content": "中文回答"}, None) for _ in range(15)] + [({"content": ""}, "stop")]
+
+    text, finish_reason, _ = _stream(model, deltas)
+
+    assert finish_reason == "stop"
+    assert text == "中文回答" * 15
+
+
+def test_stream_stops_thinking_at_reasoning_budget(model):
+    deltas = [({"reasoning_content": "think " * 10}, None) for _ in range(10)]
+
+    text, finish_reason, response = _stream(model, deltas, max_reasoning_tokens=30)
+
+    assert finish_reason == "length"
+    assert text == "<think>\n" + "think " * 20 + "\n</think>"
+    assert response.closed
+
+
+def test_timeout_flushes_text_held_by_stop_scanner(model):
+    deltas = [({"content": "answer E"}, None), ({"content": "ND"}, None)]
+
+    text, finish_reason, _ = _stream(model, deltas, stop=["END"], max_duration=1e-9)
+
+    assert (text, finish_reason) == ("answer E", "timeout")
+
+
+def test_json_output_keeps_closing_code_fence(model):
+    deltas = [
+        ({"content": "```json\n{\"a\": "}, None),
+        ({"content": "1}\n``"}, None),
+        ({"content": "`\nextra text"}, None),
+    ]
+
+    text, finish_reason, _ = _stream(model, deltas, json_output=True)
+
+    assert (text, finish_reason) == ('```json\n{"a": 1}\n```', "stop")
+
+
+@pytest.mark.parametrize(
+    "text, end",
+    [
+        ('{"a": "}"} trailing', 10),
+        ('Here: [1, [2]] more', 14),
+        ('```json\n{"a": 1}\n``` more', 20),
+    ],
+)
+def test_json_terminator_end_position(text, end):
+    terminator = llm._JsonTerminator()
+    assert terminator.feed(text) == end
+
+
+def test_stream_stop_sequence_split_across_chunks(model):
+    deltas = [({"content": "yes, EN"}, None), ({"content": "D and more"}, None)]
+
+    text, finish_reason, response = _stream(model, deltas, stop=["END"])
+
+    assert (text, finish_reason) == ("yes, ", "stop")
+    assert response.closed
+
+
+def _validate(*pieces):
+    validator = _IncrementalJsonValidator()
+    return [validator.feed(piece) for piece in pieces]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        '{"a": 1, "b": [true, false, null], "c": {"d": "x\\"y"}}',
+        '[]',
+        '{}',
+        '  {"n": -1.5e+3}  ',
+        '"\\u4e2d\\n"',
+        '{"中文": "值"}',
+    ],
+)
+def test_json_validator_accepts_valid_json_in_any_split(text):
+    for split in range(len(text) + 1):
+        assert _validate(text[:split], text[split:])[-1] is True
+
+
+def test_json_validator_reports_completion_only_when_closed():
+    assert _validate('{"a": [1, ', "2]", "}") == [False, False, True]
+
+
+@pytest.mark.parametrize(
+    "pieces",
+    [
+        ['{"a" 1}'],
+        ["{'a': 1}"],
+        ['{"a": 1,, "b": 2}'],
+        ['{"a": tru', "x}"],
+        ['{"a": [1}'],
+        ['{"a": "\\', 'q"}'],
+        ['{"a": "\\u12', 'zz"}'],
+        ['{"a": 01}'],
+    ],
+)
+def test_json_validator_rejects_invalid_json(pieces):
+    with pytest.raises(ValueError):
+        _validate(*pieces)
+
+
+def _fragment(index, arguments, call_id=None, name=None):
+    function = {"arguments": arguments}
+    if name:
+        function["name"] = name
+    fragment = {"index": index, "function": function}
+    if call_id:
+        fragment["id"] = call_id
+        fragment["type"] = "function"
+    return fragment
+
+
+def test_tool_call_assembler_emits_each_call_when_arguments_close():
+    assembler = _ToolCallAssembler()
+
+    assert assembler.feed([_fragment(0, "", "call_1", "search")]) == []
+    assert assembler.feed([_fragment(0, '{"q": "we')]) == []
+    assert assembler.feed([_fragment(1, '{"city"', "call_2", "weather")]) == []
+    done = assembler.feed([_fragment(0, 'ather"}'), _fragment(1, ': "北京"}')])
+
+    assert [(c.id, c.function.name, json.loads(c.function.arguments)) for c in done] == [
+        ("call_1", "search", {"q": "weather"}),
+        ("call_2", "weather", {"city": "北京"}),
+    ]
+    assert assembler.drain() == []
+
+
+def test_tool_call_assembler_drains_incomplete_and_invalid_calls():
+    assembler = _ToolCallAssembler()
+    assembler.feed([_fragment(0, '{"q": ', "call_1", "search")])
+    assembler.feed([_fragment(1, "not json", "call_2", "broken")])
+    assembler.feed([_fragment(1, " at all")])
+
+    remaining = assembler.drain()
+
+    assert [(c.id, c.function.arguments) for c in remaining] == [
+        ("call_1", '{"q": '),
+        ("call_2", "not json at all"),
+    ]
+    assert assembler.drain() == []
+
+
+def test_tool_call_assembler_without_index_or_id_appends_to_last_call():
+    assembler = _ToolCallAssembler()
+    assembler.feed([{"function": {"name": "search", "arguments": '{"q":'}}])
+    done = assembler.feed([{"function": {"arguments": ' "x"}'}}])
+
+    assert len(done) == 1
+    assert done[0].function.name == "search"
+    assert done[0].id.startswith("chatcmpl-tool-")
+    assert json.loads(done[0].function.arguments) == {"q": "x"}
@@ -0,0 +1,88 @@
+"""
+utils/memory.py 的单元测试
+"""
+
+import threading
+import time
+
+import pytest
+
+from utils.memory import MemoryBudget
+
+
+def test_reservations_are_admitted_within_limit_and_released():
+    budget = MemoryBudget(100)
+
+    with budget.reserve("a", 60), budget.reserve("b", 40):
+        assert budget.snapshot()["reserved"] == 100
+        assert budget.snapshot()["reservations"] == {"a": 60, "b": 40}
+
+    snapshot = budget.snapshot()
+    assert snapshot["reserved"] == 0 and snapshot["peak"] == 100
+
+
+def test_release_is_idempotent():
+    budget = MemoryBudget(100)
+    reservation = budget.reserve("a", 60)
+
+    reservation.release()
+    reservation.release()
+
+    assert budget.snapshot()["reserved"] == 0
+
+
+def test_oversized_request_is_capped_to_whole_budget():
+    budget = MemoryBudget(100)
+
+    with budget.reserve("huge", 10_000) as reservation:
+        assert reservation.nbytes == 100
+
+
+def test_waiting_reservation_times_out():
+    budget = MemoryBudget(100)
+
+    with budget.reserve("a", 80):
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            budget.reserve("b", 40, timeout=0.1)
+        assert time.monotonic() - started >= 0.1
+
+    assert budget.snapshot()["waiting"] == 0
+    assert budget.snapshot()["reserved"] == 0
+
+
+def test_waiting_reservation_is_admitted_after_release():
+    budget = MemoryBudget(100)
+    first = budget.reserve("a", 80)
+    admitted = threading.Event()
+
+    def wait_for_budget():
+        with budget.reserve("b", 40, timeout=5):
+            admitted.set()
+
+    thread = threading.Thread(target=wait_for_budget)
+    thread.start()
+    time.sleep(0.05)
+    assert not admitted.is_set()
+
+    first.release()
+    thread.join(5)
+
+    assert admitted.is_set()
+
+
+def test_spillable_reservation_does_not_wait_or_count():
+    budget = MemoryBudget(100)
+
+    with budget.reserve("a", 80):
+        with budget.reserve("download", 40, spillable=True, timeout=5) as reservation:
+            assert reservation.spilled
+            assert budget.snapshot()["reserved"] == 80
+
+
+def test_unlimited_budget_never_blocks():
+    budget = MemoryBudget(0)
+
+    with budget.reserve("a", 1 << 40) as reservation:
+        assert not reservation.spilled
+        assert budget.snapshot()["reserved"] == 0
@@ -0,0 +1,62 @@
+"""
+utils/routing.py 的单元测试
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import config
+from utils import routing
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+    monkeypatch.setattr(routing, "_stats", {})
+    monkeypatch.setattr(routing, "_loaded", True)
+    monkeypatch.setattr(routing, "_dirty", False)
+    monkeypatch.setattr(routing, "_last_flush", None)
+    monkeypatch.setattr(routing, "_flushing", False)
+
+
+def _chunks(count: int):
+    for _ in range(count):
+        yield SimpleNamespace(delta=SimpleNamespace(usage=None))
+
+
+def test_aborted_stream_is_not_recorded(monkeypatch):
+    monkeypatch.setattr(routing, "_storage", lambda: None)
+    stream = routing.Observation("Qwen3-8B", 100).wrap(_chunks(10))
+    next(stream)
+    stream.close()
+    assert routing.stats() == {}
+
+    list(routing.Observation("Qwen3-8B", 100).wrap(_chunks(3)))
+    assert routing.stats()["Qwen3-8B||0"]["count"] == 1
+
+
+def test_flush_writes_storage_off_the_request_path(monkeypatch):
+    monkeypatch.setattr(config, "LLM_ROUTING_FLUSH_SECONDS", 60)
+    release = threading.Event()
+    written = []
+
+    class Storage:
+        def set(self, key, value):
+            release.wait(5)
+            written.append((key, value))
+
+    monkeypatch.setattr(routing, "_storage", lambda: Storage())
+
+    # 写入阻塞时调用仍然立即返回
+    routing.record("Qwen3-8B", None, 0, True, 10.0, 100.0, 20)
+    assert written == [] and routing._flushing
+
+    release.set()
+    for _ in range(500):
+        if not routing._flushing:
+            break
+        time.sleep(0.01)
+    assert [key for key, _ in written] == [routing._STORAGE_KEY]
+    assert not routing._dirty
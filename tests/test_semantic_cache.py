@@ -0,0 +1,73 @@
+"""
+utils/semantic_cache.py 的单元测试
+"""
+
+from utils import semantic_cache
+from utils.semantic_cache import SemanticCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _cache(monkeypatch, max_entries=2, ttl=60.0):
+    clock = _Clock()
+    monkeypatch.setattr(semantic_cache.time, "monotonic", clock)
+    return SemanticCache(max_entries, ttl, threshold=0.9), clock
+
+
+def test_hit_and_miss(monkeypatch):
+    cache, _ = _cache(monkeypatch)
+    cache.put("scope", [1.0, 0.0], "a")
+
+    assert cache.get("scope", [2.0, 0.1])[0] == "a"
+    assert cache.get("scope", [0.0, 1.0]) is None
+    assert cache.get("other", [1.0, 0.0]) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_evicts_least_recently_used(monkeypatch):
+    cache, _ = _cache(monkeypatch)
+    cache.put("s", [1.0, 0.0], "a")
+    cache.put("s", [0.0, 1.0], "b")
+    # 命中 a 后 b 成为最久未使用的条目
+    assert cache.get("s", [1.0, 0.0])[0] == "a"
+
+    cache.put("s", [-1.0, 0.0], "c")
+
+    assert cache.get("s", [0.0, 1.0]) is None
+    assert cache.get("s", [1.0, 0.0])[0] == "a"
+    assert cache.get("s", [-1.0, 0.0])[0] == "c"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entries_are_freed_before_eviction(monkeypatch):
+    cache, clock = _cache(monkeypatch, ttl=10.0)
+    cache.put("s", [1.0, 0.0], "a")
+    clock.now += 5
+    cache.put("s", [0.0, 1.0], "b")
+    cache.get("s", [1.0, 0.0])
+    clock.now += 6
+
+    # a 已过期，腾出的槽位直接复用，不淘汰仍有效的 b
+    cache.put("s", [-1.0, 0.0], "c")
+
+    assert cache.stats()["evictions"] == 0
+    assert cache.get("s", [1.0, 0.0]) is None
+    assert cache.get("s", [0.0, 1.0])[0] == "b"
+    assert cache.stats()["entries"] == 2
+
+
+def test_dimension_change_resets(monkeypatch):
+    cache, _ = _cache(monkeypatch)
+    cache.put("s", [1.0, 0.0], "a")
+    cache.put("s", [1.0, 0.0, 0.0], "b")
+    cache.put("s", [0.0, 1.0, 0.0], "c")
+    cache.put("s", [0.0, 0.0, 1.0], "d")
+
+    assert cache.stats()["entries"] == 2
+    assert cache.get("s", [0.0, 0.0, 1.0])[0] == "d"
@@ -0,0 +1,27 @@
+"""
+utils/telemetry.py 的单元测试
+"""
+
+import logging
+
+from utils import telemetry
+
+
+def test_report_logs_counters_and_memory(monkeypatch, caplog):
+    monkeypatch.setattr(telemetry, "_counters", telemetry.defaultdict(float))
+    telemetry.incr("http.requests", host="other", connection="new")
+
+    with caplog.at_level(logging.INFO, logger=telemetry.__name__):
+        telemetry.report()
+
+    messages = [r.getMessage() for r in caplog.records]
+    assert any(m.startswith("telemetry.counters") and "http.requests{connection=new,host=other}" in m
+               for m in messages)
+    assert any(m.startswith("telemetry.memory") for m in messages)
+
+
+def test_reporting_disabled_by_zero_interval(monkeypatch):
+    monkeypatch.setattr(telemetry.config, "TELEMETRY_LOG_INTERVAL", 0)
+    monkeypatch.setattr(telemetry, "_reporter", None)
+    assert telemetry.start_reporting() is False
+    assert telemetry._reporter is None
@@ -0,0 +1,208 @@
+import contextvars
+import json
+import time
+from collections.abc import Generator
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Any, BinaryIO, Optional
+from dify_plugin.entities.tool import ToolInvokeMessage
+from dify_plugin import Tool
+import config
+from utils import endpoints, telemetry, tracing, transport, workload
+from utils.image import blob_messages, close_unclaimed, open_image
+from utils.image_task import ASYNC_HEADERS, ImageTask
+
+
+class BatchText2ImageTool(Tool):
+    @tracing.traced("tool.batch_text2image")
+    @workload.captured("batch_text2image", workload.image_tool_shape)
+    @endpoints.scoped_tool
+    def _invoke(
+        self, tool_parameters: dict
+    ) -> Generator[ToolInvokeMessage, None, None]:
+        """
+        Invoke batch text-to-image generation tool
+        """
+        base_url = self.runtime.credentials.get("endpoint_url")
+
+        if not base_url:
+            base_url = "https://aiping.cn/api/v1"
+        base_url = endpoints.register(base_url)
+
+        api_key = self.runtime.credentials.get("api_key")
+
+        model = tool_parameters.get("model", "Qwen-Image")
+
+        prompts = self._parse_prompts(tool_parameters.get("prompts", ""))
+        if not prompts:
+            yield self.create_text_message("请输入提示词")
+            return
+        workload.note(prompts=len(prompts))
+
+        negative_prompt = tool_parameters.get("negative_prompt", "模糊，低质量")
+
+        extra_body = json.loads(tool_parameters.get("extra_body", "{}"))
+
+        count = max(int(tool_parameters.get("count") or 1), 1)
+
+        # 每条提示词生成 count 个变体；带 seed 时每个变体使用不同的 seed
+        items = []
+        for prompt in prompts:
+            for variant in range(count):
+                item_extra_body = dict(extra_body)
+                if count > 1 and isinstance(extra_body.get("seed"), int):
+                    item_extra_body["seed"] = extra_body["seed"] + variant
+                items.append((prompt, item_extra_body))
+
+        if len(items) > config.IMAGE_BATCH_MAX_ITEMS:
+            yield self.create_text_message(
+                f"批量生成数量 {len(items)} 超过上限 {config.IMAGE_BATCH_MAX_ITEMS}"
+            )
+            return
+
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        }
+
+        yield self.create_text_message(f"正在使用AIPing API 批量生成 {len(items)} 组图像...")
+
+        started = time.monotonic()
+        errors = []
+        succeeded = 0
+        payloads = [
+            {
+                "model": model,
+                "input": {"prompt": prompt, "negative_prompt": negative_prompt},
+                "extra_body": item_extra_body,
+            }
+            for prompt, item_extra_body in items
+        ]
+        results = self._run_threaded(base_url, headers, payloads)
+
+        # 哪一组先完成先返回哪一组
+        for index, result, error in results:
+            images, image_errors = result if error is None else ([], [str(error)])
+
+            for mime_type, image_file in images:
+                # 从临时文件分块输出图像
+                yield from blob_messages(image_file, {"mime_type": mime_type})
+            if images:
+                succeeded += 1
+                yield self.create_text_message(f"第 {index + 1} 组图像生成成功！")
+            for image_error in image_errors:
+                errors.append((index, f"第 {index + 1} 组（{items[index][0][:30]}）: {image_error}"))
+
+        elapsed = time.monotonic() - started
+        tracing.current().set(model=model, items=len(items), errors=len(errors))
+        telemetry.incr("image.batch_items", len(items), model=model)
+        telemetry.incr("image.batch_errors", len(errors), model=model)
+
+        # 汇总每组的生成结果
+        summary = f"批量生成完成: 成功 {succeeded}/{len(items)} 组，耗时 {elapsed:.1f}s"
+        if errors:
+            summary += "\n失败明细:\n" + "\n".join(error for _, error in sorted(errors))
+        yield self.create_text_message(summary)
+
+    @staticmethod
+    def _parse_prompts(prompts: str) -> list[str]:
+        """解析提示词列表：JSON 字符串数组，或每行一条提示词"""
+        prompts = (prompts or "").strip()
+        if prompts.startswith("["):
+            try:
+                parsed = json.loads(prompts)
+            except json.JSONDecodeError:
+                parsed = None
+            if isinstance(parsed, list):
+                return [str(p).strip() for p in parsed if str(p).strip()]
+        return [line.strip() for line in prompts.splitlines() if line.strip()]
+
+    @classmethod
+    def _run_threaded(
+        cls, base_url: str, headers: dict, payloads: list[dict]
+    ) -> Generator[tuple[int, Any, Optional[Exception]], None, None]:
+        """在线程池中并发生成，按完成顺序返回 (下标, 结果, 异常)"""
+        pool = ThreadPoolExecutor(
+            max_workers=min(config.IMAGE_BATCH_CONCURRENCY, len(payloads))
+        )
+        futures: dict[Future, int] = {}
+        claimed: set[Future] = set()
+        try:
+            futures = {
+                # 线程池中的请求沿用当前调用登记的地址组
+                pool.submit(contextvars.copy_context().run, cls._generate, base_url, headers, data): index
+                for index, data in enumerate(payloads)
+            }
+            for future in as_completed(futures):
+                claimed.add(future)
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+        finally:
+            # 调用方提前停止迭代时不再等待剩余请求，已生成和生成中的图像文件由线程池关闭
+            pool.shutdown(wait=False, cancel_futures=True)
+            close_unclaimed(futures, claimed, lambda result: [file for _, file in result[0]])
+
+    @classmethod
+    def _generate(
+        cls, base_url: str, headers: dict, data: dict
+    ) -> tuple[list[tuple[str, BinaryIO]], list[str]]:
+        """
+        生成一组图像并下载结果
+
+        Returns:
+            (成功的 (mime_type, 图像文件) 列表, 错误信息列表)；图像文件由调用方关闭
+        """
+        response = transport.request(
+            "POST",
+            base_url + "/images/generations",
+            headers={**headers, **ASYNC_HEADERS} if config.IMAGE_ASYNC_SUBMIT else headers,
+            json=data,
+            timeout=config.MAX_REQUEST_TIMEOUT,
+        )
+
+        response.encoding = "utf8"
+
+        result = response.json()
+
+        if response.status_code != 200:
+            return [], [str(result)]
+
+        # 接口返回任务 ID 时轮询任务结果
+        result = ImageTask(base_url, headers, result).wait()
+
+        image_urls, errors = cls._parse_images(result)
+        generated = []
+        for image_url in image_urls:
+            try:
+                generated.append(open_image(image_url, config.IMAGE_FETCH_TIMEOUT))
+            except Exception as e:
+                errors.append(str(e))
+        return generated, errors
+
+    @staticmethod
+    def _parse_images(result: dict) -> tuple[list[str], list[str]]:
+        """
+        解析生成结果
+
+        Returns:
+            (图像 URL 列表, 错误信息列表)
+        """
+        images = result.get("data")
+        if not images:
+            return [], [f"图像列表为{images}"]
+
+        image_urls = []
+        errors = []
+        for image in images:
+            image = image.get("url")
+
+            if not isinstance(image, str):
+                errors.append(f"图片类型不是string {image}")
+                continue
+
+            if not image.strip():
+                continue
+
+            image_urls.append(image)
+        return image_urls, errors
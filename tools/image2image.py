@@ -1,28 +1,50 @@
-import base64
-import re
+import hashlib
 import json
-import requests
-from urllib.parse import urlparse
+import time
+import uuid
 from collections.abc import Generator
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 from dify_plugin.entities.tool import ToolInvokeMessage
 from dify_plugin import Tool
 import config
+from utils import endpoints, memory, telemetry, tracing, transport, workload
+from utils.cache import LRUCache
+from utils.image import (
+    blob_messages,
+    build_image_json_body,
+    decoded_size,
+    download_image_conditional,
+    downscale_image,
+    fetch_images,
+    sniff_mime_type,
+)
+from utils.image_task import ASYNC_HEADERS, ImageTask
 import traceback
 
+# 输入图片预处理结果缓存，未缩小的图片同样缓存，重复编辑同一张图片时跳过下载和识别
+# ("image", sha256) -> (mime_type, 预处理后的图片, 原始大小, 预处理耗时ms)
+# ("url", 去掉签名参数的 url) -> (etag, sha256)
+_input_image_cache = LRUCache(config.IMAGE_INPUT_CACHE_BYTES)
+
+# Dify 文件 URL 每次请求都会重新签名，缓存键不包含这些参数
+_URL_SIGNATURE_PARAMS = frozenset({"timestamp", "nonce", "sign"})
+
+
+def _url_cache_key(url: str) -> tuple[str, str]:
+    """URL 层缓存键：去掉签名参数，同一文件的不同签名 URL 命中同一条目"""
+    parts = urlsplit(url)
+    query = [
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if name not in _URL_SIGNATURE_PARAMS
+    ]
+    return "url", urlunsplit(parts._replace(query=urlencode(query), fragment=""))
+
 class Image2ImageTool(Tool):
-    def _encode_image(self, file_data):
-        """将图片文件编码为base64"""
-        try:
-            # 记录图片大小
-            image_size = len(file_data) / 1024  # KB
-            encoded = base64.b64encode(file_data).decode("utf-8")
-            encoded_size = len(encoded) / 1024  # KB
-            debug_info = f"图片编码完成: 原始大小={image_size:.2f}KB, 编码后大小={encoded_size:.2f}KB"
-            return encoded, debug_info
-        except Exception as e:
-            stack_trace = traceback.format_exc()
-            raise Exception(f"图片编码失败: {str(e)}\n堆栈跟踪: {stack_trace}")
-        
+    @tracing.traced("tool.image2image")
+    @workload.captured("image2image", workload.image_tool_shape)
+    @endpoints.scoped_tool
     def _invoke(
         self, tool_parameters: dict
     ) -> Generator[ToolInvokeMessage, None, None]:
@@ -30,17 +52,16 @@ class Image2ImageTool(Tool):
         Invoke text-to-image generation tool
         """
         base_url = self.runtime.credentials.get("endpoint_url")
-
-        print(base_url)
-
         if not base_url:
             base_url = "https://aiping.cn/api/v1"
+        base_url = endpoints.register(base_url)
 
         api_key = self.runtime.credentials.get("api_key")
 
         url_router = "/images/generations"
 
         model = tool_parameters.get("model", "Qwen-Image")
+        tracing.current().set(model=model)
 
         prompt = tool_parameters.get("prompt", "")
         if not prompt:
@@ -50,7 +71,6 @@ class Image2ImageTool(Tool):
         negative_prompt = tool_parameters.get("negative_prompt", "模糊，低质量")
 
         image_file = tool_parameters.get("image")
-        print(image_file)
         if not image_file:
             yield self.create_text_message("请上传图片")
             return
@@ -59,6 +79,9 @@ class Image2ImageTool(Tool):
         try:
             # 处理不同类型的图片输入
             file_content = None
+            file_url = None
+            etag = None
+            prepared = None
 
             
             # 检查文件类型并获取文件内容
@@ -67,10 +90,30 @@ class Image2ImageTool(Tool):
                 file_url = image_file.url
                 yield self.create_text_message(f"正在从URL获取图片: {file_url[:30]}...")
                 try:
-                    response = requests.get(file_url, timeout=config.MAX_REQUEST_TIMEOUT)
-                    response.raise_for_status()
-                    file_content = response.content
-                    yield self.create_text_message(f"成功下载图片: 大小={len(file_content)/1024:.2f}KB")
+                    # 同一 URL 之前下载过时先用 ETag 确认内容未变化
+                    cached_url = _input_image_cache.get(_url_cache_key(file_url))
+                    if cached_url is not None:
+                        cached_etag, digest = cached_url
+                        prepared = _input_image_cache.get(("image", digest))
+                        if prepared is not None:
+                            with tracing.span("image.download", conditional=True):
+                                _, file_content, etag = download_image_conditional(
+                                    file_url, cached_etag
+                                )
+                            if file_content is None:
+                                yield self.create_text_message(
+                                    f"图片未变化，使用缓存: 节省下载={prepared[2]/1024:.2f}KB, "
+                                    f"节省处理={prepared[3]:.0f}ms"
+                                )
+                                self._record_cache_hit("etag", prepared[2], prepared[3])
+                                file_content = prepared[1]
+                            else:
+                                prepared = None
+                    if file_content is None:
+                        with tracing.span("image.download", conditional=False):
+                            _, file_content, etag = download_image_conditional(file_url)
+                    if prepared is None:
+                        yield self.create_text_message(f"成功下载图片: 大小={len(file_content)/1024:.2f}KB")
                 except Exception as e:
                     yield self.create_text_message(f"从URL下载图片失败: {str(e)}")
                     return
@@ -116,18 +159,21 @@ class Image2ImageTool(Tool):
             if file_content is None:
                 yield self.create_text_message("无法获取图片数据。请尝试重新上传图片或使用较小的图片文件")
                 return
+            workload.note(image_bytes=len(file_content))
             
-            # 编码图片数据为base64
-            try:
-                encoded_image, encoding_debug = self._encode_image(file_content)
-                yield self.create_text_message(encoding_debug)
-                
-                # 构建图片URL (AIPing API需要可访问的URL或base64数据)
-                image_data_url = f"data:image/png;base64,{encoded_image}"
-            except Exception as e:
-                yield self.create_text_message(f"图片编码失败: {str(e)}")
-                return
-                
+            if prepared is None:
+                digest = hashlib.sha256(file_content).hexdigest()
+                with tracing.span("image.prepare", bytes=len(file_content)):
+                    prepared = self._prepare_image(
+                        image_file, file_content, digest, file_url, etag
+                    )
+            mime_type, file_content, original_size, _ = prepared
+            encoded_size = (len(file_content) + 2) // 3 * 4
+            yield self.create_text_message(
+                f"图片编码完成: 类型={mime_type}, 原始大小={original_size/1024:.2f}KB, "
+                f"编码后大小={encoded_size/1024:.2f}KB"
+            )
+
         except Exception as e:
             stack_trace = traceback.format_exc()
             yield self.create_text_message(f"处理图片文件失败: {str(e)}\n堆栈跟踪:\n{stack_trace}")
@@ -144,15 +190,34 @@ class Image2ImageTool(Tool):
                 "Content-Type": "application/json",
             }
 
+            # 图片以 data URL 形式直接写入序列化后的请求体，避免多次复制 base64 数据
+            image_placeholder = f"__image_{uuid.uuid4().hex}__"
             data = {
                 "model": model,
-                "input": {"prompt": prompt, "negative_prompt": negative_prompt, "image": image_data_url},
+                "input": {"prompt": prompt, "negative_prompt": negative_prompt, "image": image_placeholder},
                 "extra_body": extra_body,
             }
+            # 图片数据、base64 请求体及其压缩副本只在构建和发送期间占用内存，
+            # 发送完毕即释放，等待生成结果期间不占用预算
+            encoded_size = (len(file_content) + 2) // 3 * 4
+            with memory.reserve(
+                "image2image", len(file_content) + encoded_size * 2
+            ) as reservation:
+                with tracing.span("image.encode"):
+                    body = transport.ReleasingBody(
+                        build_image_json_body(data, image_placeholder, mime_type, file_content),
+                        reservation.release,
+                    )
 
-            response = requests.post(
-                url, headers=headers, json=data, timeout=config.MAX_REQUEST_TIMEOUT
-            )
+                with tracing.span("image.submit", bytes=len(body)):
+                    response = transport.request(
+                        "POST",
+                        url,
+                        headers={**headers, **ASYNC_HEADERS} if config.IMAGE_ASYNC_SUBMIT else headers,
+                        data=body,
+                        timeout=config.MAX_REQUEST_TIMEOUT,
+                    )
+                del body
 
             response.encoding = "utf8"
 
@@ -161,11 +226,18 @@ class Image2ImageTool(Tool):
             if response.status_code != 200:
                 yield self.create_text_message(f"生成图像时出错: {str(result)}")
 
+            # 接口返回任务 ID 时轮询任务结果，不在长连接上等待生成完成
+            task = ImageTask(base_url, headers, result)
+            for progress in tracing.span("image.poll").wrap(task.poll()):
+                yield self.create_text_message(progress)
+            result = task.result
+
             images = result.get("data")
             if not images:
                 yield self.create_text_message(f"生成图像时出错: 图像列表为{images}")
 
             # 处理结果
+            image_inputs = []
             for image in images:
                 image = image.get("url")
 
@@ -178,74 +250,91 @@ class Image2ImageTool(Tool):
                 if not image.strip():
                     continue
 
-                # 解码图像
-                (mime_type, blob_image) = self._decode_image(image)
+                image_inputs.append(image)
 
-                # 创建二进制消息
-                yield self.create_blob_message(
-                    blob=blob_image, meta={"mime_type": mime_type}
-                )
+            # 并发下载/解码图像，单张失败不影响其它图像
+            fetched = tracing.span("image.fetch", images=len(image_inputs)).wrap(
+                fetch_images(image_inputs)
+            )
+            for _, mime_type, image_file, error in fetched:
+                if error is not None:
+                    yield self.create_text_message(f"生成图像时出错: {str(error)}")
+                    continue
+
+                # 从临时文件分块输出图像
+                yield from blob_messages(image_file, {"mime_type": mime_type})
                 yield self.create_text_message("图像生成成功！")
 
         except Exception as e:
             # 处理异常
             yield self.create_text_message(f"生成图像时出错: {str(e)}")
 
-    @staticmethod
-    def _decode_image(image_input: str) -> tuple[str, bytes]:
+    def _prepare_image(
+        self,
+        image_file,
+        file_content: bytes,
+        digest: str,
+        file_url: Optional[str] = None,
+        etag: Optional[str] = None,
+    ) -> tuple[str, bytes, int, float]:
         """
-        Decode an image from various input formats:
-        - Pure base64 string (e.g., "iVBORw...")
-        - Data URL (e.g., "data:image/png;base64,iVBORw...")
-        - HTTP/HTTPS URL (e.g., "https://example.com/image.jpg")
+        识别图片类型并按需缩小，结果按内容哈希缓存
+
+        带 ETag 的 URL 同时记录到 URL 层，下次可以用条件请求跳过下载
+
+        Args:
+            image_file: 工具参数中的图片文件
+            file_content: 原始图片数据
+            digest: 原始图片数据的 sha256
+            file_url: 图片 URL（可选）
+            etag: 下载图片时得到的 ETag（可选）
 
         Returns:
-            tuple: (mime_type: str, image_bytes: bytes)
+            (mime_type, 预处理后的图片, 原始大小, 预处理耗时ms)
         """
-        # Case 1: Data URL (starts with "data:")
-        if image_input.startswith("data:"):
-            # Example: data:image/png;base64,iVBORw...
-            match = re.match(r"data:(?P<mime>[^;]+);base64,(?P<data>.+)", image_input)
-            if not match:
-                raise ValueError("Invalid data URL format")
-            mime_type = match.group("mime")
-            b64_data = match.group("data")
-            image_bytes = base64.b64decode(b64_data)
-            return mime_type, image_bytes
-
-        # Case 2: HTTP/HTTPS URL
-        parsed = urlparse(image_input)
-        if parsed.scheme in ("http", "https"):
-            try:
-                response = requests.get(image_input, timeout=config.MAX_REQUEST_TIMEOUT)
-                response.raise_for_status()
-
-                # Try to get MIME type from Content-Type header
-                mime_type = response.headers.get("content-type", "image/unknown")
-                # Normalize common types
-                if mime_type.startswith("image/"):
-                    return mime_type, response.content
-                else:
-                    # Fallback: try to infer from extension
-                    ext = parsed.path.lower().split(".")[-1]
-                    mime_map = {
-                        "jpg": "image/jpeg",
-                        "jpeg": "image/jpeg",
-                        "png": "image/png",
-                        "gif": "image/gif",
-                        "webp": "image/webp",
-                    }
-                    mime_type = mime_map.get(ext, "image/unknown")
-                    return mime_type, response.content
-            except Exception as e:
-                raise ValueError(f"Failed to fetch image from URL: {e}")
-
-        # Case 3: Assume pure base64 string
-        try:
-            image_bytes = base64.b64decode(image_input, validate=True)
-            # Default to PNG if unknown (or you could return "image/unknown")
-            return "image/png", image_bytes
-        except Exception as e:
-            raise ValueError(
-                f"Input is not a valid base64 string, data URL, or image URL: {e}"
-            )
+        prepared = _input_image_cache.get(("image", digest))
+        if prepared is not None:
+            self._record_cache_hit("content", 0, prepared[3])
+            self._remember_url(file_url, etag, digest)
+            return prepared
+
+        started = time.monotonic()
+        # 按文件头识别图片类型，必要时缩小过大的输入图片
+        mime_type = (
+            sniff_mime_type(file_content)
+            or getattr(image_file, "mime_type", None)
+            or "image/png"
+        )
+        original_size = len(file_content)
+        if config.IMAGE_INPUT_MAX_SIDE > 0:
+            # 解码后的像素数据和缩小后的副本
+            with memory.reserve("image.prepare", decoded_size(file_content) * 2):
+                downscaled = downscale_image(
+                    file_content,
+                    config.IMAGE_INPUT_MAX_SIDE,
+                    image_format=config.VISION_IMAGE_FORMAT,
+                    quality=config.VISION_IMAGE_QUALITY,
+                    reencode=False,
+                )
+            if downscaled:
+                mime_type, file_content = downscaled
+        elapsed_ms = (time.monotonic() - started) * 1000
+
+        prepared = (mime_type, file_content, original_size, elapsed_ms)
+        _input_image_cache.put(("image", digest), prepared, len(file_content))
+        self._remember_url(file_url, etag, digest)
+        return prepared
+
+    @staticmethod
+    def _remember_url(file_url: Optional[str], etag: Optional[str], digest: str) -> None:
+        """记录 URL 对应的 ETag 和内容哈希，供下次条件请求使用"""
+        if file_url and etag:
+            key = _url_cache_key(file_url)
+            _input_image_cache.put(key, (etag, digest), len(key[1]) + len(etag))
+
+    @staticmethod
+    def _record_cache_hit(kind: str, bytes_saved: int, ms_saved: float) -> None:
+        """记录输入图片缓存命中及节省的下载字节数和处理耗时"""
+        telemetry.incr("image.input_cache_hit", kind=kind)
+        telemetry.incr("image.input_cache_bytes_saved", bytes_saved, kind=kind)
+        telemetry.incr("image.input_cache_ms_saved", ms_saved, kind=kind)
@@ -1,15 +1,46 @@
-import base64
-import re
+import hashlib
 import json
-import requests
-from urllib.parse import urlparse
+import logging
+import threading
 from collections.abc import Generator
+from typing import Optional
 from dify_plugin.entities.tool import ToolInvokeMessage
 from dify_plugin import Tool
 import config
+from utils import endpoints, telemetry, tracing, transport, workload
+from utils.cache import DiskLRUCache
+from utils.image import blob_messages, fetch_images
+from utils.image_task import ASYNC_HEADERS, ImageTask
+
+logger = logging.getLogger(__name__)
+
+# 带 seed 的生成结果磁盘缓存，首次使用时创建
+_result_cache: Optional[DiskLRUCache] = None
+_result_cache_failed = False
+_result_cache_lock = threading.Lock()
+
+
+def _get_result_cache() -> Optional[DiskLRUCache]:
+    """获取结果缓存，未配置 IMAGE_RESULT_CACHE_DIR 或目录不可用时返回 None"""
+    global _result_cache, _result_cache_failed
+    if not config.IMAGE_RESULT_CACHE_DIR or _result_cache_failed:
+        return None
+    with _result_cache_lock:
+        if _result_cache is None and not _result_cache_failed:
+            try:
+                _result_cache = DiskLRUCache(
+                    config.IMAGE_RESULT_CACHE_DIR, config.IMAGE_RESULT_CACHE_BYTES
+                )
+            except OSError as e:
+                logger.warning(f"Image result cache disabled: {e}")
+                _result_cache_failed = True
+    return _result_cache
 
 
 class Text2ImageTool(Tool):
+    @tracing.traced("tool.text2image")
+    @workload.captured("text2image", workload.image_tool_shape)
+    @endpoints.scoped_tool
     def _invoke(
         self, tool_parameters: dict
     ) -> Generator[ToolInvokeMessage, None, None]:
@@ -20,12 +51,14 @@ class Text2ImageTool(Tool):
 
         if not base_url:
             base_url = "https://aiping.cn/api/v1"
+        base_url = endpoints.register(base_url)
 
         api_key = self.runtime.credentials.get("api_key")
 
         url_router = "/images/generations"
 
         model = tool_parameters.get("model", "Qwen-Image")
+        tracing.current().set(model=model)
 
         prompt = tool_parameters.get("prompt", "")
         if not prompt:
@@ -51,9 +84,30 @@ class Text2ImageTool(Tool):
                 "extra_body": extra_body,
             }
 
-            response = requests.post(
-                url, headers=headers, json=data, timeout=config.MAX_REQUEST_TIMEOUT
-            )
+            # 固定 seed 的请求结果可复现，命中缓存时直接返回
+            result_cache = _get_result_cache() if extra_body.get("seed") is not None else None
+            cache_key = None
+            if result_cache is not None:
+                cache_key = self._result_cache_key(data)
+                cached = result_cache.get(cache_key)
+                if cached is not None:
+                    telemetry.incr("image.result_cache_hit", model=model)
+                    for mime_type, blob_image in self._unpack_images(cached):
+                        yield self.create_blob_message(
+                            blob=blob_image, meta={"mime_type": mime_type}
+                        )
+                        yield self.create_text_message("图像生成成功！")
+                    return
+                telemetry.incr("image.result_cache_miss", model=model)
+
+            with tracing.span("image.submit"):
+                response = transport.request(
+                    "POST",
+                    url,
+                    headers={**headers, **ASYNC_HEADERS} if config.IMAGE_ASYNC_SUBMIT else headers,
+                    json=data,
+                    timeout=config.MAX_REQUEST_TIMEOUT,
+                )
 
             response.encoding = "utf8"
 
@@ -62,15 +116,23 @@ class Text2ImageTool(Tool):
             if response.status_code != 200:
                 yield self.create_text_message(f"生成图像时出错: {str(result)}")
 
+            # 接口返回任务 ID 时轮询任务结果，不在长连接上等待生成完成
+            task = ImageTask(base_url, headers, result)
+            for progress in tracing.span("image.poll").wrap(task.poll()):
+                yield self.create_text_message(progress)
+            result = task.result
+
             images = result.get("data")
             if not images:
                 yield self.create_text_message(f"生成图像时出错: 图像列表为{images}")
 
             # 处理结果
+            image_inputs = []
             for image in images:
                 image = image.get("url")
 
                 if not isinstance(image, str):
+                    cache_key = None
                     yield self.create_text_message(
                         f"生成图像时出错: 图片类型不是string {image}"
                     )
@@ -79,74 +141,55 @@ class Text2ImageTool(Tool):
                 if not image.strip():
                     continue
 
-                # 解码图像
-                (mime_type, blob_image) = self._decode_image(image)
+                image_inputs.append(image)
 
-                # 创建二进制消息
-                yield self.create_blob_message(
-                    blob=blob_image, meta={"mime_type": mime_type}
-                )
+            # 并发下载/解码图像，单张失败不影响其它图像
+            generated = []
+            fetched = tracing.span("image.fetch", images=len(image_inputs)).wrap(
+                fetch_images(image_inputs)
+            )
+            for _, mime_type, image_file, error in fetched:
+                if error is not None:
+                    cache_key = None
+                    yield self.create_text_message(f"生成图像时出错: {str(error)}")
+                    continue
+                if cache_key:
+                    generated.append((mime_type, image_file.read()))
+                    image_file.seek(0)
+
+                # 从临时文件分块输出图像
+                yield from blob_messages(image_file, {"mime_type": mime_type})
                 yield self.create_text_message("图像生成成功！")
 
+            # 所有图像都成功时才写入缓存
+            if cache_key and generated:
+                result_cache.put(cache_key, self._pack_images(generated))
+
         except Exception as e:
             # 处理异常
             yield self.create_text_message(f"生成图像时出错: {str(e)}")
 
     @staticmethod
-    def _decode_image(image_input: str) -> tuple[str, bytes]:
-        """
-        Decode an image from various input formats:
-        - Pure base64 string (e.g., "iVBORw...")
-        - Data URL (e.g., "data:image/png;base64,iVBORw...")
-        - HTTP/HTTPS URL (e.g., "https://example.com/image.jpg")
+    def _result_cache_key(data: dict) -> str:
+        """按模型、提示词、负向提示词和 extra_body 的规范化 JSON 计算缓存键"""
+        canonical = json.dumps(
+            data, sort_keys=True, ensure_ascii=False, separators=(",", ":")
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
 
-        Returns:
-            tuple: (mime_type: str, image_bytes: bytes)
-        """
-        # Case 1: Data URL (starts with "data:")
-        if image_input.startswith("data:"):
-            # Example: data:image/png;base64,iVBORw...
-            match = re.match(r"data:(?P<mime>[^;]+);base64,(?P<data>.+)", image_input)
-            if not match:
-                raise ValueError("Invalid data URL format")
-            mime_type = match.group("mime")
-            b64_data = match.group("data")
-            image_bytes = base64.b64decode(b64_data)
-            return mime_type, image_bytes
-
-        # Case 2: HTTP/HTTPS URL
-        parsed = urlparse(image_input)
-        if parsed.scheme in ("http", "https"):
-            try:
-                response = requests.get(image_input, timeout=config.MAX_REQUEST_TIMEOUT)
-                response.raise_for_status()
-
-                # Try to get MIME type from Content-Type header
-                mime_type = response.headers.get("content-type", "image/unknown")
-                # Normalize common types
-                if mime_type.startswith("image/"):
-                    return mime_type, response.content
-                else:
-                    # Fallback: try to infer from extension
-                    ext = parsed.path.lower().split(".")[-1]
-                    mime_map = {
-                        "jpg": "image/jpeg",
-                        "jpeg": "image/jpeg",
-                        "png": "image/png",
-                        "gif": "image/gif",
-                        "webp": "image/webp",
-                    }
-                    mime_type = mime_map.get(ext, "image/unknown")
-                    return mime_type, response.content
-            except Exception as e:
-                raise ValueError(f"Failed to fetch image from URL: {e}")
-
-        # Case 3: Assume pure base64 string
-        try:
-            image_bytes = base64.b64decode(image_input, validate=True)
-            # Default to PNG if unknown (or you could return "image/unknown")
-            return "image/png", image_bytes
-        except Exception as e:
-            raise ValueError(
-                f"Input is not a valid base64 string, data URL, or image URL: {e}"
-            )
+    @staticmethod
+    def _pack_images(images: list[tuple[str, bytes]]) -> bytes:
+        """将多张图像打包为一个缓存条目：首行为 JSON 索引，其后依次为图像数据"""
+        header = json.dumps([[mime_type, len(blob)] for mime_type, blob in images])
+        return b"".join([header.encode("utf-8"), b"\n", *(blob for _, blob in images)])
+
+    @staticmethod
+    def _unpack_images(packed: bytes) -> list[tuple[str, bytes]]:
+        """解包 _pack_images 生成的缓存条目"""
+        newline = packed.index(b"\n")
+        offset = newline + 1
+        images = []
+        for mime_type, size in json.loads(packed[:newline]):
+            images.append((mime_type, packed[offset : offset + size]))
+            offset += size
+        return images
@@ -0,0 +1,116 @@
+"""
+跨请求微批处理
+同一分组内并发到达的小请求在短时间窗口内合并为一次上游请求，结果按顺序拆分回各调用方
+"""
+
+import threading
+from collections.abc import Callable, Hashable
+from typing import Any, Optional
+
+
+class _Batch:
+    __slots__ = ("items", "tokens", "callers", "ready", "done", "results", "usage", "error")
+
+    def __init__(self):
+        self.items: list = []
+        self.tokens = 0
+        self.callers = 0
+        self.ready = threading.Event()
+        self.done = threading.Event()
+        self.results: Optional[list] = None
+        self.usage: float = 0
+        self.error: Optional[BaseException] = None
+
+
+class MicroBatcher:
+    """
+    微批处理器
+
+    每个分组的第一个调用方成为发送方：等待 window 秒或批次达到数量/token 上限后，
+    以合并后的输入调用 send；其余调用方等待发送方分发结果。
+    上游返回的用量按各调用方估算的 token 数比例分摊
+    """
+
+    def __init__(self, window: float, max_items: int, max_tokens: int):
+        """
+        Args:
+            window: 合并窗口（秒）
+            max_items: 单批最多输入条数
+            max_tokens: 单批最多估算 token 数
+        """
+        self.window = window
+        self.max_items = max_items
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._open: dict[Hashable, _Batch] = {}
+
+    def fits(self, items: list, tokens: int) -> bool:
+        """单个请求本身是否在批次上限内，超过时调用方应直接发送"""
+        return len(items) <= self.max_items and tokens <= self.max_tokens
+
+    def submit(
+        self,
+        key: Hashable,
+        items: list,
+        tokens: int,
+        send: Callable[[list], tuple[list, float]],
+    ) -> tuple[list, float, int]:
+        """
+        提交一组输入并等待结果
+
+        Args:
+            key: 分组键，只有同组请求会被合并
+            items: 输入列表
+            tokens: 输入的估算 token 数
+            send: 发送合并后的输入，返回 (与输入一一对应的结果, 总用量)
+
+        Returns:
+            (本次输入对应的结果, 分摊的用量, 合并的调用方数)
+        """
+        with self._lock:
+            batch = self._open.get(key)
+            if batch is not None and (
+                len(batch.items) + len(items) > self.max_items
+                or batch.tokens + tokens > self.max_tokens
+            ):
+                # 当前批次放不下，通知发送方立即发送并开启新批次
+                self._close(key, batch)
+                batch = None
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch()
+            offset = len(batch.items)
+            batch.items.extend(items)
+            batch.tokens += tokens
+            batch.callers += 1
+            if len(batch.items) >= self.max_items or batch.tokens >= self.max_tokens:
+                self._close(key, batch)
+
+        if leader:
+            batch.ready.wait(self.window)
+            with self._lock:
+                self._close(key, batch)
+            try:
+                results, batch.usage = send(batch.items)
+                if len(results) != len(batch.items):
+                    raise ValueError(
+                        f"Batched request returned {len(results)} results for {len(batch.items)} inputs"
+                    )
+                batch.results = results
+            except BaseException as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        share = batch.usage * tokens / batch.tokens if batch.tokens else 0
+        return batch.results[offset : offset + len(items)], share, batch.callers
+
+    def _close(self, key: Hashable, batch: _Batch) -> Any:
+        """停止向批次追加输入（需持有锁）"""
+        if self._open.get(key) is batch:
+            del self._open[key]
+        batch.ready.set()
@@ -0,0 +1,178 @@
+"""
+插件内缓存
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    """按字节数限制容量的线程安全 LRU 缓存"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[Hashable, tuple[Any, int]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        读取缓存，命中时移动到最近使用的位置
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存值，未命中返回 None
+        """
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Hashable, value: Any, size: int) -> None:
+        """
+        写入缓存，超出容量时淘汰最久未使用的条目
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+            size: 缓存值占用的字节数
+        """
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._items[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self._size -= evicted_size
+
+    @property
+    def size(self) -> int:
+        """当前占用的字节数"""
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class DiskLRUCache:
+    """按字节数限制容量的磁盘 LRU 缓存，每个条目存为目录下的一个文件"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+        # 按修改时间恢复已有条目的使用顺序
+        entries = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._items[name] = size
+            self._size += size
+        with self._lock:
+            self._evict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        读取缓存，命中时移动到最近使用的位置
+
+        Args:
+            key: 可作为文件名的缓存键（如哈希值）
+
+        Returns:
+            缓存内容，未命中返回 None
+        """
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, "rb") as f:
+                value = f.read()
+            os.utime(path)
+        except OSError:
+            # 文件已被删除，视为未命中
+            with self._lock:
+                size = self._items.pop(key, None)
+                if size is not None:
+                    self._size -= size
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        """
+        写入缓存，超出容量时删除最久未使用的条目
+
+        Args:
+            key: 可作为文件名的缓存键（如哈希值）
+            value: 缓存内容
+        """
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        path = os.path.join(self.directory, key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= old
+            self._items[key] = size
+            self._size += size
+            self._evict()
+
+    def _evict(self) -> None:
+        """删除最久未使用的条目直到不超过容量，调用方需持有锁"""
+        while self._size > self.max_bytes and self._items:
+            name, size = self._items.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    @property
+    def size(self) -> int:
+        """当前占用的字节数"""
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._items)
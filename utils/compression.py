@@ -0,0 +1,140 @@
+"""
+请求体压缩
+超过 HTTP_COMPRESSION_MIN_BYTES 的 JSON 请求体按与服务端协商的编码（zstd / gzip）压缩后发送。
+服务端按 RFC 7694 在响应的 Accept-Encoding 中声明支持的请求编码；
+返回 415 时回退为不压缩并记住该服务不支持此编码。响应解压由 urllib3 流式完成
+"""
+
+import gzip
+import logging
+import threading
+from collections.abc import Mapping
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import config
+from utils import telemetry
+
+logger = logging.getLogger(__name__)
+
+# gzip 使用最低压缩级别：长提示词和 base64 图片在该级别已能压缩大部分体积，CPU 开销最小
+_GZIP_LEVEL = 1
+_ZSTD_LEVEL = 3
+
+_lock = threading.Lock()
+# 各服务在响应中声明支持的请求编码
+_accepted: dict[str, frozenset[str]] = {}
+# 各服务以 415 拒绝过的请求编码
+_rejected: set[tuple[str, str]] = set()
+_zstd_compressor: Any = None
+_zstd_checked = False
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _zstd() -> Any:
+    """获取 zstd 压缩器，未安装 zstandard 时返回 None"""
+    global _zstd_compressor, _zstd_checked
+    if not _zstd_checked:
+        try:
+            import zstandard
+
+            _zstd_compressor = zstandard.ZstdCompressor(level=_ZSTD_LEVEL)
+        except ImportError:
+            if config.HTTP_REQUEST_COMPRESSION == "zstd":
+                logger.warning("zstandard is not installed, compress request bodies with gzip")
+        _zstd_checked = True
+    return _zstd_compressor
+
+
+def choose_encoding(url: str) -> Optional[str]:
+    """
+    选择发往该地址的请求体编码
+
+    auto 只使用服务端声明支持的编码（优先 zstd）；gzip / zstd 直接使用配置的编码，
+    除非服务端拒绝过；未安装 zstandard 时 zstd 回退为 gzip
+
+    Returns:
+        编码名称，不压缩时返回 None
+    """
+    mode = config.HTTP_REQUEST_COMPRESSION
+    if mode not in ("auto", "gzip", "zstd"):
+        return None
+    origin = _origin(url)
+    if mode == "auto":
+        candidates = [e for e in ("zstd", "gzip") if e in _accepted.get(origin, ())]
+    else:
+        candidates = ["zstd", "gzip"] if mode == "zstd" else ["gzip"]
+    for encoding in candidates:
+        if encoding == "zstd" and _zstd() is None:
+            continue
+        if (origin, encoding) not in _rejected:
+            return encoding
+    return None
+
+
+def compress_body(url: str, headers: Mapping[str, str], body: Any) -> Optional[tuple[str, bytes]]:
+    """
+    按需压缩请求体
+
+    Args:
+        url: 请求地址
+        headers: 请求头
+        body: 请求体
+
+    Returns:
+        (编码, 压缩后的请求体)；非 JSON、未达到大小阈值、已编码、压缩无收益或不压缩时返回 None
+    """
+    if isinstance(body, str):
+        # data=json.dumps(...) 传入的字符串请求体，发送时同样按 UTF-8 编码
+        body = body.encode("utf-8")
+    elif not isinstance(body, (bytes, bytearray, memoryview)):
+        return None
+    if len(body) < config.HTTP_COMPRESSION_MIN_BYTES:
+        return None
+    if "json" not in (headers.get("Content-Type") or "") or headers.get("Content-Encoding"):
+        return None
+    encoding = choose_encoding(url)
+    if encoding is None:
+        return None
+
+    if encoding == "zstd":
+        compressed = _zstd().compress(body)
+    else:
+        compressed = gzip.compress(body, compresslevel=_GZIP_LEVEL, mtime=0)
+    if len(compressed) >= len(body):
+        return None
+    telemetry.incr("http.request_bytes", len(body), encoding=encoding)
+    telemetry.incr("http.request_wire_bytes", len(compressed), encoding=encoding)
+    return encoding, compressed
+
+
+def observe_response(url: str, status: int, headers: Mapping[str, str], encoding: Optional[str]) -> bool:
+    """
+    根据响应更新服务端支持的请求编码
+
+    Args:
+        url: 请求地址
+        status: 响应状态码
+        headers: 响应头
+        encoding: 本次请求体使用的编码
+
+    Returns:
+        服务端以 415 拒绝了该编码、需要不压缩重发时返回 True
+    """
+    origin = _origin(url)
+    accept = headers.get("Accept-Encoding")
+    if accept is not None:
+        encodings = frozenset(e.split(";")[0].strip().lower() for e in accept.split(","))
+        if _accepted.get(origin) != encodings:
+            with _lock:
+                _accepted[origin] = encodings
+    if encoding is None or status != 415:
+        return False
+    with _lock:
+        _rejected.add((origin, encoding))
+    telemetry.incr("http.compression_rejected", encoding=encoding, host=urlsplit(url).hostname)
+    return True
@@ -0,0 +1,101 @@
+"""
+AIPing API Key 校验
+使用最便宜的鉴权请求校验，并按凭证哈希缓存校验结果
+"""
+
+import hashlib
+import threading
+import time
+from typing import Optional
+
+import requests
+from yarl import URL
+
+import config
+from utils import endpoints, transport
+
+_lock = threading.Lock()
+_validated: dict[str, float] = {}
+
+
+def _cache_key(endpoint_url: str, api_key: str) -> str:
+    return hashlib.sha256(f"{endpoint_url}\n{api_key}".encode()).hexdigest()
+
+
+def validate_api_key(endpoint_url: str, api_key: str) -> None:
+    """
+    校验 API Key，失败时抛出 ValueError
+
+    先请求 /models 获取模型目录（401/403 直接判定失败），目录中有 CREDENTIALS_PROBE_MODEL
+    列出的低价模型时再发起 max_tokens=1 的补全请求确认 Key 可用，没有时只校验 /models。
+    校验通过的凭证在 CREDENTIALS_CACHE_TTL 秒内不会重复校验
+
+    Args:
+        endpoint_url: API endpoint URL，可以用逗号分隔多个地址
+        api_key: API Key
+    """
+    if not api_key:
+        raise ValueError("API Key is required")
+
+    # 校验请求只在本次登记的地址组内选择地址
+    with endpoints.scope(endpoint_url) as primary_url:
+        _validate(primary_url, api_key)
+
+
+def _validate(endpoint_url: str, api_key: str) -> None:
+    """校验主地址为 endpoint_url 的 API Key，需在对应的 endpoints.scope 内调用"""
+    key = _cache_key(endpoint_url, api_key)
+    with _lock:
+        expires_at = _validated.get(key)
+    if expires_at and expires_at > time.monotonic():
+        return
+
+    headers = {"Authorization": f"Bearer {api_key}"}
+    try:
+        response = transport.session().get(
+            str(URL(endpoint_url) / "models"), headers=headers, timeout=(10, 60)
+        )
+        if response.status_code in (401, 403):
+            raise ValueError(f"Invalid API Key: {response.text}")
+        response.raise_for_status()
+
+        probe_model = _pick_probe_model(response.json())
+        if probe_model:
+            response = transport.session().post(
+                str(URL(endpoint_url) / "chat" / "completions"),
+                headers=headers,
+                json={
+                    "model": probe_model,
+                    "messages": [{"role": "user", "content": "ping"}],
+                    "max_tokens": 1,
+                    "stream": False,
+                    "extra_body": {"enable_thinking": False},
+                },
+                timeout=(10, 60),
+            )
+    except requests.RequestException as e:
+        raise ValueError(f"Credentials validation request failed: {e}") from e
+    if response.status_code != 200:
+        raise ValueError(
+            f"Credentials validation failed with status code {response.status_code}: {response.text}"
+        )
+
+    with _lock:
+        _validated[key] = time.monotonic() + config.CREDENTIALS_CACHE_TTL
+
+
+def _pick_probe_model(catalog: dict) -> Optional[str]:
+    """
+    选择补全校验使用的模型
+
+    Returns:
+        CREDENTIALS_PROBE_MODEL 中第一个在模型目录里可用的 LLM；都不可用时返回 None
+    """
+    available = set()
+    for model in (catalog or {}).get("data") or []:
+        model_type = model.get("model_type")
+        model_types = model_type if isinstance(model_type, list) else [model_type]
+        if "llm" in model_types and model.get("status") and not model.get("is_foreign"):
+            available.add(model.get("id"))
+    candidates = [m.strip() for m in config.CREDENTIALS_PROBE_MODEL.split(",") if m.strip()]
+    return next((m for m in candidates if m in available), None)
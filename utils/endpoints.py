@@ -0,0 +1,320 @@
+"""
+多 API 地址选择
+AIPING_BASE_URL 和凭证中的 endpoint_url 可以配置以逗号分隔的多个地址，第一个为主地址。
+调用方照常用主地址拼接请求地址，传输层发送前按当前调用的地址组排序替换为最快的可用地址；
+幂等请求遇到连接错误时依次改用组内其它地址，请求返回网关错误时该地址在下次探测成功前排到最后。
+地址组只在登记它的调用内生效（scope / scoped / scoped_tool），不同凭证的调用之间互不影响
+"""
+
+import contextlib
+import contextvars
+import functools
+import logging
+import threading
+import time
+from collections.abc import Callable, Generator, Iterator
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import config
+from utils import telemetry
+
+logger = logging.getLogger(__name__)
+
+# 连接失败时可以改用其它地址重发的请求：只读方法和不产生服务端状态的推理接口
+_IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+_IDEMPOTENT_POST_PATHS = ("/chat/completions", "/completions", "/embeddings", "/rerank")
+
+# 实际请求返回这些状态码时认为该地址暂时不可用
+GATEWAY_ERRORS = frozenset({502, 503, 504})
+
+_lock = threading.Lock()
+# 按完整地址列表分组；同一地址在各组间共用一个 Endpoint，健康状态和统计不会因配置不同而分裂
+_groups: dict[tuple[str, ...], "EndpointGroup"] = {}
+_endpoints: dict[str, "Endpoint"] = {}
+# 登记过的 API 地址的主机名，指标按主机名打标签时其它主机（如用户提供的图片地址）归为 "other"
+_hosts: set[str] = set()
+# 当前调用登记的地址组；只有一个地址的调用为 None，请求不做任何替换
+_current: contextvars.ContextVar[Optional["EndpointGroup"]] = contextvars.ContextVar(
+    "endpoint_group", default=None
+)
+_prober: Optional[threading.Thread] = None
+
+
+class Endpoint:
+    """单个地址的健康状态、探测耗时 EWMA 和选择统计"""
+
+    __slots__ = (
+        "url", "healthy", "latency_ms", "selected", "failovers", "connect_errors", "gateway_errors",
+        "probe_failures",
+    )
+
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = True
+        self.latency_ms: Optional[float] = None
+        self.selected = 0
+        self.failovers = 0
+        self.connect_errors = 0
+        self.gateway_errors = 0
+        self.probe_failures = 0
+
+
+class EndpointGroup:
+    """同一配置中的一组地址"""
+
+    def __init__(self, urls: tuple[str, ...], endpoints: list[Endpoint]):
+        self.urls = urls
+        self.primary = endpoints[0].url
+        self.endpoints = endpoints
+
+    def match(self, url: str) -> Optional[str]:
+        """请求地址以主地址开头时返回其余部分，否则返回 None"""
+        key = self.primary
+        if url.startswith(key) and url[len(key) : len(key) + 1] in ("", "/", "?"):
+            return url[len(key) :]
+        return None
+
+    def ranked(self) -> list[Endpoint]:
+        """可用地址在前，按探测耗时升序；尚无探测结果的地址保持配置顺序排在后面"""
+        return sorted(
+            self.endpoints,
+            key=lambda e: (not e.healthy, e.latency_ms is None, e.latency_ms or 0),
+        )
+
+
+def parse(value: str) -> list[str]:
+    """拆分以逗号分隔的地址列表"""
+    return [url.strip() for url in (value or "").split(",") if url.strip()]
+
+
+def register(value: str) -> str:
+    """
+    登记地址配置，返回调用方用于拼接请求地址的主地址
+
+    只有一个地址时不做任何处理；多个地址时登记为一组并启动后台健康探测。
+    登记本身不影响请求路由，需要在 scope 内发出请求
+
+    Args:
+        value: 单个地址或以逗号分隔的多个地址
+
+    Returns:
+        主地址（第一个地址）
+    """
+    urls = parse(value)
+    _group(urls)
+    return urls[0] if urls else value
+
+
+@contextlib.contextmanager
+def scope(value: str) -> Iterator[str]:
+    """
+    登记地址配置，并在 with 块内作为当前调用的地址组，退出时恢复
+
+    只有一个地址时块内的请求不做替换，即使外层调用登记过其它地址组
+
+    Args:
+        value: 单个地址或以逗号分隔的多个地址
+
+    Returns:
+        主地址（第一个地址）
+    """
+    urls = parse(value)
+    token = _current.set(_group(urls))
+    try:
+        yield urls[0] if urls else value
+    finally:
+        _current.reset(token)
+
+
+def scoped(method: Callable) -> Callable:
+    """模型方法装饰器：方法 (self, model, credentials, ...) 执行期间使用凭证中 endpoint_url 的地址组"""
+
+    @functools.wraps(method)
+    def wrapper(self, model: str, credentials: dict, *args: Any, **kwargs: Any) -> Any:
+        with scope(credentials.get("endpoint_url") or ""):
+            return method(self, model, credentials, *args, **kwargs)
+
+    return wrapper
+
+
+def scoped_tool(method: Callable[..., Generator]) -> Callable[..., Generator]:
+    """
+    工具 _invoke 装饰器：使用工具凭证中 endpoint_url 的地址组
+
+    地址组只在生成器每次恢复执行期间生效，yield 出去后即恢复，不会留给消费方的后续调用
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args: Any, **kwargs: Any) -> Generator:
+        group = _group(parse(self.runtime.credentials.get("endpoint_url") or ""))
+        messages = method(self, *args, **kwargs)
+        while True:
+            token = _current.set(group)
+            try:
+                message = next(messages)
+            except StopIteration:
+                return
+            finally:
+                _current.reset(token)
+            yield message
+
+    return wrapper
+
+
+def route(method: str, url: str) -> Optional[list[tuple[Endpoint, str]]]:
+    """
+    为请求选择地址
+
+    Args:
+        method: 请求方法
+        url: 以主地址拼接的请求地址
+
+    Returns:
+        按优先级排列的 (地址, 替换后的请求地址)；非幂等请求只返回首选地址。
+        当前调用没有登记多地址配置、或请求地址不以其主地址开头时返回 None
+    """
+    group = _current.get()
+    if group is None:
+        return None
+    suffix = group.match(url)
+    if suffix is None:
+        return None
+    ranked = group.ranked()
+    if not _is_idempotent(method, suffix):
+        ranked = ranked[:1]
+    return [(endpoint, endpoint.url + suffix) for endpoint in ranked]
+
+
+def record_attempt(endpoint: Endpoint, failover: bool = False) -> None:
+    """记录一次发往该地址的请求，failover 表示前一个地址连接失败后改用该地址"""
+    endpoint.selected += 1
+    telemetry.incr("endpoint.selected", endpoint=endpoint.url)
+    if failover:
+        endpoint.failovers += 1
+        telemetry.incr("endpoint.failovers", endpoint=endpoint.url)
+
+
+def record_connect_error(endpoint: Endpoint) -> None:
+    """请求连接失败，在下次探测成功前把该地址排到最后"""
+    endpoint.connect_errors += 1
+    telemetry.incr("endpoint.connect_errors", endpoint=endpoint.url)
+    _set_healthy(endpoint, False)
+
+
+def record_response(endpoint: Endpoint, status_code: int) -> None:
+    """请求返回网关错误（502/503/504）时，在下次探测成功前把该地址排到最后"""
+    if status_code in GATEWAY_ERRORS:
+        endpoint.gateway_errors += 1
+        telemetry.incr("endpoint.gateway_errors", endpoint=endpoint.url, status=status_code)
+        _set_healthy(endpoint, False)
+
+
+def stats() -> dict[str, list[dict]]:
+    """
+    获取各组地址的选择统计
+
+    Returns:
+        {以逗号连接的地址列表: [{url, healthy, latency_ms, selected, failovers, connect_errors,
+        gateway_errors, probe_failures}]}，每组按当前优先级排列
+    """
+    return {
+        ",".join(key): [
+            {
+                "url": e.url,
+                "healthy": e.healthy,
+                "latency_ms": round(e.latency_ms, 1) if e.latency_ms is not None else None,
+                "selected": e.selected,
+                "failovers": e.failovers,
+                "connect_errors": e.connect_errors,
+                "gateway_errors": e.gateway_errors,
+                "probe_failures": e.probe_failures,
+            }
+            for e in group.ranked()
+        ]
+        for key, group in list(_groups.items())
+    }
+
+
+def host_label(url: str) -> str:
+    """
+    指标的主机名标签
+
+    Returns:
+        登记过的 API 地址返回其主机名，其它地址返回 "other"，避免标签数量随用户输入增长
+    """
+    host = urlsplit(url).hostname
+    return host if host in _hosts else "other"
+
+
+def _group(urls: list[str]) -> Optional[EndpointGroup]:
+    """取得多个地址对应的地址组，首次出现时登记并启动后台探测；单个地址返回 None"""
+    for url in urls:
+        host = urlsplit(url).hostname
+        if host and host not in _hosts:
+            with _lock:
+                _hosts.add(host)
+    if len(urls) <= 1:
+        return None
+    key = tuple(url.rstrip("/") for url in urls)
+    group = _groups.get(key)
+    if group is None:
+        with _lock:
+            group = _groups.get(key)
+            if group is None:
+                group = EndpointGroup(
+                    key, [_endpoints.setdefault(url, Endpoint(url)) for url in key]
+                )
+                _groups[key] = group
+            _start_prober()
+    return group
+
+
+def _is_idempotent(method: str, suffix: str) -> bool:
+    method = method.upper()
+    if method in _IDEMPOTENT_METHODS:
+        return True
+    return method == "POST" and urlsplit(suffix).path.endswith(_IDEMPOTENT_POST_PATHS)
+
+
+def _set_healthy(endpoint: Endpoint, healthy: bool) -> None:
+    if endpoint.healthy != healthy:
+        endpoint.healthy = healthy
+        telemetry.record("endpoint.health", endpoint=endpoint.url, healthy=healthy)
+
+
+def _observe(endpoint: Endpoint, latency_ms: float) -> None:
+    """以 EWMA 平滑探测耗时"""
+    alpha = config.ENDPOINT_EWMA_ALPHA
+    if endpoint.latency_ms is None:
+        endpoint.latency_ms = latency_ms
+    else:
+        endpoint.latency_ms = alpha * latency_ms + (1 - alpha) * endpoint.latency_ms
+
+
+def _start_prober() -> None:
+    """启动后台探测线程（需持有锁）"""
+    global _prober
+    if _prober is None:
+        _prober = threading.Thread(target=_probe_loop, name="aiping-endpoints", daemon=True)
+        _prober.start()
+
+
+def _probe_loop() -> None:
+    # 探测复用 transport 的连接池，延迟导入以避免循环依赖
+    from utils import transport
+
+    while True:
+        # 各组共用 Endpoint，多组配置中重复的地址只探测一次
+        for endpoint in list(_endpoints.values()):
+            try:
+                latency_ms = transport.probe(endpoint.url, config.ENDPOINT_PROBE_TIMEOUT)
+            except Exception as e:
+                logger.debug("Endpoint probe for %s failed: %s", endpoint.url, e)
+                endpoint.probe_failures += 1
+                telemetry.incr("endpoint.probe_failures", endpoint=endpoint.url)
+                _set_healthy(endpoint, False)
+            else:
+                _observe(endpoint, latency_ms)
+                _set_healthy(endpoint, True)
+        time.sleep(config.ENDPOINT_PROBE_INTERVAL)
@@ -0,0 +1,542 @@
+"""
+图片处理工具
+"""
+
+import base64
+import binascii
+import io
+import json
+import logging
+import tempfile
+import time
+import uuid
+from collections.abc import Callable, Generator, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Any, BinaryIO, Optional
+from urllib.parse import urlparse
+
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+import config
+from utils import memory, transport
+
+logger = logging.getLogger(__name__)
+
+# 流式读取时每块的大小；base64 按 4 的倍数分块解码
+_CHUNK_SIZE = 64 * 1024
+_B64_CHUNK_SIZE = 4 * _CHUNK_SIZE
+# 与 SDK 切分 blob 消息的块大小一致
+_BLOB_CHUNK_SIZE = 8192
+
+_EXTENSION_MIME_TYPES = {
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "gif": "image/gif",
+    "webp": "image/webp",
+}
+
+# 按文件头识别图片类型：(偏移, 魔数, mime_type)
+_MAGIC_MIME_TYPES = (
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (8, b"WEBP", "image/webp"),
+    (0, b"BM", "image/bmp"),
+    (0, b"II*\x00", "image/tiff"),
+    (0, b"MM\x00*", "image/tiff"),
+    (4, b"ftypavif", "image/avif"),
+    (4, b"ftypheic", "image/heic"),
+    (4, b"ftypheix", "image/heic"),
+    (4, b"ftypmif1", "image/heif"),
+)
+
+# 识别图片类型需要读取的文件头长度
+_MAGIC_SIZE = max(offset + len(magic) for offset, magic, _ in _MAGIC_MIME_TYPES)
+
+_FORMAT_MIME_TYPES = {
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "png": "image/png",
+}
+
+
+def downscale_image(
+    image_bytes: bytes,
+    max_side: int,
+    max_pixels: Optional[int] = None,
+    image_format: str = "jpeg",
+    quality: int = 85,
+    reencode: bool = True,
+) -> Optional[tuple[str, bytes]]:
+    """
+    缩小图片并重新编码
+
+    长边超过 max_side 或总像素超过 max_pixels 时等比缩小；
+    带透明通道的图片使用 WebP 编码以保留透明度
+
+    Args:
+        image_bytes: 原始图片数据
+        max_side: 长边最大像素
+        max_pixels: 总像素上限（可选）
+        image_format: 目标格式（jpeg / webp）
+        quality: 编码质量（1-100）
+        reencode: 尺寸未超限时是否也重新编码
+
+    Returns:
+        (mime_type, 处理后的图片数据)；未安装 Pillow、无法解码或结果不比原图小时返回 None
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.warning("Pillow is not installed, skip image downscaling")
+        return None
+
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            # 动图只处理第一帧会丢失内容，保持原样
+            if getattr(image, "is_animated", False):
+                return None
+            width, height = image.size
+            scale = min(1.0, max_side / max(width, height))
+            if max_pixels:
+                scale = min(scale, (max_pixels / (width * height)) ** 0.5)
+            if scale >= 1.0 and not reencode:
+                return None
+            if scale < 1.0:
+                image = image.resize(
+                    (max(int(width * scale), 1), max(int(height * scale), 1)),
+                    Image.Resampling.LANCZOS,
+                )
+
+            has_alpha = image.mode in ("RGBA", "LA") or (
+                image.mode == "P" and "transparency" in image.info
+            )
+            target_format = "webp" if has_alpha else image_format.lower()
+            if target_format not in _FORMAT_MIME_TYPES:
+                target_format = "jpeg"
+            if target_format == "jpeg" and image.mode != "RGB":
+                image = image.convert("RGB")
+            elif has_alpha and image.mode != "RGBA":
+                image = image.convert("RGBA")
+
+            output = io.BytesIO()
+            image.save(output, format=target_format.upper(), quality=quality)
+    except Exception as e:
+        logger.warning(f"Failed to downscale image: {e}")
+        return None
+
+    result = output.getvalue()
+    if len(result) >= len(image_bytes):
+        return None
+    return _FORMAT_MIME_TYPES[target_format], result
+
+
+def decoded_size(image_bytes: bytes) -> int:
+    """
+    读取图片头部，估算解码后的像素数据大小
+
+    Returns:
+        字节数；未安装 Pillow 或无法识别时返回 0
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return 0
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            return image.width * image.height * len(image.getbands())
+    except Exception:
+        return 0
+
+
+def decode_image(
+    image_input: str, timeout: Optional[float] = None
+) -> tuple[str, bytes]:
+    """
+    Decode an image into bytes, see open_image for the accepted formats.
+
+    Only for callers that need the whole image in memory (hashing,
+    Pillow); results that are just passed on should use open_image.
+
+    Returns:
+        tuple: (mime_type: str, image_bytes: bytes)
+    """
+    mime_type, image_file = open_image(image_input, timeout)
+    with image_file:
+        return mime_type, image_file.read()
+
+
+def open_image(
+    image_input: str, timeout: Optional[float] = None
+) -> tuple[str, BinaryIO]:
+    """
+    Decode an image from various input formats into a spooled temp file:
+    - Pure base64 string (e.g., "iVBORw...")
+    - Data URL (e.g., "data:image/png;base64,iVBORw...")
+    - HTTP/HTTPS URL (e.g., "https://example.com/image.jpg")
+
+    Downloads are streamed in chunks and capped at IMAGE_MAX_BYTES; data
+    larger than IMAGE_SPOOL_BYTES stays in the temp file on disk, so the
+    image is never held in memory as a whole.
+
+    Args:
+        image_input: base64 string, data URL or image URL
+        timeout: total download time limit in seconds for URLs
+
+    Returns:
+        tuple: (mime_type: str, image_file) -- the file is positioned at
+        the start and must be closed by the caller
+    """
+    # Case 1: Data URL (starts with "data:")
+    if image_input.startswith("data:"):
+        # Example: data:image/png;base64,iVBORw...
+        comma = image_input.find(",")
+        header = image_input[5:comma] if comma != -1 else ""
+        mime_type, _, encoding = header.partition(";")
+        if not mime_type or encoding != "base64" or comma == len(image_input) - 1:
+            raise ValueError("Invalid data URL format")
+        try:
+            return mime_type, _b64decode_spooled(image_input, comma + 1)
+        except binascii.Error as e:
+            raise ValueError(f"Invalid base64 data in data URL: {e}")
+
+    # Case 2: HTTP/HTTPS URL
+    parsed = urlparse(image_input)
+    if parsed.scheme in ("http", "https"):
+        try:
+            mime_type, image_file, _ = _download_spooled(image_input, None, timeout)
+            return mime_type, image_file
+        except Exception as e:
+            raise ValueError(f"Failed to fetch image from URL: {e}")
+
+    # Case 3: Assume pure base64 string
+    try:
+        image_file = _b64decode_spooled(image_input, 0, validate=True)
+    except Exception as e:
+        raise ValueError(
+            f"Input is not a valid base64 string, data URL, or image URL: {e}"
+        )
+    # Default to PNG if the header is not recognized
+    mime_type = sniff_mime_type(image_file.read(_MAGIC_SIZE)) or "image/png"
+    image_file.seek(0)
+    return mime_type, image_file
+
+
+def download_image(url: str, timeout: Optional[float] = None) -> tuple[str, bytes]:
+    """
+    流式下载图片
+
+    Args:
+        url: 图片 URL
+        timeout: 下载总耗时上限（秒），默认使用 MAX_REQUEST_TIMEOUT
+
+    Returns:
+        (mime_type, 图片数据)
+    """
+    mime_type, image_bytes, _ = download_image_conditional(url, timeout=timeout)
+    return mime_type, image_bytes
+
+
+def download_image_conditional(
+    url: str, etag: Optional[str] = None, timeout: Optional[float] = None
+) -> tuple[Optional[str], Optional[bytes], Optional[str]]:
+    """
+    流式下载图片，带 ETag 时发送条件请求
+
+    Args:
+        url: 图片 URL
+        etag: 上次下载得到的 ETag
+        timeout: 下载总耗时上限（秒），默认使用 MAX_REQUEST_TIMEOUT
+
+    Returns:
+        (mime_type, 图片数据, ETag)；服务端返回 304 时 mime_type 和图片数据为 None
+    """
+    mime_type, image_file, etag = _download_spooled(url, etag, timeout)
+    if image_file is None:
+        return None, None, etag
+    with image_file:
+        return mime_type, image_file.read(), etag
+
+
+def fetch_images(
+    image_inputs: list[str], ordered: Optional[bool] = None
+) -> Generator[tuple[int, Optional[str], Optional[BinaryIO], Optional[Exception]], None, None]:
+    """
+    并发下载/解码多张图片
+
+    使用大小为 IMAGE_FETCH_CONCURRENCY 的线程池；每张图片单独计时，慢的图片不会拖住其它图片
+
+    Args:
+        image_inputs: 图片列表（base64、data URL 或 URL）
+        ordered: 是否按输入顺序返回，默认使用 IMAGE_FETCH_ORDERED；
+            否则哪张先完成先返回哪张
+
+    Returns:
+        (下标, mime_type, 图片文件, 异常) 生成器，失败时 mime_type 和图片文件为 None；
+        图片文件由调用方关闭，可以交给 blob_messages 输出
+    """
+    if ordered is None:
+        ordered = config.IMAGE_FETCH_ORDERED
+    timeout = config.IMAGE_FETCH_TIMEOUT
+
+    if len(image_inputs) <= 1:
+        for index, image_input in enumerate(image_inputs):
+            try:
+                yield (index, *open_image(image_input, timeout), None)
+            except Exception as e:
+                yield index, None, None, e
+        return
+
+    pool = ThreadPoolExecutor(
+        max_workers=min(config.IMAGE_FETCH_CONCURRENCY, len(image_inputs))
+    )
+    futures: dict[Future, int] = {}
+    claimed: set[Future] = set()
+    try:
+        futures = {
+            pool.submit(open_image, image_input, timeout): index
+            for index, image_input in enumerate(image_inputs)
+        }
+        for future in futures if ordered else as_completed(futures):
+            index = futures[future]
+            claimed.add(future)
+            try:
+                yield (index, *future.result(), None)
+            except Exception as e:
+                yield index, None, None, e
+    finally:
+        # 调用方提前停止迭代时不再等待剩余下载，已下载和下载中的图片文件由线程池关闭
+        pool.shutdown(wait=False, cancel_futures=True)
+        close_unclaimed(futures, claimed, lambda result: [result[1]])
+
+
+def close_unclaimed(
+    futures: Iterable[Future], claimed: set[Future], files: Callable[[Any], Iterable[BinaryIO]]
+) -> None:
+    """
+    关闭没有交给调用方的任务结果中的文件
+
+    已完成的任务立即关闭，仍在执行的任务完成后关闭，被取消或失败的任务忽略
+
+    Args:
+        futures: 线程池任务
+        claimed: 结果已交给调用方的任务
+        files: 从任务结果中取出文件
+    """
+
+    def close_result(future: Future) -> None:
+        if future.cancelled() or future.exception() is not None:
+            return
+        for file in files(future.result()):
+            file.close()
+
+    for future in futures:
+        if future not in claimed:
+            future.add_done_callback(close_result)
+
+
+def sniff_mime_type(image_bytes: bytes) -> Optional[str]:
+    """
+    根据文件头识别图片类型
+
+    Returns:
+        mime_type；无法识别时返回 None
+    """
+    for offset, magic, mime_type in _MAGIC_MIME_TYPES:
+        if image_bytes[offset : offset + len(magic)] == magic:
+            return mime_type
+    return None
+
+
+def build_image_json_body(
+    payload: dict, placeholder: str, mime_type: str, image_bytes: bytes
+) -> bytearray:
+    """
+    构建内嵌 base64 图片的 JSON 请求体
+
+    payload 中图片位置填入 placeholder，序列化后在该位置直接写入
+    data URL；base64 分块编码进预先分配好的缓冲区，不生成完整的中间字符串
+
+    Args:
+        payload: 请求体
+        placeholder: 图片位置的占位字符串
+        mime_type: 图片类型
+        image_bytes: 图片数据
+
+    Returns:
+        UTF-8 编码的 JSON 请求体
+    """
+    serialized = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    prefix, found, suffix = serialized.partition(
+        json.dumps(placeholder).encode("utf-8")
+    )
+    if not found:
+        raise ValueError("Image placeholder not found in payload")
+
+    head = prefix + f'"data:{mime_type};base64,'.encode("utf-8")
+    tail = b'"' + suffix
+    encoded_size = (len(image_bytes) + 2) // 3 * 4
+
+    body = bytearray(len(head) + encoded_size + len(tail))
+    view = memoryview(body)
+    view[: len(head)] = head
+    position = len(head)
+    source = memoryview(image_bytes)
+    # 每块 3 的倍数字节，保证分块编码结果可以直接拼接
+    step = 3 * _CHUNK_SIZE
+    for i in range(0, len(source), step):
+        chunk = binascii.b2a_base64(source[i : i + step], newline=False)
+        view[position : position + len(chunk)] = chunk
+        position += len(chunk)
+    view[position:] = tail
+    return body
+
+
+class _ReservedSpool(tempfile.SpooledTemporaryFile):
+    """下载缓冲文件，数据在内存中期间占用预留的额度，转存到磁盘或关闭时归还"""
+
+    def __init__(self, reservation: memory.Reservation):
+        self._reservation = reservation
+        super().__init__(max_size=config.IMAGE_SPOOL_BYTES)
+        if reservation.spilled:
+            self.rollover()
+
+    def rollover(self) -> None:
+        super().rollover()
+        self._reservation.release()
+
+    def close(self) -> None:
+        super().close()
+        self._reservation.release()
+
+    def __exit__(self, *exc_info) -> None:
+        # 基类的 __exit__ 直接关闭内部文件，不经过 close()
+        self.close()
+
+
+def blob_messages(
+    image_file: BinaryIO, meta: Optional[dict] = None
+) -> Generator[ToolInvokeMessage, None, None]:
+    """
+    从文件逐块生成图片的 blob_chunk 消息，并在结束后关闭文件
+
+    SDK 会把 create_blob_message 的整张图片切成 blob_chunk 消息再发送；
+    这里直接从文件读取，生成同样的消息，图片不会整体读入内存
+
+    Args:
+        image_file: 图片文件
+        meta: 消息元数据，例如 {"mime_type": ...}
+    """
+    with image_file:
+        total_length = image_file.seek(0, io.SEEK_END)
+        image_file.seek(0)
+        blob_id = uuid.uuid4().hex
+        sequence = 0
+        while chunk := image_file.read(_BLOB_CHUNK_SIZE):
+            yield _blob_chunk_message(blob_id, sequence, total_length, chunk, False, meta)
+            sequence += 1
+        yield _blob_chunk_message(blob_id, sequence, total_length, b"", True, meta)
+
+
+def _blob_chunk_message(
+    blob_id: str, sequence: int, total_length: int, blob: bytes, end: bool, meta: Optional[dict]
+) -> ToolInvokeMessage:
+    """构造一条 blob_chunk 消息"""
+    return ToolInvokeMessage(
+        type=ToolInvokeMessage.MessageType.BLOB_CHUNK,
+        message=ToolInvokeMessage.BlobChunkMessage(
+            id=blob_id,
+            sequence=sequence,
+            total_length=total_length,
+            blob=blob,
+            end=end,
+        ),
+        meta=meta,
+    )
+
+
+def _download_spooled(
+    url: str, etag: Optional[str], timeout: Optional[float]
+) -> tuple[Optional[str], Optional[BinaryIO], Optional[str]]:
+    """
+    流式下载图片到临时文件
+
+    Returns:
+        (mime_type, 位于开头的临时文件, ETag)；服务端返回 304 时 mime_type 和文件为 None
+    """
+    max_bytes = config.IMAGE_MAX_BYTES
+    timeout = timeout or config.MAX_REQUEST_TIMEOUT
+    deadline = time.monotonic() + timeout
+    headers = {"If-None-Match": etag} if etag else None
+    with transport.session().get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if etag and response.status_code == 304:
+            return None, None, etag
+        response.raise_for_status()
+        content_length = int(response.headers.get("content-length") or 0)
+        if content_length > max_bytes:
+            raise ValueError(
+                f"Image is too large: {content_length} bytes (limit {max_bytes})"
+            )
+
+        # 内存中的下载缓冲按响应大小预留额度（超过 IMAGE_SPOOL_BYTES 的部分在磁盘上），
+        # 额度不足时直接缓冲到磁盘
+        reservation = memory.reserve(
+            "image.download",
+            min(content_length or config.IMAGE_SPOOL_BYTES, config.IMAGE_SPOOL_BYTES),
+            spillable=True,
+        )
+        spool = _ReservedSpool(reservation)
+        try:
+            size = 0
+            for chunk in response.iter_content(chunk_size=_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f"Image is too large: over {max_bytes} bytes")
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Image download timed out after {timeout}s")
+                spool.write(chunk)
+            spool.seek(0)
+        except BaseException:
+            spool.close()
+            raise
+
+        # Try to get MIME type from Content-Type header
+        mime_type = response.headers.get("content-type", "image/unknown")
+        if not mime_type.startswith("image/"):
+            # Fallback: try to infer from extension
+            ext = urlparse(url).path.lower().split(".")[-1]
+            mime_type = _EXTENSION_MIME_TYPES.get(ext, "image/unknown")
+    return mime_type, spool, response.headers.get("etag")
+
+
+def _b64decode_spooled(data: str, start: int, validate: bool = False) -> BinaryIO:
+    """
+    从 data[start:] 分块解码 base64 到临时文件，不复制整段编码数据
+
+    每块先去掉空白和换行再解码，不足 4 个字符的尾部留到下一块；
+    validate 为 True 时拒绝 base64 字母表以外的字符
+
+    Returns:
+        位于开头的临时文件
+    """
+    if (len(data) - start) * 3 // 4 > config.IMAGE_MAX_BYTES:
+        raise ValueError(f"Image is too large: over {config.IMAGE_MAX_BYTES} bytes")
+    spool = tempfile.SpooledTemporaryFile(max_size=config.IMAGE_SPOOL_BYTES)
+    try:
+        pending = ""
+        for i in range(start, len(data), _B64_CHUNK_SIZE):
+            pending += "".join(data[i : i + _B64_CHUNK_SIZE].split())
+            usable = len(pending) - len(pending) % 4
+            if usable:
+                spool.write(base64.b64decode(pending[:usable], validate=validate))
+                pending = pending[usable:]
+        if pending:
+            # 末尾缺少填充时按标准 base64 报错
+            spool.write(base64.b64decode(pending, validate=validate))
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    return spool
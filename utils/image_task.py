@@ -0,0 +1,151 @@
+"""
+图像生成异步任务轮询
+"""
+
+import logging
+import time
+from collections.abc import Generator
+from typing import Any, Optional
+
+import config
+from utils import transport
+
+logger = logging.getLogger(__name__)
+
+# 异步提交时附加的请求头
+ASYNC_HEADERS = {"X-Async": "enable"}
+
+_SUCCEEDED = {"SUCCEEDED", "SUCCESS", "SUCCEED", "COMPLETED", "DONE"}
+_FAILED = {"FAILED", "FAILURE", "FAIL", "ERROR", "CANCELED", "CANCELLED", "EXPIRED"}
+
+
+class ImageTask:
+    """
+    图像生成任务
+
+    提交接口返回任务 ID 而不是图像列表时，按指数间隔轮询任务状态，
+    直到任务完成、失败或超时；同步返回结果时直接使用该结果
+    """
+
+    def __init__(self, base_url: str, headers: dict, result: dict):
+        """
+        Args:
+            base_url: API 基础地址
+            headers: 请求头（含鉴权信息）
+            result: 提交接口返回的 JSON
+        """
+        self.base_url = base_url
+        self.headers = headers
+        self.result = result
+        self.task_id = self._find_task_id(result)
+
+    @property
+    def pending(self) -> bool:
+        """是否需要轮询"""
+        images = self.result.get("data")
+        return self.task_id is not None and not (isinstance(images, list) and images)
+
+    def poll(self) -> Generator[str, None, None]:
+        """
+        轮询任务直到结束，结束后 self.result 为包含 data 图像列表的最终结果
+
+        Returns:
+            进度信息生成器
+        """
+        if not self.pending:
+            return
+
+        self._start()
+        yield f"任务已提交: {self.task_id}"
+        while True:
+            time.sleep(self._next_delay())
+            response = transport.request(
+                "GET", self._url, headers=self.headers, timeout=config.MAX_REQUEST_TIMEOUT
+            )
+            progress, done = self._update(response)
+            if progress:
+                yield progress
+            if done:
+                return
+
+    def wait(self) -> dict:
+        """不输出进度，轮询直到结束并返回最终结果"""
+        for _ in self.poll():
+            pass
+        return self.result
+
+    def _start(self) -> None:
+        """初始化轮询状态"""
+        self._url = config.IMAGE_TASK_URL_TEMPLATE.format(
+            base_url=self.base_url, task_id=self.task_id
+        )
+        self._interval = config.IMAGE_POLL_INITIAL_INTERVAL
+        self._started = time.monotonic()
+        self._deadline = self._started + config.IMAGE_POLL_TIMEOUT
+        self._last_status = None
+
+    def _next_delay(self) -> float:
+        """下一次轮询前的等待时间，间隔逐次翻倍，不超过 IMAGE_POLL_MAX_INTERVAL"""
+        delay = min(self._interval, max(self._deadline - time.monotonic(), 0))
+        self._interval = min(self._interval * 2, config.IMAGE_POLL_MAX_INTERVAL)
+        return delay
+
+    def _update(self, response: Any) -> tuple[Optional[str], bool]:
+        """
+        处理一次查询结果
+
+        Returns:
+            (进度信息, 是否结束)；任务失败或超时时抛出异常
+        """
+        response.encoding = "utf8"
+        result = response.json()
+        if response.status_code != 200:
+            raise ValueError(f"查询任务失败: {result}")
+
+        status = self._find_status(result)
+        elapsed = time.monotonic() - self._started
+        if status in _SUCCEEDED or (status is None and isinstance(result.get("data"), list)):
+            self.result = self._normalize(result)
+            return f"任务完成，耗时 {elapsed:.0f}s", True
+        if status in _FAILED:
+            raise ValueError(f"任务失败: {result}")
+        if time.monotonic() >= self._deadline:
+            raise TimeoutError(
+                f"任务 {self.task_id} 在 {config.IMAGE_POLL_TIMEOUT}s 内未完成"
+            )
+        if status != self._last_status:
+            self._last_status = status
+            return f"任务状态: {status or '处理中'}，已等待 {elapsed:.0f}s", False
+        return None, False
+
+    @staticmethod
+    def _find_task_id(result: dict) -> Optional[str]:
+        """从顶层、output 或 data 中查找任务 ID"""
+        for container in (result, result.get("output"), result.get("data")):
+            if isinstance(container, dict) and container.get("task_id"):
+                return str(container["task_id"])
+        return None
+
+    @staticmethod
+    def _find_status(result: dict) -> Optional[str]:
+        """从顶层、output 或 data 中查找任务状态"""
+        for container in (result, result.get("output"), result.get("data")):
+            if not isinstance(container, dict):
+                continue
+            status = container.get("task_status") or container.get("status")
+            if isinstance(status, str):
+                return status.upper()
+        return None
+
+    @staticmethod
+    def _normalize(result: dict) -> dict:
+        """将任务结果整理为与同步接口一致的 {"data": [{"url": ...}]}"""
+        if isinstance(result.get("data"), list):
+            return result
+        for container in (result.get("output"), result.get("data")):
+            if not isinstance(container, dict):
+                continue
+            images: Any = container.get("data") or container.get("results")
+            if isinstance(images, list):
+                return {**result, "data": images}
+        return result
@@ -0,0 +1,151 @@
+"""
+进程级内存预算
+大块内存的操作（图生图请求体、图片下载缓冲、Embedding 响应、长提示词、模型目录）在开始前
+按估算占用预留额度；超出 MEMORY_BUDGET_BYTES 时等待其它操作释放，或改为缓冲到磁盘
+"""
+
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+import config
+from utils import telemetry
+
+
+class Reservation:
+    """
+    一次预留，退出 with 块或调用 release() 时归还
+
+    spilled 为 True 表示额度不足、调用方应把数据缓冲到磁盘，此时不占用额度
+    """
+
+    __slots__ = ("budget", "name", "nbytes", "spilled", "_released")
+
+    def __init__(self, budget: Optional["MemoryBudget"], name: str, nbytes: int, spilled: bool = False):
+        self.budget = budget
+        self.name = name
+        self.nbytes = nbytes
+        self.spilled = spilled
+        self._released = budget is None or spilled
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.budget._release(self)
+
+    def __enter__(self) -> "Reservation":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+class MemoryBudget:
+    """按字节计的内存预算"""
+
+    def __init__(self, limit: int):
+        """
+        Args:
+            limit: 预算上限（字节），0 表示不限制
+        """
+        self.limit = limit
+        self._condition = threading.Condition()
+        self._reserved = 0
+        self._peak = 0
+        self._waiting = 0
+        self._by_name: Counter = Counter()
+
+    def reserve(
+        self, name: str, nbytes: int, spillable: bool = False, timeout: Optional[float] = None
+    ) -> Reservation:
+        """
+        预留内存额度
+
+        单个操作的估算超过整个预算时按整个预算预留，保证它能在没有其它操作时执行
+
+        Args:
+            name: 操作名称，用于统计
+            nbytes: 估算占用（字节）
+            spillable: 额度不足时是否可以改为缓冲到磁盘而不等待
+            timeout: 最长等待时间（秒），默认 MEMORY_WAIT_TIMEOUT
+
+        Returns:
+            预留结果，超时未获得额度时抛出 TimeoutError
+        """
+        if self.limit <= 0:
+            return Reservation(None, name, nbytes)
+        nbytes = min(max(int(nbytes), 0), self.limit)
+        timeout = config.MEMORY_WAIT_TIMEOUT if timeout is None else timeout
+        with self._condition:
+            if self._try_reserve(name, nbytes):
+                return Reservation(self, name, nbytes)
+            if spillable:
+                telemetry.incr("memory.spills", op=name)
+                return Reservation(self, name, nbytes, spilled=True)
+
+            started = time.monotonic()
+            self._waiting += 1
+            telemetry.incr("memory.waits", op=name)
+            telemetry.record("memory.wait", op=name, nbytes=nbytes, **self._summary())
+            try:
+                granted = self._condition.wait_for(
+                    lambda: self._try_reserve(name, nbytes), timeout
+                )
+            finally:
+                self._waiting -= 1
+                telemetry.incr("memory.wait_ms", (time.monotonic() - started) * 1000, op=name)
+        if not granted:
+            raise TimeoutError(
+                f"Timed out after {timeout}s waiting for {nbytes} bytes of memory budget for {name}"
+            )
+        return Reservation(self, name, nbytes)
+
+    def snapshot(self) -> dict:
+        """
+        获取当前预留情况
+
+        Returns:
+            {limit, reserved, peak, waiting, reservations: {操作名称: 预留字节数}}
+        """
+        with self._condition:
+            return {**self._summary(), "reservations": {k: v for k, v in self._by_name.items() if v}}
+
+    def _summary(self) -> dict:
+        return {
+            "limit": self.limit,
+            "reserved": self._reserved,
+            "peak": self._peak,
+            "waiting": self._waiting,
+        }
+
+    def _try_reserve(self, name: str, nbytes: int) -> bool:
+        """额度足够时预留（需持有锁）"""
+        if self._reserved + nbytes > self.limit:
+            return False
+        self._reserved += nbytes
+        self._peak = max(self._peak, self._reserved)
+        self._by_name[name] += nbytes
+        telemetry.incr("memory.reserved_bytes", nbytes, op=name)
+        return True
+
+    def _release(self, reservation: Reservation) -> None:
+        with self._condition:
+            self._reserved -= reservation.nbytes
+            self._by_name[reservation.name] -= reservation.nbytes
+            self._condition.notify_all()
+
+
+_budget = MemoryBudget(config.MEMORY_BUDGET_BYTES)
+
+
+def reserve(
+    name: str, nbytes: int, spillable: bool = False, timeout: Optional[float] = None
+) -> Reservation:
+    """在进程级预算中预留内存，参数见 MemoryBudget.reserve"""
+    return _budget.reserve(name, nbytes, spillable, timeout)
+
+
+def snapshot() -> dict:
+    """获取进程级预算的当前预留情况"""
+    return _budget.snapshot()
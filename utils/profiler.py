@@ -0,0 +1,91 @@
+"""
+采样分析器
+按 PROFILE_INTERVAL_MS 间隔采样所有线程的调用栈，汇总为 folded stack 格式
+（每行 "帧;帧;帧 次数"），可直接用 flamegraph.pl / speedscope 查看
+"""
+
+import atexit
+import logging
+import sys
+import threading
+from collections import Counter
+from typing import Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+_FLUSH_SAMPLES = 1000
+
+_lock = threading.Lock()
+_samples: Counter = Counter()
+_started = False
+
+
+def _original(module: str, name: str):
+    """获取未被 gevent patch 的原始实现，保证采样线程是真实的系统线程"""
+    try:
+        from gevent import monkey
+
+        return monkey.get_original(module, name)
+    except ImportError:
+        return getattr(__import__(module), name)
+
+
+def start() -> bool:
+    """
+    按配置启动采样线程，未开启或已启动时不做任何事
+
+    Returns:
+        是否已在运行
+    """
+    global _started
+    if config.PROFILE_INTERVAL_MS <= 0:
+        return False
+    with _lock:
+        if _started:
+            return True
+        _started = True
+    _original("_thread", "start_new_thread")(_sample_loop, ())
+    atexit.register(dump)
+    logger.info(
+        "Sampling profiler started: interval=%sms output=%s",
+        config.PROFILE_INTERVAL_MS,
+        config.PROFILE_OUTPUT,
+    )
+    return True
+
+
+def dump(path: Optional[str] = None) -> None:
+    """将累计的采样结果写入文件（覆盖写）"""
+    with _lock:
+        lines = [f"{stack} {count}\n" for stack, count in _samples.most_common()]
+    try:
+        with open(path or config.PROFILE_OUTPUT, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+    except OSError as e:
+        logger.warning("Failed to write profile to %s: %s", path or config.PROFILE_OUTPUT, e)
+
+
+def _sample_loop() -> None:
+    sleep = _original("time", "sleep")
+    interval = config.PROFILE_INTERVAL_MS / 1000
+    own_id = _original("_thread", "get_ident")()
+    taken = 0
+    while True:
+        sleep(interval)
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stacks.append(";".join(reversed(stack)))
+        with _lock:
+            _samples.update(stacks)
+        taken += 1
+        if taken % _FLUSH_SAMPLES == 0:
+            dump()
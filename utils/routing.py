@@ -0,0 +1,343 @@
+"""
+客户端模型路由统计
+按模型、上游供应商和提示词长度区间记录首 token 耗时、总耗时、输出速度和错误率（EWMA），
+保存在插件存储中，重启后继续使用；调用方声明了等价模型时据此选择最快的模型
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from collections.abc import Generator, Iterable
+from typing import Any, Optional
+
+import config
+from utils import telemetry
+
+logger = logging.getLogger(__name__)
+
+_STORAGE_KEY = "llm_routing_stats"
+_STORAGE_VERSION = 1
+# 提示词长度区间的上界（估算 token 数），最后一个区间不设上界
+_BUCKETS = (1024, 4096, 16384, 65536)
+# 插件存储单个值的大小有限（manifest 中 storage.size 为 1 MiB），超过条数时丢弃样本最少的统计
+_MAX_ENTRIES = 4096
+# 不区分上游供应商的模型级统计
+_ANY_PROVIDER = ""
+
+_lock = threading.Lock()
+_stats: dict[tuple[str, str, int], "ModelStats"] = {}
+_loaded = False
+_dirty = False
+# 上次写入插件存储的时间，None 表示进程启动后还没有写入过
+_last_flush: Optional[float] = None
+# 是否有后台线程正在写入插件存储
+_flushing = False
+
+
+class ModelStats:
+    """一个（模型, 供应商, 提示词区间）的调用统计"""
+
+    __slots__ = ("count", "errors", "error_rate", "ttft_ms", "duration_ms", "tokens_per_second")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.error_rate = 0.0
+        self.ttft_ms: Optional[float] = None
+        self.duration_ms: Optional[float] = None
+        self.tokens_per_second: Optional[float] = None
+
+    def observe(
+        self,
+        ok: bool,
+        ttft_ms: Optional[float],
+        duration_ms: float,
+        completion_tokens: Optional[int],
+    ) -> None:
+        """以 EWMA 合并一次调用的结果，失败的调用只计入错误率"""
+        alpha = config.LLM_ROUTING_EWMA_ALPHA
+        self.count += 1
+        self.error_rate = _ewma(self.error_rate, 0.0 if ok else 1.0, alpha)
+        if not ok:
+            self.errors += 1
+            return
+        self.duration_ms = _ewma(self.duration_ms, duration_ms, alpha)
+        if ttft_ms is not None:
+            self.ttft_ms = _ewma(self.ttft_ms, ttft_ms, alpha)
+        if completion_tokens and duration_ms > (ttft_ms or 0):
+            self.tokens_per_second = _ewma(
+                self.tokens_per_second,
+                completion_tokens * 1000 / (duration_ms - (ttft_ms or 0)),
+                alpha,
+            )
+
+    def score(self) -> Optional[float]:
+        """预计耗时（毫秒），按错误率放大；还没有成功调用时返回 None"""
+        if self.duration_ms is None:
+            return None
+        return self.duration_ms / max(1 - self.error_rate, 0.1)
+
+    def to_list(self) -> list:
+        return [
+            self.count,
+            self.errors,
+            round(self.error_rate, 4),
+            _round(self.ttft_ms),
+            _round(self.duration_ms),
+            _round(self.tokens_per_second),
+        ]
+
+    @classmethod
+    def from_list(cls, values: list) -> "ModelStats":
+        stats = cls()
+        (
+            stats.count,
+            stats.errors,
+            stats.error_rate,
+            stats.ttft_ms,
+            stats.duration_ms,
+            stats.tokens_per_second,
+        ) = values
+        return stats
+
+
+class Observation:
+    """
+    一次 LLM 调用的计时
+
+    由 _invoke 创建，响应处理过程中补充上游供应商；
+    非流式调用由 finish() 结束，流式调用由 wrap() 在迭代结束时结束
+    """
+
+    __slots__ = ("model", "bucket", "provider", "started", "ttft_ms", "_finished")
+
+    def __init__(self, model: str, prompt_tokens: int):
+        self.model = model
+        self.bucket = bucket(prompt_tokens)
+        self.provider: Optional[str] = None
+        self.started = time.monotonic()
+        self.ttft_ms: Optional[float] = None
+        self._finished = False
+
+    def finish(self, ok: bool, completion_tokens: Optional[int] = None) -> None:
+        if self._finished:
+            return
+        self._finished = True
+        duration_ms = (time.monotonic() - self.started) * 1000
+        record(self.model, self.provider, self.bucket, ok, self.ttft_ms, duration_ms, completion_tokens)
+
+    def wrap(self, iterable: Iterable) -> Generator:
+        """
+        透传流式结果，记录首个分块的耗时，并从最后一个分块的 usage 中读取输出 token 数
+
+        迭代中抛出异常视为失败；调用方提前关闭生成器时耗时不完整，只计数不计入统计
+        """
+        completion_tokens = None
+        ok = False
+        try:
+            for chunk in iterable:
+                if self.ttft_ms is None:
+                    self.ttft_ms = (time.monotonic() - self.started) * 1000
+                usage = getattr(chunk.delta, "usage", None)
+                if usage is not None:
+                    completion_tokens = usage.completion_tokens
+                yield chunk
+            ok = True
+        except GeneratorExit:
+            self._finished = True
+            telemetry.incr("llm.route_aborted", model=self.model)
+            raise
+        finally:
+            self.finish(ok, completion_tokens)
+
+
+def bucket(prompt_tokens: int) -> int:
+    """提示词长度区间的序号"""
+    for index, upper in enumerate(_BUCKETS):
+        if prompt_tokens < upper:
+            return index
+    return len(_BUCKETS)
+
+
+def record(
+    model: str,
+    provider: Optional[str],
+    bucket_index: int,
+    ok: bool,
+    ttft_ms: Optional[float],
+    duration_ms: float,
+    completion_tokens: Optional[int],
+) -> None:
+    """
+    记录一次调用，同时更新模型级和（上游返回了供应商时）供应商级统计，并按间隔写入插件存储
+
+    Args:
+        model: 模型名称
+        provider: 上游返回的供应商，未返回时为 None
+        bucket_index: 提示词长度区间
+        ok: 调用是否成功
+        ttft_ms: 首个分块耗时（非流式调用为 None）
+        duration_ms: 总耗时
+        completion_tokens: 输出 token 数
+    """
+    global _dirty
+    _load()
+    providers = [_ANY_PROVIDER] + ([provider] if provider else [])
+    with _lock:
+        for name in providers:
+            key = (model, name, bucket_index)
+            stats = _stats.get(key)
+            if stats is None:
+                stats = _stats[key] = ModelStats()
+            stats.observe(ok, ttft_ms, duration_ms, completion_tokens)
+        _dirty = True
+    telemetry.incr("llm.route_calls", model=model, ok=ok)
+    _flush()
+
+
+def choose(model: str, candidates: list[str], prompt_tokens: int) -> str:
+    """
+    在等价模型中选择预计最快的模型
+
+    样本不足 LLM_ROUTING_MIN_SAMPLES 的模型优先获得调用；都有足够样本时选择预计耗时最短的，
+    并按 LLM_ROUTING_EXPLORE_RATE 的比例随机选择其它模型，以便发现变快的模型
+
+    Args:
+        model: 调用方选择的模型
+        candidates: 等价模型（包含调用方选择的模型）
+        prompt_tokens: 估算的提示词 token 数
+
+    Returns:
+        选中的模型
+    """
+    _load()
+    bucket_index = bucket(prompt_tokens)
+    with _lock:
+        scored = []
+        for candidate in candidates:
+            stats = _stats.get((candidate, _ANY_PROVIDER, bucket_index))
+            count = stats.count if stats else 0
+            scored.append((candidate, count, stats.score() if stats else None))
+
+    under_sampled = [s for s in scored if s[1] < config.LLM_ROUTING_MIN_SAMPLES]
+    if under_sampled:
+        chosen, reason = min(under_sampled, key=lambda s: s[1])[0], "explore"
+    elif random.random() < config.LLM_ROUTING_EXPLORE_RATE:
+        chosen, reason = random.choice(scored)[0], "explore"
+    else:
+        # 一直失败的模型没有耗时统计，排在最后
+        chosen = min(scored, key=lambda s: s[2] if s[2] is not None else float("inf"))[0]
+        reason = "fastest"
+    telemetry.incr("llm.route_selected", model=model, selected=chosen, reason=reason)
+    return chosen
+
+
+def stats() -> dict[str, dict]:
+    """
+    获取路由统计
+
+    Returns:
+        {"模型|供应商|区间": {count, errors, error_rate, ttft_ms, duration_ms, tokens_per_second}}，
+        供应商为空表示模型级统计
+    """
+    fields = ("count", "errors", "error_rate", "ttft_ms", "duration_ms", "tokens_per_second")
+    with _lock:
+        return {
+            "|".join(map(str, key)): dict(zip(fields, value.to_list()))
+            for key, value in _stats.items()
+        }
+
+
+def _ewma(current: Optional[float], value: float, alpha: float) -> float:
+    return value if current is None else alpha * value + (1 - alpha) * current
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
+
+
+def _storage() -> Any:
+    """当前调用会话的插件存储，不在 Dify 调用中（如基准测试）时返回 None"""
+    if config.LLM_ROUTING_FLUSH_SECONDS <= 0:
+        return None
+    try:
+        from dify_plugin.core.session_context import get_current_session
+    except ImportError:
+        return None
+    session = get_current_session()
+    return session.storage if session is not None else None
+
+
+def _load() -> None:
+    """首次在调用会话中使用时从插件存储读取之前保存的统计，内存中已有的统计优先"""
+    global _loaded
+    if _loaded:
+        return
+    storage = _storage()
+    if storage is None:
+        return
+    _loaded = True
+    try:
+        if not storage.exist(_STORAGE_KEY):
+            return
+        data = json.loads(storage.get(_STORAGE_KEY))
+    except Exception as e:
+        logger.warning("Failed to load routing stats from plugin storage: %s", e)
+        return
+    if data.get("version") != _STORAGE_VERSION:
+        return
+    with _lock:
+        for model, provider, bucket_index, values in data.get("stats", []):
+            _stats.setdefault((model, provider, bucket_index), ModelStats.from_list(values))
+    telemetry.record("llm.route_stats_loaded", entries=len(data.get("stats", [])))
+
+
+def _flush() -> None:
+    """
+    距上次写入超过 LLM_ROUTING_FLUSH_SECONDS 且有新统计时，在后台线程中写入插件存储
+
+    调用路径上只复制统计，序列化和写入不阻塞当前调用；写入失败时留到下次重试
+    """
+    global _dirty, _last_flush, _flushing
+    if not _dirty or _flushing or (
+        _last_flush is not None
+        and time.monotonic() - _last_flush < config.LLM_ROUTING_FLUSH_SECONDS
+    ):
+        return
+    storage = _storage()
+    if storage is None:
+        return
+    with _lock:
+        if _flushing:
+            return
+        if len(_stats) > _MAX_ENTRIES:
+            for key in sorted(_stats, key=lambda k: _stats[k].count)[: len(_stats) - _MAX_ENTRIES]:
+                del _stats[key]
+        entries = [[*key, value.to_list()] for key, value in _stats.items()]
+        _dirty = False
+        _flushing = True
+        _last_flush = time.monotonic()
+    threading.Thread(
+        target=_write, args=(storage, entries), name="aiping-routing-flush", daemon=True
+    ).start()
+
+
+def _write(storage: Any, entries: list) -> None:
+    """把统计写入插件存储"""
+    global _dirty, _flushing
+    try:
+        payload = json.dumps(
+            {"version": _STORAGE_VERSION, "stats": entries}, ensure_ascii=False, separators=(",", ":")
+        ).encode()
+        storage.set(_STORAGE_KEY, payload)
+    except Exception as e:
+        logger.warning("Failed to save routing stats to plugin storage: %s", e)
+        with _lock:
+            _dirty = True
+        return
+    finally:
+        with _lock:
+            _flushing = False
+    telemetry.incr("llm.route_stats_bytes", len(payload))
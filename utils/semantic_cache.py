@@ -0,0 +1,187 @@
+"""
+LLM 语义缓存
+以最后一条用户消息的向量在同一范围（模型、系统提示词、之前的对话等）内查找相似度超过阈值的历史回答。
+向量归一化后连续存放在 float32 数组中，查找时在范围内暴力计算内积（余弦相似度）
+"""
+
+import hashlib
+import json
+import math
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Optional
+
+from utils import telemetry
+
+
+class _Entry:
+    __slots__ = ("scope", "answer", "expires")
+
+    def __init__(self, scope: str, answer: str, expires: float):
+        self.scope = scope
+        self.answer = answer
+        self.expires = expires
+
+
+class SemanticCache:
+    """按条数限制容量、带过期时间的线程安全语义缓存"""
+
+    def __init__(self, max_entries: int, ttl: float, threshold: float):
+        """
+        Args:
+            max_entries: 最多缓存的回答数，超出时先清理过期条目，再淘汰最久未使用的条目
+            ttl: 回答的有效期（秒）
+            threshold: 命中所需的最低余弦相似度
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._dim = 0
+        # 第 i 个槽位的向量位于 _vectors[i * dim : (i + 1) * dim]
+        self._vectors = array("f")
+        self._slots: list[Optional[_Entry]] = []
+        self._free: list[int] = []
+        self._by_scope: dict[str, set[int]] = {}
+        # 已占用的槽位：按最近使用排序（最久未使用的在前），以及按写入排序；
+        # 有效期固定，写入顺序即过期顺序
+        self._lru: OrderedDict[int, None] = OrderedDict()
+        self._expiry: OrderedDict[int, None] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, scope: str, vector: list[float]) -> Optional[tuple[str, float]]:
+        """
+        查找范围内最相似的回答
+
+        Args:
+            scope: 缓存范围
+            vector: 查询向量
+
+        Returns:
+            (回答, 相似度)，没有相似度达到阈值的回答时返回 None
+        """
+        query = _normalize(vector)
+        now = time.monotonic()
+        best, best_slot = -1.0, None
+        with self._lock:
+            if len(query) == self._dim:
+                view = memoryview(self._vectors)
+                dim = self._dim
+                for slot in list(self._by_scope.get(scope, ())):
+                    if self._slots[slot].expires <= now:
+                        self._remove(slot)
+                        continue
+                    similarity = math.sumprod(query, view[slot * dim : (slot + 1) * dim])
+                    if similarity > best:
+                        best, best_slot = similarity, slot
+            if best_slot is None or best < self.threshold:
+                self.misses += 1
+                telemetry.incr("llm.semantic_cache", result="miss")
+                return None
+            entry = self._slots[best_slot]
+            self._lru.move_to_end(best_slot)
+            self.hits += 1
+        telemetry.incr("llm.semantic_cache", result="hit")
+        telemetry.record("llm.semantic_cache_hit", similarity=round(best, 4))
+        return entry.answer, best
+
+    def put(self, scope: str, vector: list[float], answer: str) -> None:
+        """
+        缓存回答
+
+        Args:
+            scope: 缓存范围
+            vector: 问题的向量
+            answer: 回答
+        """
+        if self.max_entries <= 0:
+            return
+        vector = _normalize(vector)
+        with self._lock:
+            if len(vector) != self._dim:
+                # Embedding 模型的维度变化后之前的向量不可比较，清空重建
+                self._reset(len(vector))
+            slot = self._allocate()
+            self._vectors[slot * self._dim : (slot + 1) * self._dim] = array("f", vector)
+            self._slots[slot] = _Entry(scope, answer, time.monotonic() + self.ttl)
+            self._by_scope.setdefault(scope, set()).add(slot)
+            self._lru[slot] = None
+            self._expiry[slot] = None
+
+    def stats(self) -> dict:
+        """
+        获取缓存统计
+
+        Returns:
+            {entries, hits, misses, hit_rate, evictions}
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._slots) - len(self._free),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def _reset(self, dim: int) -> None:
+        self._dim = dim
+        self._vectors = array("f")
+        self._slots = []
+        self._free = []
+        self._by_scope = {}
+        self._lru = OrderedDict()
+        self._expiry = OrderedDict()
+
+    def _allocate(self) -> int:
+        """
+        取得空闲槽位（需持有锁），容量已满时先清理过期条目，再淘汰最久未使用的条目
+
+        过期条目从写入顺序的开头依次清理，淘汰取最近使用顺序的开头，均摊 O(1)
+        """
+        if not self._free and len(self._slots) >= self.max_entries:
+            now = time.monotonic()
+            while self._expiry:
+                slot = next(iter(self._expiry))
+                if self._slots[slot].expires > now:
+                    break
+                self._remove(slot)
+            if not self._free:
+                self._remove(next(iter(self._lru)))
+                self.evictions += 1
+                telemetry.incr("llm.semantic_cache_evictions")
+        if self._free:
+            return self._free.pop()
+        self._slots.append(None)
+        self._vectors.extend(array("f", bytes(self._vectors.itemsize * self._dim)))
+        return len(self._slots) - 1
+
+    def _remove(self, slot: int) -> None:
+        """释放槽位（需持有锁）"""
+        entry = self._slots[slot]
+        scope_slots = self._by_scope.get(entry.scope)
+        if scope_slots is not None:
+            scope_slots.discard(slot)
+            if not scope_slots:
+                del self._by_scope[entry.scope]
+        self._slots[slot] = None
+        self._free.append(slot)
+        del self._lru[slot]
+        del self._expiry[slot]
+
+
+def scope_key(*parts: object) -> str:
+    """把范围的各组成部分（模型、系统提示词、之前的对话等）合并为一个键"""
+    return hashlib.sha256(
+        json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def _normalize(vector: list[float]) -> list[float]:
+    norm = math.sqrt(math.sumprod(vector, vector)) or 1.0
+    return [x / norm for x in vector]
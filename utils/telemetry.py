@@ -0,0 +1,94 @@
+"""
+插件内轻量指标统计
+按名称和标签累加计数，并输出结构化日志
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = defaultdict(float)
+_reporter: Optional[threading.Thread] = None
+
+
+def _key(name: str, labels: Dict[str, Any]) -> str:
+    """生成带标签的指标名，如 llm.reasoning_tokens{model=Qwen3-8B}"""
+    if not labels:
+        return name
+    label_str = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{label_str}}}"
+
+
+def incr(name: str, value: float = 1, **labels: Any) -> None:
+    """
+    累加指标
+
+    Args:
+        name: 指标名称
+        value: 累加值
+        labels: 指标标签
+    """
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] += value
+
+
+def record(event: str, **fields: Any) -> None:
+    """
+    记录一次事件，输出结构化日志
+
+    Args:
+        event: 事件名称
+        fields: 事件字段
+    """
+    logger.info("%s %s", event, " ".join(f"{k}={v}" for k, v in fields.items()))
+
+
+def snapshot() -> Dict[str, float]:
+    """获取当前所有指标的副本"""
+    with _lock:
+        return dict(_counters)
+
+
+def start_reporting() -> bool:
+    """
+    按配置启动后台线程，定期把指标、内存预算和地址选择统计写入日志
+
+    Returns:
+        是否启动了上报线程
+    """
+    global _reporter
+    if config.TELEMETRY_LOG_INTERVAL <= 0 or _reporter is not None:
+        return False
+    _reporter = threading.Thread(target=_report_loop, name="aiping-telemetry", daemon=True)
+    _reporter.start()
+    return True
+
+
+def report() -> None:
+    """把当前指标、内存预算和地址选择统计各输出一条日志"""
+    # memory 和 endpoints 都依赖本模块，延迟导入以避免循环依赖
+    from utils import endpoints, memory
+
+    logger.info("telemetry.counters %s", json.dumps(snapshot(), ensure_ascii=False, sort_keys=True))
+    logger.info("telemetry.memory %s", json.dumps(memory.snapshot(), ensure_ascii=False))
+    endpoint_stats = endpoints.stats()
+    if endpoint_stats:
+        logger.info("telemetry.endpoints %s", json.dumps(endpoint_stats, ensure_ascii=False))
+
+
+def _report_loop() -> None:
+    while True:
+        time.sleep(config.TELEMETRY_LOG_INTERVAL)
+        try:
+            report()
+        except Exception:
+            logger.exception("telemetry report failed")
@@ -0,0 +1,315 @@
+"""
+轻量调用链追踪
+未开启时 span() 返回空实现，开销只有一次判断；开启后按采样率记录 span，
+由后台线程批量导出到 JSON Lines 文件或 OTLP/HTTP 收集器
+"""
+
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections.abc import Callable, Generator, Iterable
+from typing import Any, Optional
+
+import requests
+
+import config
+
+logger = logging.getLogger(__name__)
+
+_SERVICE_NAME = "aiping-dify-plugin"
+_FLUSH_INTERVAL = 5
+_MAX_BUFFERED = 10000
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "aiping_span", default=None
+)
+_buffer: list[dict] = []
+_buffer_lock = threading.Lock()
+_flush_event = threading.Event()
+_exporter: Optional[threading.Thread] = None
+
+
+class _NoopSpan:
+    """未开启追踪时使用的空 span"""
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        pass
+
+    def wrap(self, iterable: Iterable) -> Iterable:
+        return iterable
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """
+    一段计时区间
+
+    作为上下文管理器使用时成为当前 span，退出时结束；
+    wrap() 把结束时间推迟到生成器迭代完成，用于流式返回
+    """
+
+    __slots__ = (
+        "name", "trace_id", "span_id", "parent_id", "sampled",
+        "attributes", "start_ns", "_token", "_deferred", "_ended",
+    )
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: dict):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        if parent is None:
+            self.trace_id = os.urandom(16).hex()
+            self.parent_id = None
+            self.sampled = random.random() < config.TRACE_SAMPLE_RATE
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+            self.sampled = parent.sampled
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self._token = None
+        self._deferred = False
+        self._ended = False
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Optional[BaseException], tb: Any) -> None:
+        _current.reset(self._token)
+        if not self._deferred or exc is not None:
+            self.end(exc)
+
+    def set(self, **attributes: Any) -> None:
+        """添加属性"""
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        """结束 span，只有第一次调用生效"""
+        if self._ended:
+            return
+        self._ended = True
+        if self.sampled:
+            _export(self, time.time_ns(), error)
+
+    def wrap(self, iterable: Iterable) -> Generator:
+        """
+        迭代期间把当前 span 设为自身，迭代结束（或被关闭）时结束 span，
+        并记录首个元素耗时和元素个数
+
+        Args:
+            iterable: 流式结果
+
+        Returns:
+            透传元素的生成器
+        """
+        self._deferred = True
+        return self._iterate(iter(iterable))
+
+    def _iterate(self, iterator: Any) -> Generator:
+        count = 0
+        error = None
+        try:
+            while True:
+                token = _current.set(self)
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    _current.reset(token)
+                if count == 0:
+                    self.attributes["first_item_ms"] = round(
+                        (time.time_ns() - self.start_ns) / 1e6, 3
+                    )
+                count += 1
+                yield item
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.attributes["items"] = count
+            self.end(error)
+
+
+def span(name: str, **attributes: Any) -> Any:
+    """
+    创建 span，父 span 为当前上下文中的 span
+
+    Args:
+        name: span 名称，如 llm.invoke
+        attributes: span 属性
+
+    Returns:
+        Span；未开启追踪时返回空实现
+    """
+    if not config.TRACE_ENABLED:
+        return _NOOP
+    _ensure_exporter()
+    return Span(name, _current.get(), attributes)
+
+
+def current() -> Any:
+    """当前 span，用于在调用链中途补充属性"""
+    return (_current.get() or _NOOP) if config.TRACE_ENABLED else _NOOP
+
+
+def traced(name: str) -> Callable:
+    """
+    为函数添加 span 的装饰器，生成器函数的 span 覆盖整个迭代过程
+
+    Args:
+        name: span 名称
+    """
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.isgeneratorfunction(func):
+
+            @functools.wraps(func)
+            def generator_wrapper(*args: Any, **kwargs: Any) -> Any:
+                if not config.TRACE_ENABLED:
+                    return func(*args, **kwargs)
+                return span(name).wrap(func(*args, **kwargs))
+
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not config.TRACE_ENABLED:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def flush() -> None:
+    """立即导出缓冲区中的 span"""
+    with _buffer_lock:
+        spans = _buffer[:]
+        _buffer.clear()
+    if not spans:
+        return
+    if config.TRACE_JSON_FILE:
+        try:
+            with open(config.TRACE_JSON_FILE, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(s, ensure_ascii=False) + "\n" for s in spans)
+        except OSError as e:
+            logger.warning("Failed to write spans to %s: %s", config.TRACE_JSON_FILE, e)
+    if config.TRACE_OTLP_ENDPOINT:
+        try:
+            requests.post(
+                config.TRACE_OTLP_ENDPOINT, json=_to_otlp(spans), timeout=5
+            ).raise_for_status()
+        except requests.RequestException as e:
+            logger.warning("Failed to export spans to %s: %s", config.TRACE_OTLP_ENDPOINT, e)
+
+
+def _export(span: Span, end_ns: int, error: Optional[BaseException]) -> None:
+    """把结束的 span 放入导出缓冲区"""
+    record = {
+        "name": span.name,
+        "trace_id": span.trace_id,
+        "span_id": span.span_id,
+        "parent_id": span.parent_id,
+        "start_ns": span.start_ns,
+        "end_ns": end_ns,
+        "duration_ms": round((end_ns - span.start_ns) / 1e6, 3),
+        "attributes": span.attributes,
+    }
+    if error is not None and not isinstance(error, GeneratorExit):
+        record["error"] = f"{type(error).__name__}: {error}"
+    with _buffer_lock:
+        if len(_buffer) < _MAX_BUFFERED:
+            _buffer.append(record)
+        full = len(_buffer) >= _MAX_BUFFERED // 10
+    if full:
+        _flush_event.set()
+
+
+def _ensure_exporter() -> None:
+    """首次创建 span 时启动后台导出线程"""
+    global _exporter
+    if _exporter is not None:
+        return
+    with _buffer_lock:
+        if _exporter is not None:
+            return
+        _exporter = threading.Thread(target=_export_loop, name="aiping-tracing", daemon=True)
+        _exporter.start()
+    atexit.register(flush)
+
+
+def _export_loop() -> None:
+    while True:
+        _flush_event.wait(_FLUSH_INTERVAL)
+        _flush_event.clear()
+        flush()
+
+
+def _to_otlp(spans: list[dict]) -> dict:
+    """转换为 OTLP/HTTP JSON 格式"""
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": _SERVICE_NAME}}
+                    ]
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": __name__},
+                        "spans": [_to_otlp_span(s) for s in spans],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+def _to_otlp_span(record: dict) -> dict:
+    otlp = {
+        "traceId": record["trace_id"],
+        "spanId": record["span_id"],
+        "name": record["name"],
+        "kind": 1,
+        "startTimeUnixNano": str(record["start_ns"]),
+        "endTimeUnixNano": str(record["end_ns"]),
+        "attributes": [
+            {"key": k, "value": _to_otlp_value(v)} for k, v in record["attributes"].items()
+        ],
+        "status": {"code": 2, "message": record["error"]} if "error" in record else {"code": 1},
+    }
+    if record["parent_id"]:
+        otlp["parentSpanId"] = record["parent_id"]
+    return otlp
+
+
+def _to_otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
@@ -0,0 +1,433 @@
+"""
+HTTP 传输层
+请求共用一个带连接池的 requests 会话。另提供 DNS 缓存、连接预热、请求体压缩，
+以及配置多个地址时的选择和故障转移
+"""
+
+import concurrent.futures
+import http.cookiejar
+import logging
+import socket
+import sys
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from types import ModuleType
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util import connection as urllib3_connection
+
+import config
+from utils import compression, endpoints, telemetry
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+
+# ReleasingBody 逐块迭代时每块的大小
+_BODY_CHUNK_SIZE = 64 * 1024
+
+# DNS 缓存最多保留的主机数
+_DNS_CACHE_MAX_ENTRIES = 256
+
+_dns_lock = threading.Lock()
+# (主机, 端口) -> (过期时间, 地址列表)，按最近使用排序
+_dns_cache: "OrderedDict[tuple[str, int], tuple[float, list[str]]]" = OrderedDict()
+
+# 最近一次业务请求的时间和访问过的地址，用于空闲后重新预热
+_last_request = time.monotonic()
+_origins: set[str] = set()
+
+
+class ReleasingBody:
+    """
+    发送完毕即释放的请求体
+
+    requests 按文件对象逐块读取并发送，读到末尾时丢弃缓冲区并调用 on_sent（如归还内存预留），
+    之后在等待响应期间不再占用请求体内存
+    """
+
+    def __init__(self, data: Any, on_sent: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            data: 请求体（bytes / bytearray）
+            on_sent: 请求体读取完毕或 release() 时调用一次
+        """
+        self._data: Optional[memoryview] = memoryview(data)
+        self._length = len(self._data)
+        self._position = 0
+        self._on_sent = on_sent
+
+    @property
+    def released(self) -> bool:
+        return self._data is None
+
+    def getbuffer(self) -> memoryview:
+        """未读取时的完整请求体，用于压缩"""
+        if self._data is None:
+            raise ValueError("Request body has already been sent")
+        return self._data
+
+    def read(self, size: int = -1) -> bytes:
+        if self._data is None:
+            return b""
+        end = self._length if size is None or size < 0 else min(self._position + size, self._length)
+        chunk = bytes(self._data[self._position : end])
+        self._position = end
+        if end >= self._length:
+            self.release()
+        return chunk
+
+    def release(self) -> None:
+        """丢弃缓冲区并调用 on_sent"""
+        if self._data is not None:
+            self._data.release()
+            self._data = None
+            if self._on_sent is not None:
+                self._on_sent()
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[bytes]:
+        while chunk := self.read(_BODY_CHUNK_SIZE):
+            yield chunk
+
+
+class _CachedDNSMixin:
+    """新建连接时使用缓存的 DNS 解析结果，只用于共享会话的连接池，不影响进程内其它连接"""
+
+    def _new_conn(self) -> socket.socket:
+        if config.HTTP_DNS_CACHE_TTL <= 0:
+            return super()._new_conn()
+        try:
+            addresses = _resolve(self._dns_host, self.port)
+        except OSError:
+            # 交给 urllib3 重新解析，保持原有的异常类型
+            return super()._new_conn()
+        error: Optional[OSError] = None
+        for address in addresses:
+            try:
+                sock = urllib3_connection.create_connection(
+                    (address, self.port),
+                    self.timeout,
+                    source_address=self.source_address,
+                    socket_options=self.socket_options,
+                )
+            except OSError as e:
+                error = e
+                continue
+            sys.audit("http.client.connect", self, self.host, self.port)
+            return sock
+        # 缓存的地址都无法连接时丢弃，下次重新解析
+        _forget(self._dns_host, self.port)
+        if isinstance(error, socket.timeout):
+            raise ConnectTimeoutError(
+                self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})"
+            ) from error
+        raise NewConnectionError(self, f"Failed to establish a new connection: {error}") from error
+
+
+class _CachedDNSHTTPConnection(_CachedDNSMixin, HTTPConnection):
+    pass
+
+
+class _CachedDNSHTTPSConnection(_CachedDNSMixin, HTTPSConnection):
+    pass
+
+
+class _CachedDNSHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CachedDNSHTTPConnection
+
+
+class _CachedDNSHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CachedDNSHTTPSConnection
+
+
+class _PooledAdapter(HTTPAdapter):
+    """按需压缩请求体，并记录每个请求是否新建了连接及其首字节耗时"""
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CachedDNSHTTPConnectionPool,
+            "https": _CachedDNSHTTPSConnectionPool,
+        }
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        body = request.body
+        releasing = isinstance(body, ReleasingBody)
+        compressed = compression.compress_body(
+            request.url, request.headers, body.getbuffer() if releasing else body
+        )
+        if compressed is None:
+            response = self._send(request, **kwargs)
+            compression.observe_response(request.url, response.status_code, response.headers, None)
+            return response
+
+        encoding, payload = compressed
+        plain = request.copy()
+        if releasing:
+            # 压缩后的请求体发送完毕时一并释放原始请求体；此后遇到 415 无法重发，直接返回
+            payload = ReleasingBody(payload, body.release)
+        request.body = payload
+        request.headers["Content-Encoding"] = encoding
+        request.headers["Content-Length"] = str(len(payload))
+        response = self._send(request, **kwargs)
+        if compression.observe_response(
+            request.url, response.status_code, response.headers, encoding
+        ) and not (releasing and body.released):
+            response.close()
+            response = self._send(plain, **kwargs)
+        return response
+
+    def _send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        global _last_request
+        _last_request = time.monotonic()
+        pool = self.get_connection_with_tls_context(
+            request, kwargs.get("verify", True), kwargs.get("proxies"), kwargs.get("cert")
+        )
+        created = pool.num_connections
+        started = time.perf_counter()
+        # 适配器在收到响应头后返回，响应体按需读取，因此这段耗时即首字节耗时
+        response = super().send(request, **kwargs)
+        ttfb_ms = (time.perf_counter() - started) * 1000
+        connection = "new" if pool.num_connections > created else "reused"
+        host = endpoints.host_label(request.url)
+        telemetry.incr("http.requests", host=host, connection=connection)
+        telemetry.incr("http.ttfb_ms", ttfb_ms, host=host, connection=connection)
+        return response
+
+
+class _RoutingSession(requests.Session):
+    """
+    配置了多个地址时把请求发往最快的可用地址，幂等请求遇到连接错误时改用其它地址；
+    返回网关错误的地址在下次探测成功前不再优先使用
+    """
+
+    def request(self, method: str, url: str, *args: Any, **kwargs: Any) -> requests.Response:
+        routes = endpoints.route(method, url)
+        if routes is None:
+            return super().request(method, url, *args, **kwargs)
+        error = None
+        for attempt, (endpoint, routed_url) in enumerate(routes):
+            endpoints.record_attempt(endpoint, failover=attempt > 0)
+            try:
+                response = super().request(method, routed_url, *args, **kwargs)
+            except requests.ConnectionError as e:
+                if not _connect_failed(e):
+                    raise
+                endpoints.record_connect_error(endpoint)
+                error = e
+                continue
+            endpoints.record_response(endpoint, response.status_code)
+            return response
+        raise error
+
+
+def _connect_failed(error: requests.ConnectionError) -> bool:
+    """是否在建立连接时失败（请求没有发出）"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0] if error.args else None, "reason", None)
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+def session() -> requests.Session:
+    """
+    获取共享的 requests 会话，连接在请求之间保持复用
+
+    会话由所有调用方和用户提供的图片地址共用，不保存任何 Cookie，避免一个调用收到的 Cookie
+    被发往其它调用的请求
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                new_session = _RoutingSession()
+                new_session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+                adapter = _PooledAdapter(
+                    pool_connections=16, pool_maxsize=config.HTTP_MAX_CONNECTIONS
+                )
+                new_session.mount("http://", adapter)
+                new_session.mount("https://", adapter)
+                _session = new_session
+    return _session
+
+
+class _SharedSessionRequests:
+    """替换 SDK 模块中的 requests：post 使用共享会话，其它属性保持不变"""
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(requests, name)
+
+    @staticmethod
+    def post(url: str, **kwargs: Any) -> requests.Response:
+        return session().post(url, **kwargs)
+
+
+def use_shared_session(module: ModuleType) -> None:
+    """
+    让 SDK 模块发出的请求使用共享会话
+
+    SDK 的 OpenAI 兼容模型类直接调用 requests.post，每次请求都会重新建立连接
+
+    Args:
+        module: 通过 import requests 或 from requests import post 发送请求的模块
+    """
+    if getattr(module, "requests", None) is requests:
+        module.requests = _SharedSessionRequests()
+    if getattr(module, "post", None) is requests.post:
+        module.post = _SharedSessionRequests.post
+
+
+def request(method: str, url: str, **kwargs: Any) -> Any:
+    """
+    通过共享会话发送请求
+
+    Args:
+        method: 请求方法
+        url: 请求地址
+        kwargs: headers / json / data / params / timeout
+
+    Returns:
+        响应对象
+    """
+    return session().request(method, url, **kwargs)
+
+
+def warm_up(base_url: str, connections: Optional[int] = None) -> int:
+    """
+    并发发送 HEAD 请求，预先建立 DNS 解析、TCP 和 TLS 连接并留在连接池中
+
+    Args:
+        base_url: API 基础地址
+        connections: 建立的连接数，默认 HTTP_WARMUP_CONNECTIONS
+
+    Returns:
+        成功建立的连接数
+    """
+    connections = connections or config.HTTP_WARMUP_CONNECTIONS
+    started = time.perf_counter()
+    # 直接使用业务请求所用的连接池，预热请求不计入业务请求统计
+    pool = _connection_pool(base_url)
+    path = urlsplit(base_url).path or "/"
+
+    def open_connection(_: int) -> None:
+        pool.urlopen("HEAD", path, retries=False, timeout=10, preload_content=True)
+
+    with concurrent.futures.ThreadPoolExecutor(connections) as executor:
+        futures = [executor.submit(open_connection, i) for i in range(connections)]
+        succeeded = sum(1 for f in futures if f.exception() is None)
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    host = urlsplit(base_url).hostname
+    telemetry.incr("http.warmup_connections", succeeded, host=host)
+    telemetry.record("http.warmup", host=host, connections=succeeded, elapsed_ms=round(elapsed_ms, 1))
+    return succeeded
+
+
+def probe(base_url: str, timeout: float) -> float:
+    """
+    在共享连接池上发送一次 HEAD 请求，用于地址健康探测
+
+    Args:
+        base_url: API 基础地址
+        timeout: 超时时间（秒）
+
+    Returns:
+        请求耗时（毫秒）；任意响应都说明地址可达，只有网关错误和服务不可用时抛出 requests.HTTPError
+    """
+    pool = _connection_pool(base_url)
+    started = time.perf_counter()
+    response = pool.urlopen(
+        "HEAD", urlsplit(base_url).path or "/", retries=False, timeout=timeout, preload_content=True
+    )
+    if response.status in endpoints.GATEWAY_ERRORS:
+        raise requests.HTTPError(f"{response.status} Server Error for url: {base_url}")
+    return (time.perf_counter() - started) * 1000
+
+
+def _connection_pool(url: str) -> Any:
+    """获取业务请求发往该地址时使用的 urllib3 连接池"""
+    shared = session()
+    settings = shared.merge_environment_settings(url, {}, None, None, None)
+    return shared.get_adapter(url).get_connection_with_tls_context(
+        shared.prepare_request(requests.Request("HEAD", url)),
+        settings["verify"],
+        settings["proxies"],
+        settings["cert"],
+    )
+
+
+def start_warm_up(base_url: str) -> None:
+    """
+    在后台预热连接，不阻塞启动；之后空闲超过 HTTP_WARMUP_IDLE_SECONDS 时重新预热
+
+    Args:
+        base_url: API 基础地址
+    """
+    if config.HTTP_WARMUP_CONNECTIONS <= 0:
+        return
+    with _lock:
+        started = bool(_origins)
+        _origins.add(base_url)
+    if not started:
+        threading.Thread(target=_warm_up_loop, name="aiping-warmup", daemon=True).start()
+
+
+def _warm_up_loop() -> None:
+    while True:
+        for base_url in list(_origins):
+            try:
+                warm_up(base_url)
+            except Exception as e:
+                logger.warning("Connection warm-up for %s failed: %s", base_url, e)
+        # 空闲连接可能已被服务端关闭，等到空闲足够久后再重新预热
+        while True:
+            time.sleep(config.HTTP_WARMUP_IDLE_SECONDS)
+            if time.monotonic() - _last_request >= config.HTTP_WARMUP_IDLE_SECONDS:
+                break
+
+
+def _resolve(host: str, port: int) -> list[str]:
+    """解析主机地址，结果缓存 HTTP_DNS_CACHE_TTL 秒，最多缓存 _DNS_CACHE_MAX_ENTRIES 个主机"""
+    key = (host, port)
+    now = time.monotonic()
+    with _dns_lock:
+        cached = _dns_cache.get(key)
+        if cached is not None:
+            if cached[0] > now:
+                _dns_cache.move_to_end(key)
+                telemetry.incr("http.dns_cache_hit")
+                return cached[1]
+            del _dns_cache[key]
+    infos = socket.getaddrinfo(
+        host, port, urllib3_connection.allowed_gai_family(), socket.SOCK_STREAM
+    )
+    addresses = list(dict.fromkeys(info[4][0] for info in infos))
+    telemetry.incr("http.dns_cache_miss")
+    with _dns_lock:
+        _dns_cache[key] = (now + config.HTTP_DNS_CACHE_TTL, addresses)
+        _dns_cache.move_to_end(key)
+        if len(_dns_cache) > _DNS_CACHE_MAX_ENTRIES:
+            # 先清理过期条目，仍超出时淘汰最久未使用的条目
+            for expired in [k for k, (expires, _) in _dns_cache.items() if expires <= now]:
+                del _dns_cache[expired]
+            while len(_dns_cache) > _DNS_CACHE_MAX_ENTRIES:
+                _dns_cache.popitem(last=False)
+    return addresses
+
+
+def _forget(host: str, port: int) -> None:
+    with _dns_lock:
+        _dns_cache.pop((host, port), None)
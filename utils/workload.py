@@ -0,0 +1,233 @@
+"""
+负载录制
+配置 WORKLOAD_CAPTURE_FILE 后，在 LLM、Embedding、Rerank 模型和图像工具的 _invoke 边界记录
+脱敏后的请求形态和耗时，每次调用写入一行 JSON。只记录模型、消息数量和长度、流式、路由参数、
+token 数等，不记录提示词、回答、图片、Key 和地址；benchmarks/replay.py 按录制结果对模拟服务重放
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import random
+import threading
+import time
+from collections.abc import Callable, Generator, Iterable
+from typing import Any, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# 无法原样记录的参数值（如 json_schema）只记录已设置
+REDACTED = "[redacted]"
+
+# 模型参数中可以原样记录的字段
+_PARAMS = frozenset(
+    {
+        "temperature",
+        "top_p",
+        "top_k",
+        "max_tokens",
+        "presence_penalty",
+        "frequency_penalty",
+        "response_format",
+        "enable_thinking",
+        "thinking_mode",
+        "thinking_budget",
+        "max_reasoning_tokens",
+        "max_duration",
+        "sort",
+        "equivalent_models",
+    }
+)
+# 图像工具 extra_body 中可以原样记录的字段
+_IMAGE_PARAMS = frozenset({"size", "n", "seed", "steps", "guidance_scale"})
+
+_lock = threading.Lock()
+_file: Any = None
+_current: contextvars.ContextVar[Optional["Capture"]] = contextvars.ContextVar(
+    "workload_capture", default=None
+)
+
+
+class Capture:
+    """一次调用的录制，finish() 或 wrap() 的迭代结束时写入文件"""
+
+    __slots__ = (
+        "kind", "model", "shape", "metrics", "ts", "started", "ttft_ms", "_finished", "_token",
+    )
+
+    def __init__(self, kind: str, model: str, shape: dict):
+        self.kind = kind
+        self.model = model
+        self.shape = shape
+        self.metrics: dict = {}
+        self.ts = time.time()
+        self.started = time.monotonic()
+        self.ttft_ms: Optional[float] = None
+        self._finished = False
+
+    def __enter__(self) -> "Capture":
+        """在 with 块内设为当前录制，以便调用过程中通过 note() 补充指标"""
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        _current.reset(self._token)
+
+    def note(self, **metrics: Any) -> None:
+        """补充调用过程中得到的指标，如 token 数、实际使用的模型"""
+        self.metrics.update(metrics)
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        if self._finished:
+            return
+        self._finished = True
+        record = {
+            "ts": round(self.ts, 3),
+            "kind": self.kind,
+            "model": self.model,
+            "shape": self.shape,
+            "ok": error is None,
+            "duration_ms": round((time.monotonic() - self.started) * 1000, 1),
+        }
+        if self.ttft_ms is not None:
+            record["ttft_ms"] = round(self.ttft_ms, 1)
+        if error is not None:
+            record["error"] = type(error).__name__
+        record.update(self.metrics)
+        _write(record)
+
+    def wrap(self, iterable: Iterable) -> Generator:
+        """
+        透传流式结果，迭代期间把当前录制设为自身；记录首个元素的耗时，
+        并从 LLM 分块的 usage 中读取 token 数、统计工具返回的图片数
+
+        调用方提前关闭生成器视为成功
+        """
+        iterator = iter(iterable)
+        error = None
+        try:
+            while True:
+                token = _current.set(self)
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    _current.reset(token)
+                if self.ttft_ms is None:
+                    self.ttft_ms = (time.monotonic() - self.started) * 1000
+                self._observe(item)
+                yield item
+        except GeneratorExit:
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.finish(error)
+
+    def _observe(self, item: Any) -> None:
+        usage = getattr(getattr(item, "delta", None), "usage", None)
+        if usage is not None:
+            self.note(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+        message_type = getattr(getattr(item, "type", None), "value", None)
+        # 工具直接输出的 blob_chunk 消息以结束块计为一张图片
+        if message_type == "blob" or (
+            message_type == "blob_chunk" and getattr(item.message, "end", False)
+        ):
+            self.metrics["images"] = self.metrics.get("images", 0) + 1
+
+
+def start(kind: str, model: str, **shape: Any) -> Optional[Capture]:
+    """
+    开始录制一次调用
+
+    Args:
+        kind: 调用类型（llm、embedding、rerank、text2image 等）
+        model: 调用方选择的模型
+        **shape: 请求形态
+
+    Returns:
+        录制对象，未开启录制或未被采样时返回 None
+    """
+    if not config.WORKLOAD_CAPTURE_FILE or random.random() >= config.WORKLOAD_CAPTURE_SAMPLE_RATE:
+        return None
+    return Capture(kind, model, shape)
+
+
+def note(**metrics: Any) -> None:
+    """为当前录制补充指标，不在录制中时忽略"""
+    capture = _current.get()
+    if capture is not None:
+        capture.note(**metrics)
+
+
+def captured(kind: str, shape: Callable[[dict], dict]) -> Callable:
+    """
+    录制工具调用的装饰器，用于返回生成器的 Tool._invoke
+
+    Args:
+        kind: 调用类型
+        shape: 从工具参数计算请求形态的函数
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(self: Any, tool_parameters: dict) -> Generator:
+            capture = start(kind, tool_parameters.get("model", ""), **shape(tool_parameters))
+            if capture is None:
+                yield from func(self, tool_parameters)
+            else:
+                yield from capture.wrap(func(self, tool_parameters))
+
+        return wrapper
+
+    return decorator
+
+
+def model_params(model_parameters: dict) -> dict:
+    """模型参数中可以记录的部分，其它字段的值记为 REDACTED"""
+    return {k: (v if k in _PARAMS else REDACTED) for k, v in model_parameters.items()}
+
+
+def text_sizes(texts: list[str]) -> dict:
+    """一组文本的数量和长度"""
+    lengths = [len(text) for text in texts]
+    return {"count": len(lengths), "chars": sum(lengths), "max_chars": max(lengths, default=0)}
+
+
+def image_tool_shape(tool_parameters: dict) -> dict:
+    """图像工具的请求形态：提示词长度、生成数量和 extra_body 中的尺寸等参数"""
+    shape: dict = {}
+    for key in ("prompt", "prompts", "negative_prompt"):
+        if tool_parameters.get(key):
+            shape[f"{key}_chars"] = len(str(tool_parameters[key]))
+    if tool_parameters.get("count"):
+        shape["count"] = tool_parameters["count"]
+    if tool_parameters.get("image"):
+        # 只记录来源，图片大小由工具在读取后通过 note() 补充，避免在这里触发下载
+        shape["image_source"] = "url" if getattr(tool_parameters["image"], "url", None) else "blob"
+    try:
+        extra_body = json.loads(tool_parameters.get("extra_body") or "{}")
+    except ValueError:
+        extra_body = {}
+    if isinstance(extra_body, dict):
+        shape["extra_body"] = {
+            k: (v if k in _IMAGE_PARAMS else REDACTED) for k, v in extra_body.items()
+        }
+    return shape
+
+
+def _write(record: dict) -> None:
+    global _file
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    try:
+        with _lock:
+            if _file is None:
+                _file = open(config.WORKLOAD_CAPTURE_FILE, "a", encoding="utf-8", buffering=1)
+            _file.write(line)
+    except OSError as e:
+        logger.warning("Failed to write workload capture to %s: %s", config.WORKLOAD_CAPTURE_FILE, e)